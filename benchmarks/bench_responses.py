@@ -0,0 +1,45 @@
+"""Measures building and serializing the list and comparison responses with
+Flask's default JSON provider and with orjson:
+
+    python benchmarks/bench_responses.py [ratings]
+"""
+import sys
+import time
+
+from flask import jsonify
+
+from flaskr import create_app
+from flaskr.models.rating import Rating
+from flaskr.ratings.rating_calculator import ComparisonToSend
+from flaskr.ratings.rating_handler import RatingJsonResponder
+
+DEFAULT_RATINGS = 1000
+ITERATIONS = 2000
+
+
+def per_second(app, build) -> float:
+    with app.test_request_context():
+        started_at = time.perf_counter()
+        for _ in range(ITERATIONS):
+            jsonify(build()).get_data()
+        return ITERATIONS / (time.perf_counter() - started_at)
+
+
+def main(size: int) -> None:
+    ratings = [Rating(id=i, type="artist", name=f"artist {i}", value=i * 100 / size, user_id=1) for i in range(size)]
+    comparison = ComparisonToSend(id=7, index=size // 2, name="artist 7", highest_possible_idx=size - 1)
+
+    def build_list():
+        return RatingJsonResponder.get_ratings_list_json("artist", ratings)
+
+    def build_comparison():
+        return RatingJsonResponder.get_comparison_json(ratings[0], comparison, 123456789)
+
+    print(f"{'provider':>10} {'list/sec':>10} {'comparison/sec':>15}")
+    for provider in ["default", "orjson"]:
+        app = create_app({"TESTING": True, "JSON_PROVIDER": provider, "CUSTOM_ID_SECRET": "secret"})
+        print(f"{provider:>10} {per_second(app, build_list):>10.0f} {per_second(app, build_comparison):>15.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RATINGS)
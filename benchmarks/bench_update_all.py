@@ -0,0 +1,87 @@
+"""Compares per-row UPDATEs with Rating.update_all_with_new_ratings.
+
+Runs against the database in instance/config.py using a throwaway user that is
+deleted afterwards:
+
+    python benchmarks/bench_update_all.py [sizes...]
+"""
+import sys
+import time
+import uuid
+
+from psycopg2.extras import execute_values
+
+from flaskr import create_app
+from flaskr.db import get_db
+from flaskr.models.rating import Rating
+from flaskr.models.user import User
+
+DEFAULT_SIZES = [10, 1000, 10000]
+REPEATS = 3
+
+
+def create_ratings(user: User, size: int) -> list[Rating]:
+    db = get_db()
+    with db.cursor() as cursor:
+        execute_values(
+            cursor,
+            "INSERT INTO rating (user_id, name, type, value) VALUES %s",
+            [(user.id, f"item {i}", "bench", float(i)) for i in range(size)],
+            page_size=size,
+        )
+    db.commit()
+    return user.get_ratings(rating_type="bench")
+
+
+def update_row_by_row(user: User, ratings: list[Rating]) -> None:
+    # What update_all_with_new_ratings used to do
+    db = get_db()
+    with db.cursor() as cursor:
+        for rating in ratings:
+            cursor.execute(
+                "UPDATE rating"
+                " SET value = %s"
+                " WHERE name = %s AND user_id = %s AND type = %s",
+                (rating.value, rating.name, user.id, rating.type),
+            )
+    db.commit()
+
+
+def best_of(fn, *args) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        started_at = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - started_at)
+    return min(timings)
+
+
+def main(sizes: list[int]) -> None:
+    app = create_app()
+    with app.app_context():
+        user = User.create_user(f"__bench_{uuid.uuid4().hex}")
+        try:
+            print(f"{'ratings':>8} {'row by row (ms)':>16} {'bulk (ms)':>10} {'speedup':>8}")
+            for size in sizes:
+                ratings = create_ratings(user, size)
+                for idx, rating in enumerate(reversed(ratings)):
+                    rating.update_value_property(round(idx / max(size - 1, 1) * 100, 2))
+
+                row_by_row = best_of(update_row_by_row, user, ratings)
+                bulk = best_of(Rating.update_all_with_new_ratings, user, ratings)
+                print(f"{size:>8} {row_by_row * 1000:>16.1f} {bulk * 1000:>10.1f} {row_by_row / bulk:>7.1f}x")
+
+                db = get_db()
+                with db.cursor() as cursor:
+                    cursor.execute("DELETE FROM rating WHERE user_id = %s", (user.id,))
+                db.commit()
+        finally:
+            db = get_db()
+            with db.cursor() as cursor:
+                cursor.execute("DELETE FROM rating WHERE user_id = %s", (user.id,))
+                cursor.execute("DELETE FROM hearrd_user WHERE id = %s", (user.id,))
+            db.commit()
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,69 @@
+"""Measures request signature verifications per second on a single core.
+
+Compares building the VerifyKey and re-encoding the body on every request, as
+DiscordAuth used to, with DiscordAuth.verify_discord_request:
+
+    python benchmarks/bench_verify.py [requests]
+"""
+import json
+import sys
+import time
+
+from nacl.signing import SigningKey, VerifyKey
+
+from flaskr import create_app
+from flaskr.discord.auth import DiscordAuth
+
+DEFAULT_REQUESTS = 20000
+
+
+def create_requests(signing_key: SigningKey, count: int) -> list[dict]:
+    timestamp = str(int(time.time()))
+    requests = []
+    for i in range(count):
+        body = json.dumps({"type": 3, "id": str(i), "data": {"custom_id": "x" * 80}}).encode()
+        requests.append(
+            {
+                "data": body,
+                "headers": {
+                    "X-Signature-Ed25519": signing_key.sign(timestamp.encode() + body).signature.hex(),
+                    "X-Signature-Timestamp": timestamp,
+                },
+            }
+        )
+    return requests
+
+
+def verify_uncached(app, request) -> None:
+    # What verify_discord_request used to do
+    verify_key = VerifyKey(bytes.fromhex(app.config["PUBLIC_KEY"]))
+    body = request.data.decode("utf-8")
+    timestamp = request.headers["X-Signature-Timestamp"]
+    verify_key.verify(f"{timestamp}{body}".encode(), bytes.fromhex(request.headers["X-Signature-Ed25519"]))
+
+
+def run(app, requests: list[dict], verify) -> float:
+    elapsed = 0.0
+    for kwargs in requests:
+        with app.test_request_context("/interactions/", method="POST", **kwargs) as ctx:
+            started_at = time.perf_counter()
+            verify(ctx.request)
+            elapsed += time.perf_counter() - started_at
+    return len(requests) / elapsed
+
+
+def main(count: int) -> None:
+    signing_key = SigningKey.generate()
+    app = create_app({"TESTING": True, "PUBLIC_KEY": signing_key.verify_key.encode().hex()})
+    requests = create_requests(signing_key, count)
+
+    uncached = run(app, requests, lambda request: verify_uncached(app, request))
+    # A fresh replay cache, since every request was just seen once
+    app.extensions.pop("discord_replay_cache", None)
+    cached = run(app, requests, DiscordAuth.verify_discord_request)
+    print(f"{'uncached (verifications/sec)':>30} {uncached:>10.0f}")
+    print(f"{'cached (verifications/sec)':>30} {cached:>10.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS)
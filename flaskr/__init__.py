@@ -4,7 +4,10 @@ from flask import Flask
 from .config.logging import configure_logger
 
 from . import db
+from . import json_provider
+from . import interaction_cache
 from . import commands
+from .discord import auth, rate_limit
 from . import discord_interactions
 from . import web_api
 
@@ -35,8 +38,12 @@ def create_app(test_config=None):
         return 'pong'
 
     # Initialize Stuff
+    json_provider.init_app(app)
     db.init_app(app)
+    interaction_cache.init_app(app)
     commands.init_app(app)
+    rate_limit.init_app(app)
+    auth.init_app(app)
 
     # Register routes
     app.register_blueprint(discord_interactions.bp)
@@ -0,0 +1,113 @@
+"""ASGI entry point for running the bot in async mode, e.g.
+
+    gunicorn -k uvicorn.workers.UvicornWorker 'flaskr.asgi:create_asgi_app()'
+
+Discord interactions are handled natively on the event loop with the async data
+layer, so one worker can have many in flight while they wait on Postgres. The
+batch sort sessions behind add_many and rerank live in the blocking
+InteractionCache, so those run the sync handlers on a thread (see
+AsyncRatingHandler). Everything else is passed through to the Flask app, which
+runs on a thread.
+"""
+import asyncio
+import functools
+import json
+from typing import Optional
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+from werkzeug.exceptions import HTTPException
+
+from . import create_app
+from .db_async import close_async_pools
+from .discord.auth import DiscordAuth, ReplayCache, SIGNATURE_HEADER, SIGNATURE_TIMESTAMP
+from .discord.request import close_async_clients
+from .discord_interactions.aio import AsyncDiscordInteractionHandler
+
+INTERACTIONS_PATH = "/interactions/"
+
+
+class InteractionsAsgiApp:
+    def __init__(self, app: Flask):
+        self.app = app
+        self.wsgi_app = WsgiToAsgi(app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._handle_lifespan(receive, send)
+        elif (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and scope["path"] in (INTERACTIONS_PATH, INTERACTIONS_PATH.rstrip("/"))
+        ):
+            await self._handle_interaction(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+    async def _handle_interaction(self, scope, receive, send):
+        body = await _read_body(receive)
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+
+        with self.app.app_context():
+            try:
+                verify = functools.partial(
+                    DiscordAuth.verify_signature,
+                    headers.get(SIGNATURE_HEADER.lower()),
+                    headers.get(SIGNATURE_TIMESTAMP.lower()),
+                    body,
+                )
+                if isinstance(DiscordAuth.get_replay_cache(), ReplayCache):
+                    verify()
+                else:
+                    # Shared replay caches are blocking stores
+                    await asyncio.to_thread(verify)
+                self.app.logger.info("Starting interaction")
+                response = await AsyncDiscordInteractionHandler.handle_interaction(json.loads(body))
+            except HTTPException as e:
+                await _send_response(send, e.code or 500, {"message": e.description})
+                return
+            except Exception:
+                self.app.logger.exception("Interaction failed")
+                await _send_response(send, 500, {"message": "Internal Server Error"})
+                return
+            await _send_response(send, 200, response, self.app)
+
+    async def _handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                with self.app.app_context():
+                    await close_async_pools()
+                    await close_async_clients()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_asgi_app(test_config=None) -> InteractionsAsgiApp:
+    return InteractionsAsgiApp(create_app(test_config))
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _send_response(send, status: int, payload: dict, app: Optional[Flask] = None) -> None:
+    body = (app.json.dumps(payload) if app is not None else json.dumps(payload)).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
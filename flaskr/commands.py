@@ -1,3 +1,6 @@
+import json
+import random
+import time
 from enum import Enum
 import click
 from .discord.commands import (
@@ -8,6 +11,13 @@ from .discord.commands import (
 
 from flask import current_app
 
+from .models.aggregate import AGGREGATE_SORTS, RatingAggregate
+from .models.rating import Rating
+from .models.user import User
+from .ratings.pivot_simulator import SYNTHETIC_DISTRIBUTIONS, recorded_trials, simulate, synthetic_trials
+from .ratings.rating_export import EXPORT_FORMATS, to_csv_lines, to_ndjson_lines
+from .ratings.rating_import import InvalidImportException, parse_csv_names, parse_json_names
+
 
 class BotCommandNames(str, Enum):
     echo = "echo"
@@ -15,6 +25,9 @@ class BotCommandNames(str, Enum):
 
 class RateSubCommandNames(str, Enum):
     add = "add"
+    add_many = "add_many"
+    rerank = "rerank"
+    top = "top"
     remove = "remove"
     list = "list"
     show_types = "show_types"
@@ -60,6 +73,42 @@ RATE_COMMAND = {
                 },
             ],
         },
+        {
+            "name": RateSubCommandNames.add_many.name,
+            "description": "Add several items to your ratings at once",
+            "type": ApplicationCommandOptionType.SUB_COMMAND.value,
+            "options": [
+                ITEM_TYPE_OPTION,
+                {
+                    "name": "names",
+                    "description": "The names of the items to rate, separated by commas",
+                    "required": True,
+                    "type": ApplicationCommandOptionType.STRING.value,
+                },
+            ],
+        },
+        {
+            "name": RateSubCommandNames.rerank.name,
+            "description": "Re-sort your ratings, or just some of them, by comparing them again",
+            "type": ApplicationCommandOptionType.SUB_COMMAND.value,
+            "options": [
+                ITEM_TYPE_OPTION,
+                {
+                    "name": "from",
+                    "description": "The highest rank to re-sort, where 1 is your favorite",
+                    "required": False,
+                    "type": ApplicationCommandOptionType.INTEGER.value,
+                    "min_value": 1,
+                },
+                {
+                    "name": "to",
+                    "description": "The lowest rank to re-sort",
+                    "required": False,
+                    "type": ApplicationCommandOptionType.INTEGER.value,
+                    "min_value": 1,
+                },
+            ],
+        },
         {
             "name": RateSubCommandNames.remove.name,
             "description": "Remove a rating",
@@ -80,6 +129,29 @@ RATE_COMMAND = {
             "type": ApplicationCommandOptionType.SUB_COMMAND.value,
             "options": [ITEM_TYPE_OPTION],
         },
+        {
+            "name": RateSubCommandNames.top.name,
+            "description": "Show how this server ranks a type as a whole",
+            "type": ApplicationCommandOptionType.SUB_COMMAND.value,
+            "options": [
+                {**ITEM_TYPE_OPTION, "description": "The type of item to show"},
+                {
+                    "name": "limit",
+                    "description": "How many items to show",
+                    "required": False,
+                    "type": ApplicationCommandOptionType.INTEGER.value,
+                    "min_value": 1,
+                    "max_value": 50,
+                },
+                {
+                    "name": "sort",
+                    "description": "Rank by total Borda score (default) or by mean percentile",
+                    "required": False,
+                    "type": ApplicationCommandOptionType.STRING.value,
+                    "choices": [{"name": sort, "value": sort} for sort in AGGREGATE_SORTS],
+                },
+            ],
+        },
         {
             "name": RateSubCommandNames.show_types.name,
             "description": "List your rating types",
@@ -93,9 +165,108 @@ ALL_COMMANDS = [TEST_COMMAND, RATE_COMMAND]
 
 def init_app(app):
     app.cli.add_command(create_commands_command)
+    app.cli.add_command(assign_rank_keys_command)
+    app.cli.add_command(rebuild_aggregates_command)
+    app.cli.add_command(import_ratings_command)
+    app.cli.add_command(export_ratings_command)
+    app.cli.add_command(simulate_pivots_command)
 
 
 @click.command("create-commands")
 def create_commands_command():
     install_global_commands(appId=current_app.config["APP_ID"], commands=ALL_COMMANDS)
     click.echo("Installed commands.")
+
+
+@click.command("assign-rank-keys")
+def assign_rank_keys_command():
+    """Order every rating's rank key by its current value, before switching RATING_STORAGE_MODE to rank_key."""
+    updated = Rating.assign_rank_keys_from_values()
+    click.echo(f"Assigned rank keys to {updated} ratings.")
+
+
+@click.command("rebuild-aggregates")
+def rebuild_aggregates_command():
+    """Recompute every guild's aggregate rankings, e.g. after switching RATING_STORAGE_MODE."""
+    written = RatingAggregate.rebuild_all()
+    click.echo(f"Rebuilt {written} aggregate rankings.")
+
+
+@click.command("import-ratings")
+@click.argument("file", type=click.File("r", encoding="utf8"))
+@click.option("--username", required=True, help="The user to import the ratings for.")
+@click.option("--type", "rating_type", required=True, help="The type of the ratings.")
+@click.option("--replace", is_flag=True, help="Remove the user's other ratings of the type.")
+def import_ratings_command(file, username, rating_type, replace):
+    """Import an already ordered list of ratings, highest first, from a JSON or CSV FILE."""
+    user = User.get_by_username(username)
+    if user is None:
+        raise click.ClickException(f"User {username} not found")
+    try:
+        if file.name.endswith(".csv"):
+            names = parse_csv_names(file)
+        else:
+            names = parse_json_names(json.load(file))
+    except (InvalidImportException, ValueError) as e:
+        raise click.ClickException(str(e))
+
+    started = time.perf_counter()
+    imported = Rating.import_ordered(user, rating_type, names, replace=replace)
+    elapsed = time.perf_counter() - started
+    rate = f" ({imported / elapsed:.0f} rows/sec)" if elapsed else ""
+    click.echo(f"Imported {imported} ratings in {elapsed:.3f}s{rate}.")
+
+
+@click.command("export-ratings")
+@click.option("--username", help="Only export this user's ratings.")
+@click.option("--type", "rating_type", help="Only export ratings of this type.")
+@click.option("--format", "export_format", type=click.Choice(EXPORT_FORMATS), default="csv", show_default=True)
+@click.option("--output", type=click.File("w", encoding="utf8"), default="-", help="Defaults to stdout.")
+def export_ratings_command(username, rating_type, export_format, output):
+    """Export every rating, or a user's and/or a type's, without loading them all into memory."""
+    user = None
+    if username is not None:
+        user = User.get_by_username(username)
+        if user is None:
+            raise click.ClickException(f"User {username} not found")
+
+    rows = Rating.stream_export(user, rating_type, itersize=current_app.config.get("API_STREAM_ITERSIZE", 500))
+    if export_format == "csv":
+        lines = to_csv_lines(rows)
+    else:
+        lines = to_ndjson_lines(rows, current_app.json.dumps)
+    for line in lines:
+        output.write(line)
+
+
+@click.command("simulate-pivots")
+@click.option(
+    "--distribution",
+    type=click.Choice(SYNTHETIC_DISTRIBUTIONS + ("recorded",)),
+    default="uniform",
+    show_default=True,
+    help="Where new items land, or recorded to replay a user's ratings of a type.",
+)
+@click.option("--size", default=100, show_default=True, help="Items already in the list.")
+@click.option("--trials", default=1000, show_default=True)
+@click.option("--seed", type=int, help="Seed for reproducible synthetic runs.")
+@click.option("--username", help="The user to replay, for recorded runs.")
+@click.option("--type", "rating_type", help="The rating type to replay, for recorded runs.")
+def simulate_pivots_command(distribution, size, trials, seed, username, rating_type):
+    """Report the comparisons per insert each pivot strategy needs."""
+    if distribution == "recorded":
+        if username is None or rating_type is None:
+            raise click.ClickException("Recorded runs need --username and --type")
+        user = User.get_by_username(username)
+        if user is None:
+            raise click.ClickException(f"User {username} not found")
+        placed = [r for r in user.get_ratings(rating_type=rating_type) if r.value is not None]
+        runs = list(recorded_trials(placed, Rating.get_ids_in_created_order(user, rating_type)))
+        if not runs:
+            raise click.ClickException(f"{username} has no {rating_type} ratings to replay")
+    else:
+        runs = list(synthetic_trials(distribution, size, trials, random.Random(seed)))
+
+    click.echo(f"{len(runs)} inserts, {distribution} distribution")
+    for strategy, stats in simulate(runs).items():
+        click.echo(f"{strategy:<14} mean {stats['mean']:6.2f}  p95 {stats['p95']:3d}  max {stats['max']:3d}")
@@ -1,33 +1,104 @@
 # import sqlite3
+import os
+import threading
+
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from psycopg2.extras import LoggingConnection, RealDictCursor
 
 import click
-from flask import current_app, g
+from flask import current_app, g, jsonify
+
+from .db_pool import ConnectionPool
+from .migrations import migrate
+
+_pool_lock = threading.Lock()
+
 
 def init_app(app):
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_db_command)
+    app.add_url_rule("/ping/db", "db_pool_stats", db_pool_stats)
+
+
+def get_pool() -> ConnectionPool:
+    # The pool is per process: gunicorn forks workers after the app is created,
+    # and a connection must never be shared across a fork.
+    pool = current_app.extensions.get("db_pool")
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    with _pool_lock:
+        pool = current_app.extensions.get("db_pool")
+        if pool is None or pool.pid != os.getpid():
+            pool = _create_pool()
+            current_app.extensions["db_pool"] = pool
+    return pool
+
+
+def _create_pool() -> ConnectionPool:
+    config = current_app.config
+    db_settings = {
+        "dbname": config['DB_NAME'],
+        "user": config['DB_USER'],
+        "password": config['DB_PASSWORD'],
+        "host": config['DB_HOST'],
+    }
+    logger = current_app.logger
+
+    def connect():
+        connection = psycopg2.connect(connection_factory=LoggingConnection, cursor_factory=RealDictCursor, **db_settings)
+        connection.initialize(logger)
+        return connection
+
+    return ConnectionPool(
+        connect=connect,
+        min_size=config.get("DB_POOL_MIN_SIZE", 1),
+        max_size=config.get("DB_POOL_MAX_SIZE", 10),
+        acquire_timeout=config.get("DB_POOL_ACQUIRE_TIMEOUT", 5.0),
+        max_uses=config.get("DB_POOL_MAX_USES", 1000),
+        max_age=config.get("DB_POOL_MAX_AGE", 1800.0),
+        health_check_interval=config.get("DB_POOL_HEALTH_CHECK_INTERVAL", 30.0),
+        check=_is_connection_alive,
+        reset=_reset_connection,
+    )
+
+
+def _is_connection_alive(connection) -> bool:
+    if connection.closed:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    connection.rollback()
+    return True
+
+
+def _reset_connection(connection) -> None:
+    if connection.closed:
+        raise psycopg2.InterfaceError("connection already closed")
+    # Never hand the next request a connection that is mid-transaction
+    if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
 
 def get_db():
     if 'db_connection' not in g:
-        db_settings =  {
-            "dbname": current_app.config['DB_NAME'],
-            "user": current_app.config['DB_USER'],
-            "password": current_app.config['DB_PASSWORD'],
-            "host": current_app.config['DB_HOST'],
-        }
-        g.db_connection = psycopg2.connect(connection_factory=LoggingConnection, cursor_factory=RealDictCursor, **db_settings)
-        g.db_connection.initialize(current_app.logger)
+        g.db_connection = get_pool().acquire()
 
     return g.db_connection
 
 
 def close_db(e=None):
-    db = g.pop('db', None)
+    db = g.pop('db_connection', None)
 
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+
+def db_pool_stats():
+    return jsonify(get_pool().stats())
+
 
 def init_db():
     with current_app.open_resource('schema.sql') as f:
@@ -35,6 +106,11 @@ def init_db():
         with conn.cursor() as cursor:
             cursor.execute(f.read().decode('utf8'))
         conn.commit()
+    migrate(conn)
+
+
+def migrate_db():
+    return migrate(get_db())
 
 
 @click.command('init-db')
@@ -42,3 +118,13 @@ def init_db_command():
     """Clear the existing data and create new tables."""
     init_db()
     click.echo('Initialized the database.')
+
+
+@click.command('migrate-db')
+def migrate_db_command():
+    """Apply any migrations that haven't been applied yet, keeping existing data."""
+    applied = migrate_db()
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(applied)}")
+    else:
+        click.echo('The database is up to date.')
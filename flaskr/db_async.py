@@ -0,0 +1,62 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+from flask import current_app
+
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """Returns the pool for the running event loop.
+
+    Like the sync pool it's never shared across a fork, and an async connection
+    also can't be used from a loop other than the one that opened it.
+    """
+    loop = asyncio.get_running_loop()
+    pools = current_app.extensions.setdefault("db_async_pools", weakref.WeakKeyDictionary())
+    entry = pools.get(loop)
+    if entry is None:
+        pool = _create_async_pool()
+        # Stored before awaiting so concurrent callers wait on the same open
+        entry = pools[loop] = (pool, loop.create_task(pool.open(wait=True)))
+    pool, opening = entry
+    await opening
+    return pool
+
+
+@asynccontextmanager
+async def async_connection():
+    """Checks out a connection, committing on success and rolling back on error."""
+    pool = await get_async_pool()
+    async with pool.connection() as connection:
+        yield connection
+
+
+async def close_async_pools() -> None:
+    pools = current_app.extensions.get("db_async_pools")
+    if not pools:
+        return
+    entry = pools.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[0].close()
+
+
+def _create_async_pool() -> AsyncConnectionPool:
+    config = current_app.config
+    return AsyncConnectionPool(
+        kwargs={
+            "dbname": config['DB_NAME'],
+            "user": config['DB_USER'],
+            "password": config['DB_PASSWORD'],
+            "host": config['DB_HOST'],
+            "row_factory": dict_row,
+        },
+        min_size=config.get("DB_POOL_MIN_SIZE", 1),
+        max_size=config.get("DB_ASYNC_POOL_MAX_SIZE", 20),
+        timeout=config.get("DB_POOL_ACQUIRE_TIMEOUT", 5.0),
+        max_lifetime=config.get("DB_POOL_MAX_AGE", 1800.0),
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
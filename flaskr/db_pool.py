@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class _PooledConnection:
+    def __init__(self, connection: Any):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.uses = 0
+
+
+class ConnectionPool:
+    """A small thread-safe pool of database connections owned by one process.
+
+    Connections are checked for liveness on checkout (when they have been idle
+    for longer than ``health_check_interval``) and recycled once they have been
+    used ``max_uses`` times or are older than ``max_age`` seconds.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        acquire_timeout: float = 5.0,
+        max_uses: int = 1000,
+        max_age: float = 1800.0,
+        health_check_interval: float = 30.0,
+        check: Optional[Callable[[Any], bool]] = None,
+        reset: Optional[Callable[[Any], None]] = None,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size min={min_size} max={max_size}")
+        self.pid = os.getpid()
+        self._connect = connect
+        self._check = check
+        self._reset = reset
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Condition()
+        self._idle: Deque[_PooledConnection] = deque()
+        self._in_use: Dict[int, _PooledConnection] = {}
+        self._pending = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._failed_checks = 0
+        self._total_checkout_latency = 0.0
+        self._max_checkout_latency = 0.0
+
+        for _ in range(min_size):
+            self._idle.append(_PooledConnection(self._connect()))
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._pending
+
+    def acquire(self) -> Any:
+        started_at = time.monotonic()
+        deadline = started_at + self.acquire_timeout
+        while True:
+            # Either hands back an idle connection or reserves a slot for a new one;
+            # both count towards the pool size until they are marked in use below.
+            pooled = self._take_or_reserve(deadline)
+            try:
+                if pooled is None:
+                    pooled = _PooledConnection(self._connect())
+                elif not self._is_usable(pooled):
+                    self._close_connection(pooled.connection)
+                    pooled = None
+            except BaseException:
+                with self._lock:
+                    self._pending -= 1
+                    self._lock.notify()
+                raise
+
+            with self._lock:
+                self._pending -= 1
+                if pooled is None:
+                    self._recycled += 1
+                    self._lock.notify()
+                    continue
+                pooled.uses += 1
+                pooled.last_used_at = time.monotonic()
+                latency = pooled.last_used_at - started_at
+                self._in_use[id(pooled.connection)] = pooled
+                self._checkouts += 1
+                self._total_checkout_latency += latency
+                self._max_checkout_latency = max(self._max_checkout_latency, latency)
+            return pooled.connection
+
+    def release(self, connection: Any, discard: bool = False) -> None:
+        with self._lock:
+            pooled = self._in_use.pop(id(connection), None)
+        if pooled is None:
+            return
+
+        if not discard and self._reset is not None:
+            try:
+                self._reset(connection)
+            except Exception:
+                discard = True
+
+        if discard or self._closed or self._is_expired(pooled):
+            self._discard(pooled)
+            return
+
+        pooled.last_used_at = time.monotonic()
+        with self._lock:
+            self._idle.append(pooled)
+            self._lock.notify()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._lock.notify_all()
+        for pooled in idle:
+            self._close_connection(pooled.connection)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "failed_health_checks": self._failed_checks,
+                "avg_checkout_latency_ms": round(
+                    (self._total_checkout_latency / self._checkouts) * 1000, 3
+                )
+                if self._checkouts
+                else 0.0,
+                "max_checkout_latency_ms": round(self._max_checkout_latency * 1000, 3),
+            }
+
+    def _take_or_reserve(self, deadline: float) -> Optional[_PooledConnection]:
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                if self._idle:
+                    self._pending += 1
+                    return self._idle.popleft()
+                if self.size < self.max_size:
+                    self._pending += 1
+                    return None
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.acquire_timeout}s waiting for a database connection"
+                    )
+                self._waiting += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _is_usable(self, pooled: _PooledConnection) -> bool:
+        if self._is_expired(pooled):
+            return False
+        idle_for = time.monotonic() - pooled.last_used_at
+        if self._check is not None and idle_for >= self.health_check_interval:
+            try:
+                healthy = self._check(pooled.connection)
+            except Exception:
+                healthy = False
+            if not healthy:
+                with self._lock:
+                    self._failed_checks += 1
+                return False
+        return True
+
+    def _is_expired(self, pooled: _PooledConnection) -> bool:
+        return (
+            pooled.uses >= self.max_uses
+            or time.monotonic() - pooled.created_at >= self.max_age
+        )
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        self._close_connection(pooled.connection)
+        with self._lock:
+            self._recycled += 1
+            self._lock.notify()
+
+    @staticmethod
+    def _close_connection(connection: Any) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -9,6 +9,9 @@ class InteractionType(IntEnum):
 class InteractionCallbackType(IntEnum):
     PONG = 1
     CHANNEL_MESSAGE_WITH_SOURCE = 4
+    DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE = 5
+    DEFERRED_UPDATE_MESSAGE = 6
+    UPDATE_MESSAGE = 7
 
 
 class MessageComponentType(IntEnum):
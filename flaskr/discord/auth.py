@@ -1,20 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+
 from flask import (abort, current_app)
 
 from nacl.signing import VerifyKey
 from nacl.exceptions import BadSignatureError
 
+from ..interaction_cache import InteractionCache
+
 SIGNATURE_HEADER = "X-Signature-Ed25519"
 SIGNATURE_TIMESTAMP = "X-Signature-Timestamp"
 
+DEFAULT_MAX_AGE_SECONDS = 300
+DEFAULT_REPLAY_CACHE_SIZE = 10000
+
+
+def init_app(app):
+  # Built once up front rather than parsing the hex key on every request
+  public_key = app.config.get("PUBLIC_KEY")
+  if public_key:
+    app.extensions["discord_verify_key"] = (public_key, VerifyKey(bytes.fromhex(public_key)))
+
+
+class ReplayCache:
+  """Remembers recently seen signatures so a captured request can't be sent again.
+
+  Only signatures within the accepted timestamp window need remembering, anything
+  older is rejected as stale anyway. Only this process's requests are seen, so
+  it's used with the in-memory interaction cache, which needs a single worker
+  anyway. Shared backends use StoreReplayCache.
+  """
+
+  def __init__(self, max_entries, max_age_seconds):
+      self.max_entries = max_entries
+      self.max_age_seconds = max_age_seconds
+      self._lock = threading.Lock()
+      self._seen = OrderedDict()
+
+  def check_and_add(self, signature, timestamp):
+      """Returns False if ``signature`` has already been seen."""
+      expired_before = time.time() - self.max_age_seconds
+      with self._lock:
+          while self._seen:
+              oldest_signature, oldest_timestamp = next(iter(self._seen.items()))
+              if len(self._seen) < self.max_entries and oldest_timestamp >= expired_before:
+                  break
+              del self._seen[oldest_signature]
+          if signature in self._seen:
+              return False
+          self._seen[signature] = timestamp
+          return True
+
+
+class StoreReplayCache:
+  """A ReplayCache kept in the InteractionCache store, so a redis or postgres
+  backend shared between workers rejects a request any of them has seen."""
+
+  KEY_PREFIX = "replay:"
+
+  def __init__(self, max_age_seconds):
+      self.max_age_seconds = max_age_seconds
+
+  def check_and_add(self, signature, timestamp):
+      """Returns False if ``signature`` has already been seen."""
+      # Kept until the timestamp is stale, plus a second for rounding
+      ttl = max(timestamp + self.max_age_seconds - time.time(), 0) + 1
+      return InteractionCache.get_store().add(self.KEY_PREFIX + signature.hex(), str(timestamp), ttl)
+
+
 class DiscordAuth:
 
+  @staticmethod
+  def get_verify_key():
+      public_key = current_app.config['PUBLIC_KEY']
+      cached = current_app.extensions.get("discord_verify_key")
+      # The config can change after startup in tests
+      if cached is None or cached[0] != public_key:
+          cached = (public_key, VerifyKey(bytes.fromhex(public_key)))
+          current_app.extensions["discord_verify_key"] = cached
+      return cached[1]
+
+  @staticmethod
+  def get_replay_cache():
+      replay_cache = current_app.extensions.get("discord_replay_cache")
+      if replay_cache is None:
+          config = current_app.config
+          max_age_seconds = config.get("DISCORD_SIGNATURE_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS)
+          if config.get("INTERACTION_CACHE_BACKEND", "memory") == "memory":
+              replay_cache = ReplayCache(
+                  max_entries=config.get("DISCORD_REPLAY_CACHE_SIZE", DEFAULT_REPLAY_CACHE_SIZE),
+                  max_age_seconds=max_age_seconds,
+              )
+          else:
+              replay_cache = StoreReplayCache(max_age_seconds)
+          replay_cache = current_app.extensions.setdefault("discord_replay_cache", replay_cache)
+      return replay_cache
+
+  @staticmethod
   def verify_discord_request(request):
-      verify_key = VerifyKey(bytes.fromhex(current_app.config['PUBLIC_KEY']))
-      signature = request.headers[SIGNATURE_HEADER]
-      timestamp = request.headers[SIGNATURE_TIMESTAMP]
-      body = request.data.decode("utf-8")
+      DiscordAuth.verify_signature(
+          request.headers.get(SIGNATURE_HEADER),
+          request.headers.get(SIGNATURE_TIMESTAMP),
+          request.get_data(),
+      )
+
+  @staticmethod
+  def verify_signature(signature, timestamp, body):
+      """Aborts with a 401 unless ``body`` was signed by Discord recently and hasn't been seen before."""
+      if not signature or not timestamp:
+          abort(401, 'missing request signature')
+
+      try:
+          signed_at = int(timestamp)
+          signature_bytes = bytes.fromhex(signature)
+      except ValueError:
+          abort(401, 'invalid request signature')
+
+      max_age = current_app.config.get("DISCORD_SIGNATURE_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS)
+      if abs(time.time() - signed_at) > max_age:
+          abort(401, 'stale request timestamp')
 
       try:
-          verify_key.verify(f'{timestamp}{body}'.encode(), bytes.fromhex(signature))
+          # Passed as one signed message since verify() would otherwise
+          # concatenate the signature and message itself
+          DiscordAuth.get_verify_key().verify(
+              b"".join((signature_bytes, timestamp.encode(), body))
+          )
       except BadSignatureError:
           abort(401, 'invalid request signature')
+
+      # Keyed on the decoded bytes, since hex in any case decodes to the same signature
+      if not DiscordAuth.get_replay_cache().check_and_add(signature_bytes, signed_at):
+          abort(401, 'replayed request')
@@ -0,0 +1,238 @@
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from flask import current_app, jsonify
+
+# Discord scopes the limits of these routes to the id that follows them
+_MAJOR_PARAMETER_PATTERN = re.compile(r"^(channels|guilds|webhooks)/(\d+)(?:/([^/]+))?")
+_ID_PATTERN = re.compile(r"/\d{5,}")
+
+# Statuses that are worth retrying because Discord, not the request, is at fault
+_RETRYABLE_STATUSES = {500, 502, 503, 504}
+
+# How often buckets whose limits have reset are dropped. Webhook tokens are part
+# of their routes, so every interaction would otherwise keep one around for good.
+_EVICT_INTERVAL_SECONDS = 60.0
+
+_limiter_lock = threading.Lock()
+
+
+def init_app(app):
+    app.add_url_rule("/ping/discord", "discord_rate_limit_stats", discord_rate_limit_stats)
+
+
+def discord_rate_limit_stats():
+    return jsonify(get_rate_limiter().stats())
+
+
+def get_rate_limiter() -> "RateLimiter":
+    limiter = current_app.extensions.get("discord_rate_limiter")
+    # The lock may have been held by another thread at fork, so never reuse a parent's
+    if limiter is not None and limiter.pid == os.getpid():
+        return limiter
+
+    with _limiter_lock:
+        limiter = current_app.extensions.get("discord_rate_limiter")
+        if limiter is None or limiter.pid != os.getpid():
+            limiter = RateLimiter(
+                max_retries=current_app.config.get("DISCORD_MAX_RETRIES", 3),
+                jitter=current_app.config.get("DISCORD_RETRY_JITTER_SECONDS", 0.25),
+            )
+            current_app.extensions["discord_rate_limiter"] = limiter
+    return limiter
+
+
+class _Bucket:
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+
+
+class RateLimiter:
+    """Paces outbound Discord requests using the limits Discord reports back.
+
+    Callers ``reserve`` a slot before each request, sleep for however long it
+    says and try again, then hand the response to ``update``. Routes are mapped
+    to the bucket Discord names in ``X-RateLimit-Bucket``, so routes sharing a
+    bucket share its remaining count, and a global 429 holds back every route.
+    """
+
+    def __init__(self, max_retries: int = 3, jitter: float = 0.25, clock=time.monotonic):
+        self.max_retries = max_retries
+        self.jitter = jitter
+        self.pid = os.getpid()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._route_buckets: Dict[str, str] = {}
+        self._buckets: Dict[str, _Bucket] = {}
+        self._global_reset_at = 0.0
+        self._next_eviction_at = 0.0
+
+        self._queued = 0
+        self._max_queued = 0
+        self._requests = 0
+        self._rate_limited = 0
+        self._retries = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @staticmethod
+    def get_route(method: str, endpoint: str) -> str:
+        """Returns the route ``endpoint`` is limited under, keeping only the major parameter's id."""
+        major, rest = _split_major_parameter(endpoint)
+        return f"{method} {(major + _ID_PATTERN.sub('/:id', rest)).lstrip('/')}"
+
+    def reserve(self, method: str, endpoint: str) -> float:
+        """Takes a slot for the request and returns 0, or returns how many seconds
+        to wait before calling again."""
+        route = self.get_route(method, endpoint)
+        with self._lock:
+            now = self._clock()
+            wait = self._global_reset_at - now
+            bucket = self._find_bucket(route)
+            if bucket is not None and bucket.remaining is not None:
+                if bucket.reset_at <= now:
+                    bucket.remaining = bucket.limit
+                elif bucket.remaining <= 0:
+                    wait = max(wait, bucket.reset_at - now)
+            if wait > 0:
+                return wait
+            if bucket is not None and bucket.remaining is not None:
+                bucket.remaining -= 1
+            self._requests += 1
+            return 0.0
+
+    def acquire(self, method: str, endpoint: str) -> float:
+        """Blocks until a slot is free, returning how long that took."""
+        waited = 0.0
+        while True:
+            wait = self.reserve(method, endpoint)
+            if wait <= 0:
+                break
+            self.start_waiting()
+            try:
+                time.sleep(wait)
+            finally:
+                waited += wait
+                self.stop_waiting(wait)
+        return waited
+
+    def start_waiting(self) -> None:
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+    def stop_waiting(self, waited: float) -> None:
+        with self._lock:
+            self._queued -= 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+    def update(self, method: str, endpoint: str, status_code: int, headers, body=None) -> None:
+        """Records the limits reported with a response, including a 429's ``retry_after``."""
+        route = self.get_route(method, endpoint)
+        with self._lock:
+            now = self._clock()
+            self._evict_expired(now)
+            bucket_hash = headers.get("X-RateLimit-Bucket")
+            bucket: Optional[_Bucket]
+            if bucket_hash is not None:
+                self._route_buckets[route] = bucket_hash
+                bucket = self._get_bucket(route)
+            else:
+                bucket = self._find_bucket(route)
+
+            if bucket is not None and headers.get("X-RateLimit-Remaining") is not None:
+                bucket.limit = int(headers.get("X-RateLimit-Limit", 1))
+                bucket.remaining = int(headers["X-RateLimit-Remaining"])
+                bucket.reset_at = now + float(headers.get("X-RateLimit-Reset-After", 0))
+
+            if status_code == 429:
+                self._rate_limited += 1
+                retry_after = float((body or {}).get("retry_after") or headers.get("Retry-After") or 1)
+                reset_at = now + retry_after + random.uniform(0, self.jitter)
+                is_global = (body or {}).get("global") or headers.get("X-RateLimit-Global") == "true"
+                if is_global:
+                    self._global_reset_at = max(self._global_reset_at, reset_at)
+                else:
+                    if bucket is None:
+                        bucket = self._get_bucket(route)
+                    bucket.limit = bucket.limit or 1
+                    bucket.remaining = 0
+                    bucket.reset_at = max(bucket.reset_at, reset_at)
+
+    def should_retry(self, status_code: int, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if status_code == 429 or status_code in _RETRYABLE_STATUSES:
+            with self._lock:
+                self._retries += 1
+            return True
+        return False
+
+    def get_backoff(self, status_code: int, attempt: int) -> float:
+        """How long to wait before retrying after a server error. A 429's wait is
+        already recorded on its bucket and taken by the next ``reserve``."""
+        if status_code == 429:
+            return 0.0
+        return 0.5 * 2 ** attempt + random.uniform(0, self.jitter)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queued,
+                "max_queued": self._max_queued,
+                "requests": self._requests,
+                "rate_limited": self._rate_limited,
+                "retries": self._retries,
+                "buckets": len(self._buckets),
+                "total_wait_ms": round(self._total_wait * 1000, 2),
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+            }
+
+    def _bucket_key(self, route: str) -> str:
+        # Until Discord tells us a route's bucket it gets one of its own
+        bucket_hash = self._route_buckets.get(route, route)
+        major, _ = _split_major_parameter(route.split(" ", 1)[1])
+        return f"{bucket_hash}:{major}"
+
+    def _find_bucket(self, route: str) -> Optional[_Bucket]:
+        return self._buckets.get(self._bucket_key(route))
+
+    def _get_bucket(self, route: str) -> _Bucket:
+        key = self._bucket_key(route)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        return bucket
+
+    def _evict_expired(self, now: float) -> None:
+        """Drops buckets whose limits have reset, along with the routes mapped to
+        them. Discord reports a route's bucket again with its next response."""
+        if now < self._next_eviction_at:
+            return
+        self._next_eviction_at = now + _EVICT_INTERVAL_SECONDS
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket.reset_at > now}
+        self._route_buckets = {
+            route: bucket_hash
+            for route, bucket_hash in self._route_buckets.items()
+            if self._bucket_key(route) in self._buckets
+        }
+
+
+def _split_major_parameter(endpoint: str) -> Tuple[str, str]:
+    path = endpoint.lstrip("/").split("?")[0]
+    match = _MAJOR_PARAMETER_PATTERN.match(path)
+    if match is None:
+        return "", "/" + path
+    if match.group(1) == "webhooks" and match.group(3) is not None:
+        # A webhook's token is part of its major parameter
+        major = match.group(0)
+    else:
+        major = f"{match.group(1)}/{match.group(2)}"
+    return major, path[len(major):]
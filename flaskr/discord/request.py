@@ -1,43 +1,196 @@
+import asyncio
 import httpx
+import importlib.util
 import json
+import os
+import re
+import threading
+import time
+import weakref
 
 from flask import current_app
 
+from .rate_limit import RateLimiter, get_rate_limiter
+
+DEFAULT_API_BASE_URL = "https://discord.com/api/v10/"
+
+USER_AGENT = "DiscordBot (https://github.com/discord/discord-example-app, 1.0.0)"
+
+_client_lock = threading.Lock()
+
+# Webhook and interaction tokens are credentials, and are part of their endpoints
+_TOKEN_PATTERN = re.compile(r"^(/?(?:webhooks|interactions)/\d+/)[^/?]+")
+
 
 def discord_request(endpoint, input_options=None):
-    current_app.logger.info("In discord request")
-    options = input_options or {}
-    url = str(f"https://discord.com/api/v10/{endpoint}")
-    request = {
-        "headers": {
-            "Authorization": f"Bot {current_app.config['DISCORD_TOKEN']}",
-            "Content-Type": "application/json; charset=UTF-8",
-            "User-Agent": "DiscordBot (https://github.com/discord/discord-example-app, 1.0.0)",
-        }
-        | options.get("headers", {}),
-    } | options
-    current_app.logger.info(endpoint)
-    current_app.logger.info(request)
-    response = None
-    try:
-        response = httpx.request(
-            url=url,
-            method=request["method"],
-            headers=request["headers"],
-            json=request["data"],
-        )
-    except Exception as e:
-        current_app.logger.error(e)
-    current_app.logger.info("Request is done")
-
-    current_app.logger.info(response)
+    method, request = _build_request(endpoint, input_options)
+    limiter = get_rate_limiter()
+    attempt = 0
+    while True:
+        limiter.acquire(method, endpoint)
+        try:
+            response = get_client().request(method, endpoint, **request)
+        except httpx.HTTPError as e:
+            current_app.logger.error(f"Discord request {method} {_redact(endpoint)} failed: {e!r}")
+            raise
+        if not _should_retry(limiter, method, endpoint, response, attempt):
+            return _check_response(method, endpoint, response)
+        time.sleep(limiter.get_backoff(response.status_code, attempt))
+        attempt += 1
 
-    if not is_response_okay(response):
-        data = response.json()
-        current_app.logger.error(response.status_code)
-        raise RuntimeError(json.dumps(data))
 
-    return response
+async def discord_request_async(endpoint, input_options=None):
+    method, request = _build_request(endpoint, input_options)
+    limiter = get_rate_limiter()
+    attempt = 0
+    while True:
+        await _acquire_async(limiter, method, endpoint)
+        try:
+            response = await get_async_client().request(method, endpoint, **request)
+        except httpx.HTTPError as e:
+            current_app.logger.error(f"Discord request {method} {_redact(endpoint)} failed: {e!r}")
+            raise
+        if not _should_retry(limiter, method, endpoint, response, attempt):
+            return _check_response(method, endpoint, response)
+        await asyncio.sleep(limiter.get_backoff(response.status_code, attempt))
+        attempt += 1
+
+
+def get_client() -> httpx.Client:
+    """Returns this process's client so requests reuse its pooled keep-alive connections."""
+    # Stored with the pid that opened it, since connections can't be shared with a forked worker
+    entry = current_app.extensions.get("discord_client")
+    if entry is not None and entry[0] == os.getpid():
+        return entry[1]
+
+    with _client_lock:
+        entry = current_app.extensions.get("discord_client")
+        if entry is None or entry[0] != os.getpid():
+            entry = (os.getpid(), httpx.Client(**_get_client_options()))
+            current_app.extensions["discord_client"] = entry
+    return entry[1]
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the client for the running event loop.
+
+    An AsyncClient's connections belong to the loop they were opened on, so
+    there is one client per loop rather than one per process.
+    """
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        clients = current_app.extensions.setdefault("discord_async_clients", weakref.WeakKeyDictionary())
+        client = clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(**_get_client_options())
+            clients[loop] = client
+    return client
+
+
+def close_clients() -> None:
+    entry = current_app.extensions.pop("discord_client", None)
+    if entry is not None:
+        entry[1].close()
+    clients = current_app.extensions.pop("discord_async_clients", None)
+    for loop, client in list((clients or {}).items()):
+        # A closed loop took its client's connections with it
+        if loop.is_closed():
+            continue
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            loop.run_until_complete(client.aclose())
+
+
+async def close_async_clients() -> None:
+    """Closes the running event loop's client, e.g. when an ASGI server shuts down."""
+    clients = current_app.extensions.get("discord_async_clients")
+    if not clients:
+        return
+    client = clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
 
 def is_response_okay(response):
     return response.status_code == httpx.codes.OK or response.status_code == httpx.codes.NO_CONTENT
+
+
+def _get_client_options() -> dict:
+    config = current_app.config
+    http2 = config.get("DISCORD_HTTP2", False)
+    if http2 and importlib.util.find_spec("h2") is None:
+        current_app.logger.warning("DISCORD_HTTP2 is set but h2 isn't installed, using HTTP/1.1")
+        http2 = False
+
+    return {
+        "base_url": config.get("DISCORD_API_BASE_URL", DEFAULT_API_BASE_URL),
+        "headers": {
+            "Authorization": f"Bot {config['DISCORD_TOKEN']}",
+            "User-Agent": USER_AGENT,
+        },
+        "http2": http2,
+        "timeout": httpx.Timeout(
+            config.get("DISCORD_TIMEOUT_SECONDS", 10.0),
+            connect=config.get("DISCORD_CONNECT_TIMEOUT_SECONDS", 5.0),
+        ),
+        "limits": httpx.Limits(
+            max_connections=config.get("DISCORD_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=config.get("DISCORD_MAX_KEEPALIVE_CONNECTIONS", 10),
+        ),
+    }
+
+
+def _build_request(endpoint, input_options):
+    options = input_options or {}
+    method = options["method"]
+    # Never log the headers, they carry the bot token
+    current_app.logger.info(f"Discord request {method} {_redact(endpoint)}")
+    request = {"json": options.get("data")}
+    if "headers" in options:
+        request["headers"] = options["headers"]
+    return method, request
+
+
+def _redact(endpoint: str) -> str:
+    """The endpoint without the token of a webhook or interaction, for logging."""
+    return _TOKEN_PATTERN.sub(r"\1:token", endpoint)
+
+
+def _should_retry(limiter: RateLimiter, method, endpoint, response, attempt: int) -> bool:
+    body = None
+    if response.status_code == httpx.codes.TOO_MANY_REQUESTS:
+        try:
+            body = response.json()
+        except ValueError:
+            pass
+    limiter.update(method, endpoint, response.status_code, response.headers, body)
+    if not limiter.should_retry(response.status_code, attempt):
+        return False
+    current_app.logger.warning(
+        f"Discord request {method} {_redact(endpoint)} returned {response.status_code}, retrying"
+    )
+    return True
+
+
+async def _acquire_async(limiter: RateLimiter, method, endpoint) -> None:
+    while True:
+        wait = limiter.reserve(method, endpoint)
+        if wait <= 0:
+            return
+        limiter.start_waiting()
+        try:
+            await asyncio.sleep(wait)
+        finally:
+            limiter.stop_waiting(wait)
+
+
+def _check_response(method, endpoint, response):
+    current_app.logger.info(f"Discord request {method} {_redact(endpoint)} returned {response.status_code}")
+    if not is_response_okay(response):
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"message": response.text}
+        raise RuntimeError(json.dumps(data))
+    return response
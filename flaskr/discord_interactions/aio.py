@@ -0,0 +1,108 @@
+from typing import Awaitable, Callable
+
+from flask import current_app
+
+from flaskr.commands import BotCommandNames, RateSubCommandNames
+from ..discord import InteractionCallbackType, InteractionType
+from ..ratings.async_rating_handler import AsyncRatingHandler
+from ..ratings.custom_id import LIST_PAGE_PREFIX, SORT_ANSWER_PREFIX
+from . import deferred
+
+
+class AsyncDiscordInteractionHandler:
+    """DiscordInteractionHandler for the ASGI entry point, returning response dicts."""
+
+    @staticmethod
+    async def handle_interaction(content: dict) -> dict:
+        interaction_type: int = int(content["type"])
+        if interaction_type == InteractionType.PING:
+            return {"type": InteractionCallbackType.PONG}
+        elif interaction_type == InteractionType.APPLICATION_COMMAND:
+            return await AsyncDiscordInteractionHandler.handle_application_command(json_data=content)
+        elif interaction_type == InteractionType.MESSAGE_COMPONENT:
+            return await AsyncDiscordInteractionHandler.handle_message_interaction(json_data=content)
+        else:
+            current_app.logger.warn(f"Unknown interaction type: {interaction_type}")
+            return {"type": InteractionCallbackType.PONG}
+
+    @staticmethod
+    async def handle_application_command(json_data: dict) -> dict:
+        discord_user: dict = json_data["member"]["user"]
+        interaction_data: dict = json_data["data"]
+        command_name: str = interaction_data["name"]
+        if command_name == BotCommandNames.echo.name:
+            return {
+                "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
+                "data": {"content": interaction_data["options"][0]["value"]},
+            }
+        elif command_name == BotCommandNames.rating.name:
+            sub_command = interaction_data["options"][0]
+            sub_command_name = sub_command["name"]
+
+            handle: Callable[[], Awaitable[dict]]
+            if sub_command_name == RateSubCommandNames.list.name:
+                handle = lambda: AsyncRatingHandler.handle_list_ratings(
+                    discord_user=discord_user, interaction_data=sub_command
+                )
+            elif sub_command_name == RateSubCommandNames.show_types.name:
+                handle = lambda: AsyncRatingHandler.handle_list_types(discord_user=discord_user)
+            elif sub_command_name == RateSubCommandNames.remove.name:
+                handle = lambda: AsyncRatingHandler.handle_remove_rating(
+                    discord_user=discord_user, interaction_data=sub_command
+                )
+            elif sub_command_name == RateSubCommandNames.add.name:
+                handle = lambda: AsyncRatingHandler.handle_add_rating(
+                    discord_user=discord_user, interaction_data=sub_command
+                )
+            elif sub_command_name == RateSubCommandNames.add_many.name:
+                handle = lambda: AsyncRatingHandler.handle_add_many_ratings(
+                    discord_user=discord_user, interaction_data=sub_command
+                )
+            elif sub_command_name == RateSubCommandNames.rerank.name:
+                handle = lambda: AsyncRatingHandler.handle_rerank_ratings(
+                    discord_user=discord_user, interaction_data=sub_command
+                )
+            elif sub_command_name == RateSubCommandNames.top.name:
+                handle = lambda: AsyncRatingHandler.handle_top_ratings(
+                    discord_user=discord_user, interaction_data=sub_command, guild_id=json_data.get("guild_id")
+                )
+            else:
+                current_app.logger.warn(f"Unknown sub command name: {sub_command_name}")
+                return {"type": InteractionCallbackType.PONG}
+            return await deferred.respond_async(
+                json_data,
+                f"{command_name}.{sub_command_name}",
+                AsyncRatingHandler.as_guild_member(discord_user, json_data.get("guild_id"), handle),
+            )
+        else:
+            current_app.logger.warn(f"Unknown command name: {command_name}")
+            return {"type": InteractionCallbackType.PONG}
+
+    @staticmethod
+    async def handle_message_interaction(json_data: dict) -> dict:
+        discord_user: dict = json_data["member"]["user"]
+        interaction_data: dict = json_data["data"]
+        if interaction_data["custom_id"].startswith(f"{LIST_PAGE_PREFIX}:"):
+            return await deferred.respond_async(
+                json_data,
+                "rating.list.page",
+                lambda: AsyncRatingHandler.handle_list_page(
+                    discord_user=discord_user, interaction_data=interaction_data
+                ),
+                deferred_type=InteractionCallbackType.DEFERRED_UPDATE_MESSAGE,
+            )
+        if interaction_data["custom_id"].startswith(f"{SORT_ANSWER_PREFIX}:"):
+            return await deferred.respond_async(
+                json_data,
+                "sort_comparison",
+                lambda: AsyncRatingHandler.handle_sort_answer(
+                    discord_user=discord_user, interaction_data=interaction_data
+                ),
+            )
+        return await deferred.respond_async(
+            json_data,
+            "comparison",
+            lambda: AsyncRatingHandler.handle_responded_to_comparison(
+                discord_user=discord_user, interaction_data=interaction_data
+            ),
+        )
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict
+
+from flask import Flask, Response, current_app, jsonify
+
+from ..discord import InteractionCallbackType
+from ..discord.request import discord_request, discord_request_async
+
+# Discord fails an interaction that isn't answered within 3 seconds
+DEFAULT_LATENCY_BUDGET_MS = 1500
+
+# How much each new measurement moves a command's average latency
+_LATENCY_SMOOTHING = 0.2
+
+_executor_lock = threading.Lock()
+
+# The event loop only keeps weak references to tasks
+_background_tasks: set = set()
+
+
+class InteractionLatencies:
+    """Exponentially weighted moving average of how long each command takes to handle."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._averages_ms: Dict[str, float] = {}
+
+    @staticmethod
+    def get() -> "InteractionLatencies":
+        return current_app.extensions.setdefault("interaction_latencies", InteractionLatencies())
+
+    def record(self, command: str, elapsed_ms: float) -> None:
+        with self._lock:
+            average = self._averages_ms.get(command)
+            if average is None:
+                self._averages_ms[command] = elapsed_ms
+            else:
+                self._averages_ms[command] = average + _LATENCY_SMOOTHING * (elapsed_ms - average)
+
+    def get_average_ms(self, command: str) -> float:
+        with self._lock:
+            return self._averages_ms.get(command, 0.0)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    # Stored as (pid, executor), since threads don't survive a fork and so
+    # each gunicorn worker needs its own pool
+    entry = current_app.extensions.get("deferred_executor")
+    if entry is not None and entry[0] == os.getpid():
+        return entry[1]
+
+    with _executor_lock:
+        entry = current_app.extensions.get("deferred_executor")
+        if entry is None or entry[0] != os.getpid():
+            executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get("DEFERRED_WORKERS", 4),
+                thread_name_prefix="deferred-interaction",
+            )
+            entry = (os.getpid(), executor)
+            current_app.extensions["deferred_executor"] = entry
+    return entry[1]
+
+
+def should_defer(command: str) -> bool:
+    if command in current_app.config.get("DEFERRED_COMMANDS", ["rating.list"]):
+        return True
+    budget_ms = current_app.config.get("INTERACTION_LATENCY_BUDGET_MS", DEFAULT_LATENCY_BUDGET_MS)
+    return InteractionLatencies.get().get_average_ms(command) > budget_ms
+
+
+def respond(
+    json_data: dict,
+    command: str,
+    handle: Callable[[], Response],
+    deferred_type: InteractionCallbackType = InteractionCallbackType.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE,
+) -> Response:
+    """Answers an interaction with ``handle``, deferring it to a worker thread when
+    the command is configured to be deferred or has been slower than the budget."""
+    if should_defer(command):
+        return defer(json_data, command, handle, deferred_type)
+
+    started_at = time.perf_counter()
+    response = handle()
+    InteractionLatencies.get().record(command, (time.perf_counter() - started_at) * 1000)
+    return response
+
+
+def defer(
+    json_data: dict,
+    command: str,
+    handle: Callable[[], Response],
+    deferred_type: InteractionCallbackType = InteractionCallbackType.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE,
+) -> Response:
+    """Acknowledges the interaction right away and has a worker run ``handle``,
+    then edits the original response with whatever message it produced."""
+    get_executor().submit(
+        _complete_deferred_interaction,
+        current_app._get_current_object(),  # type: ignore[attr-defined]
+        json_data["application_id"],
+        json_data["token"],
+        command,
+        handle,
+    )
+    return jsonify({"type": deferred_type})
+
+
+def _complete_deferred_interaction(
+    app: Flask, application_id: str, token: str, command: str, handle: Callable[[], Response]
+) -> None:
+    with app.app_context():
+        started_at = time.perf_counter()
+        try:
+            data = handle().get_json().get("data", {})
+        except Exception:
+            current_app.logger.exception(f"Deferred {command} interaction failed")
+            data = {"content": "Sorry, something went wrong"}
+        InteractionLatencies.get().record(command, (time.perf_counter() - started_at) * 1000)
+
+        try:
+            discord_request(
+                f"webhooks/{application_id}/{token}/messages/@original",
+                {"method": "PATCH", "data": data},
+            )
+        except Exception:
+            current_app.logger.exception(f"Could not deliver deferred {command} response")
+
+
+async def respond_async(
+    json_data: dict,
+    command: str,
+    handle: Callable[[], Awaitable[dict]],
+    deferred_type: InteractionCallbackType = InteractionCallbackType.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE,
+) -> dict:
+    """The ASGI entry point's version of ``respond``, deferring to a task on the
+    running event loop rather than to a worker thread."""
+    if should_defer(command):
+        task = asyncio.create_task(
+            _complete_deferred_interaction_async(
+                current_app._get_current_object(),  # type: ignore[attr-defined]
+                json_data["application_id"],
+                json_data["token"],
+                command,
+                handle,
+            )
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        return {"type": deferred_type}
+
+    started_at = time.perf_counter()
+    response = await handle()
+    InteractionLatencies.get().record(command, (time.perf_counter() - started_at) * 1000)
+    return response
+
+
+async def _complete_deferred_interaction_async(
+    app: Flask, application_id: str, token: str, command: str, handle: Callable[[], Awaitable[dict]]
+) -> None:
+    # The request's app context is popped once its response is sent
+    with app.app_context():
+        started_at = time.perf_counter()
+        try:
+            data = (await handle()).get("data", {})
+        except Exception:
+            current_app.logger.exception(f"Deferred {command} interaction failed")
+            data = {"content": "Sorry, something went wrong"}
+        InteractionLatencies.get().record(command, (time.perf_counter() - started_at) * 1000)
+
+        try:
+            await discord_request_async(
+                f"webhooks/{application_id}/{token}/messages/@original",
+                {"method": "PATCH", "data": data},
+            )
+        except Exception:
+            current_app.logger.exception(f"Could not deliver deferred {command} response")
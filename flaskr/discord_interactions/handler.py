@@ -2,7 +2,9 @@ from flask import current_app, jsonify, Response
 
 from flaskr.commands import BotCommandNames, RateSubCommandNames
 from ..discord import InteractionCallbackType
+from ..ratings.custom_id import LIST_PAGE_PREFIX, SORT_ANSWER_PREFIX
 from ..ratings.rating_handler import RatingHandler
+from . import deferred
 
 class DiscordInteractionHandler:
 
@@ -18,19 +20,43 @@ class DiscordInteractionHandler:
             sub_command_name = sub_command["name"]
 
             if sub_command_name == RateSubCommandNames.list.name:
-                return RatingHandler.handle_list_ratings(discord_user=discord_user, interaction_data=sub_command)
+                handle = lambda: RatingHandler.handle_list_ratings(
+                    discord_user=discord_user, interaction_data=sub_command
+                )
             elif sub_command_name == RateSubCommandNames.show_types.name:
-                return RatingHandler.handle_list_types(discord_user=discord_user)
+                handle = lambda: RatingHandler.handle_list_types(discord_user=discord_user)
             elif sub_command_name == RateSubCommandNames.remove.name:
-                return RatingHandler.handle_remove_rating(discord_user=discord_user, interaction_data=sub_command)
+                handle = lambda: RatingHandler.handle_remove_rating(
+                    discord_user=discord_user, interaction_data=sub_command
+                )
             elif sub_command_name == RateSubCommandNames.add.name:
-                return RatingHandler.handle_add_rating(
+                handle = lambda: RatingHandler.handle_add_rating(
+                    discord_user=discord_user,
+                    interaction_data=sub_command,
+                )
+            elif sub_command_name == RateSubCommandNames.add_many.name:
+                handle = lambda: RatingHandler.handle_add_many_ratings(
                     discord_user=discord_user,
                     interaction_data=sub_command,
                 )
+            elif sub_command_name == RateSubCommandNames.rerank.name:
+                handle = lambda: RatingHandler.handle_rerank_ratings(
+                    discord_user=discord_user, interaction_data=sub_command
+                )
+            elif sub_command_name == RateSubCommandNames.top.name:
+                handle = lambda: RatingHandler.handle_top_ratings(
+                    discord_user=discord_user,
+                    interaction_data=sub_command,
+                    guild_id=json_data.get("guild_id"),
+                )
             else:
                 current_app.logger.warn(f"Unknown sub command name: {sub_command_name}")
                 return jsonify({"type": InteractionCallbackType.PONG})
+            return deferred.respond(
+                json_data,
+                f"{command_name}.{sub_command_name}",
+                RatingHandler.as_guild_member(discord_user, json_data.get("guild_id"), handle),
+            )
         else:
             current_app.logger.warn(f"Unknown command name: {command_name}")
             return jsonify({"type": InteractionCallbackType.PONG})
@@ -49,5 +75,24 @@ class DiscordInteractionHandler:
     def handle_message_interaction(json_data: dict):
         discord_user: dict = json_data["member"]["user"]
         interaction_data: dict = json_data["data"]
-        return RatingHandler.handle_responded_to_comparison(discord_user=discord_user, interaction_data=interaction_data)
+        if interaction_data["custom_id"].startswith(f"{LIST_PAGE_PREFIX}:"):
+            return deferred.respond(
+                json_data,
+                "rating.list.page",
+                lambda: RatingHandler.handle_list_page(discord_user=discord_user, interaction_data=interaction_data),
+                deferred_type=InteractionCallbackType.DEFERRED_UPDATE_MESSAGE,
+            )
+        if interaction_data["custom_id"].startswith(f"{SORT_ANSWER_PREFIX}:"):
+            return deferred.respond(
+                json_data,
+                "sort_comparison",
+                lambda: RatingHandler.handle_sort_answer(discord_user=discord_user, interaction_data=interaction_data),
+            )
+        return deferred.respond(
+            json_data,
+            "comparison",
+            lambda: RatingHandler.handle_responded_to_comparison(
+                discord_user=discord_user, interaction_data=interaction_data
+            ),
+        )
 
@@ -1,22 +1,101 @@
-from typing import Dict, Optional, TYPE_CHECKING
+import json
+import os
+import threading
+from typing import Optional, TYPE_CHECKING
+
+from flask import current_app, jsonify
+
+from .resp import RespClient
+from .stores import (
+    DEFAULT_TTL_SECONDS,
+    SessionStore,
+    InMemorySessionStore,
+    PostgresSessionStore,
+    RedisSessionStore,
+)
 
 if TYPE_CHECKING:
     from ..ratings.rating_calculator import RatingCalculator
+    from ..ratings.sort_session import SortSession
+
+_store_lock = threading.Lock()
+
+
+def init_app(app):
+    app.add_url_rule("/ping/cache", "interaction_cache_stats", interaction_cache_stats)
+
+
+def interaction_cache_stats():
+    return jsonify(InteractionCache.get_store().stats())
+
 
 class InteractionCache:
-    fake_redis: Dict[str, "RatingCalculator"] = {}
+    @classmethod
+    def get_store(cls) -> SessionStore:
+        store = current_app.extensions.get("interaction_cache")
+        # Stores may hold sockets, so like the db pool they are never shared across a fork
+        if store is not None and store.pid == os.getpid():
+            return store
+
+        with _store_lock:
+            store = current_app.extensions.get("interaction_cache")
+            if store is None or store.pid != os.getpid():
+                store = cls._create_store()
+                current_app.extensions["interaction_cache"] = store
+        return store
+
+    @staticmethod
+    def _create_store() -> SessionStore:
+        config = current_app.config
+        backend = config.get("INTERACTION_CACHE_BACKEND", "memory")
+        ttl = config.get("INTERACTION_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)
+        if backend == "memory":
+            return InMemorySessionStore(
+                ttl=ttl,
+                max_entries=config.get("INTERACTION_CACHE_MAX_ENTRIES", 10000),
+                max_bytes=config.get("INTERACTION_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+            )
+        elif backend == "postgres":
+            return PostgresSessionStore(ttl=ttl)
+        elif backend == "redis":
+            return RedisSessionStore(
+                RespClient.from_url(
+                    config.get("INTERACTION_CACHE_REDIS_URL", "redis://localhost:6379/0")
+                ),
+                ttl=ttl,
+            )
+        raise ValueError(f"Unknown interaction cache backend: {backend}")
 
     @classmethod
     def get_rating_calculator(cls, cache_key: str) -> Optional["RatingCalculator"]:
-        return cls.fake_redis.get(cache_key)
+        from ..ratings.rating_calculator import RatingCalculator
+
+        payload = cls.get_store().get(cache_key)
+        if payload is None:
+            return None
+        return RatingCalculator.create_from_json(json.loads(payload))
 
     @classmethod
     def store_rating_calculator(cls, cache_key: str, rating_calculator: "RatingCalculator") -> None:
-        if cache_key in cls.fake_redis:
-            return
-        cls.fake_redis[cache_key] = rating_calculator
+        cls.get_store().set(cache_key, json.dumps(rating_calculator.to_json()))
 
     @classmethod
     def remove_rating_calculator(cls, cache_key: str) -> None:
-        if cache_key in cls.fake_redis:
-            del cls.fake_redis[cache_key]
+        cls.get_store().delete(cache_key)
+
+    @classmethod
+    def get_sort_session(cls, cache_key: str) -> Optional["SortSession"]:
+        from ..ratings.sort_session import SortSession
+
+        payload = cls.get_store().get(cache_key)
+        if payload is None:
+            return None
+        return SortSession.create_from_json(json.loads(payload))
+
+    @classmethod
+    def store_sort_session(cls, cache_key: str, sort_session: "SortSession") -> None:
+        cls.get_store().set(cache_key, json.dumps(sort_session.to_json()))
+
+    @classmethod
+    def remove_sort_session(cls, cache_key: str) -> None:
+        cls.get_store().delete(cache_key)
@@ -0,0 +1,121 @@
+import socket
+import threading
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """A minimal client for the Redis serialization protocol (RESP2).
+
+    Only what the session store needs is supported: sending commands and reading
+    simple strings, errors, integers, bulk strings and arrays. A single socket is
+    shared by all threads in the process and guarded by a lock.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        timeout: float = 2.0,
+    ):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._socket: Optional[socket.socket] = None
+        self._reader: Any = None
+
+    @classmethod
+    def from_url(cls, url: str, timeout: float = 2.0) -> "RespClient":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=db,
+            password=parsed.password,
+            timeout=timeout,
+        )
+
+    def execute(self, *args: Any) -> Any:
+        with self._lock:
+            try:
+                return self._execute(args)
+            except OSError:
+                # The server may have closed an idle connection; retry once on a fresh one
+                self._disconnect()
+                return self._execute(args)
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+    def _execute(self, args: tuple) -> Any:
+        if self._socket is None:
+            self._connect()
+        assert self._socket is not None
+        self._socket.sendall(self._encode(args))
+        return self._read_reply()
+
+    def _connect(self) -> None:
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._socket.makefile("rb")
+        if self.password:
+            self._socket.sendall(self._encode(("AUTH", self.password)))
+            self._read_reply()
+        if self.db:
+            self._socket.sendall(self._encode(("SELECT", self.db)))
+            self._read_reply()
+
+    def _disconnect(self) -> None:
+        if self._socket is not None:
+            try:
+                self._reader.close()
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._reader = None
+
+    @staticmethod
+    def _encode(args: tuple) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                data = arg
+            else:
+                data = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode("utf-8")
+        if prefix == b"-":
+            raise RespError(body.decode("utf-8"))
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length == -1:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(body)
+            if length == -1:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RespError(f"Unknown reply type: {line!r}")
@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+from ..db import get_pool
+from .resp import RespClient
+
+DEFAULT_TTL_SECONDS = 60 * 60
+
+
+class SessionStore(ABC):
+    """Where in-progress rating sessions live between interactions.
+
+    Sessions are stored as serialized strings so every backend behaves the same
+    way regardless of whether it is in-process or shared between workers. Every
+    session expires ``ttl`` seconds after it was last written.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS):
+        self.pid = os.getpid()
+        self.ttl = ttl
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, payload: str) -> None:
+        """Store the payload, replacing any existing value and resetting its TTL."""
+
+    @abstractmethod
+    def add(self, key: str, payload: str, ttl: float) -> bool:
+        """Store the payload for ttl seconds unless the key already holds one,
+        returning whether it was stored."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[stat] += amount
+
+    def _count_lookup(self, payload: Optional[str]) -> Optional[str]:
+        self._count("hits" if payload is not None else "misses")
+        return payload
+
+
+class InMemorySessionStore(SessionStore):
+    """Only visible to the current process, so it only works with a single worker.
+
+    Least recently used sessions are evicted once there are more than
+    ``max_entries`` of them or their payloads add up to more than ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (payload, expires_at), ordered from least to most recently used
+        self._sessions: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                payload = None
+            elif entry[1] <= time.monotonic():
+                self._remove(key)
+                self._count("expirations")
+                payload = None
+            else:
+                self._sessions.move_to_end(key)
+                payload = entry[0]
+        return self._count_lookup(payload)
+
+    def set(self, key: str, payload: str) -> None:
+        with self._lock:
+            self._store(key, payload, self.ttl)
+
+    def add(self, key: str, payload: str, ttl: float) -> bool:
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return False
+            self._store(key, payload, ttl)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats["entries"] = len(self._sessions)
+            stats["bytes"] = self._bytes
+        return stats
+
+    def _store(self, key: str, payload: str, ttl: float) -> None:
+        self._remove(key)
+        self._sessions[key] = (payload, time.monotonic() + ttl)
+        self._bytes += self._size_of(key, payload)
+        while self._sessions and (
+            len(self._sessions) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._sessions)))
+            self._count("evictions")
+
+    def _remove(self, key: str) -> None:
+        entry = self._sessions.pop(key, None)
+        if entry is not None:
+            self._bytes -= self._size_of(key, entry[0])
+
+    @staticmethod
+    def _size_of(key: str, payload: str) -> int:
+        # Payloads are json.dumps output, which is ASCII, so characters are bytes
+        return len(key) + len(payload)
+
+
+class PostgresSessionStore(SessionStore):
+    """Each operation takes its own connection from the pool and commits it, so
+    the session is saved whatever becomes of the request's transaction, and the
+    request's pending writes are never committed early."""
+
+    # Expired rows are filtered out on read and purged once every this many writes
+    PURGE_EVERY_WRITES = 100
+
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS):
+        super().__init__(ttl)
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        row = None
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT payload FROM rating_session"
+                " WHERE cache_key = %s AND expires_at > CURRENT_TIMESTAMP",
+                (key,),
+            )
+            row = cursor.fetchone()
+        return self._count_lookup(row["payload"] if row is not None else None)
+
+    def set(self, key: str, payload: str) -> None:
+        with self._cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO rating_session (cache_key, payload, expires_at)"
+                " VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')"
+                " ON CONFLICT (cache_key) DO UPDATE"
+                " SET payload = EXCLUDED.payload, expires_at = EXCLUDED.expires_at",
+                (key, payload, self.ttl),
+            )
+            if self._should_purge():
+                cursor.execute(
+                    "DELETE FROM rating_session WHERE expires_at <= CURRENT_TIMESTAMP"
+                )
+                self._count("expirations", cursor.rowcount)
+
+    def add(self, key: str, payload: str, ttl: float) -> bool:
+        with self._cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO rating_session (cache_key, payload, expires_at)"
+                " VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')"
+                " ON CONFLICT (cache_key) DO UPDATE"
+                " SET payload = EXCLUDED.payload, expires_at = EXCLUDED.expires_at"
+                " WHERE rating_session.expires_at <= CURRENT_TIMESTAMP"
+                " RETURNING cache_key",
+                (key, payload, ttl),
+            )
+            return cursor.fetchone() is not None
+
+    def delete(self, key: str) -> None:
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM rating_session WHERE cache_key = %s", (key,))
+
+    @staticmethod
+    @contextmanager
+    def _cursor() -> Iterator:
+        pool = get_pool()
+        connection = pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                yield cursor
+            connection.commit()
+        finally:
+            # Rolls back whatever wasn't committed
+            pool.release(connection)
+
+    def _should_purge(self) -> bool:
+        with self._stats_lock:
+            self._writes += 1
+            return self._writes % self.PURGE_EVERY_WRITES == 0
+
+
+class RedisSessionStore(SessionStore):
+    """Expiry is delegated to Redis; size limits are left to its maxmemory policy."""
+
+    KEY_PREFIX = "hearrd:rating_session:"
+
+    def __init__(self, client: RespClient, ttl: float = DEFAULT_TTL_SECONDS):
+        super().__init__(ttl)
+        self.client = client
+
+    def get(self, key: str) -> Optional[str]:
+        payload = self.client.execute("GET", self.KEY_PREFIX + key)
+        return self._count_lookup(payload.decode("utf-8") if payload is not None else None)
+
+    def set(self, key: str, payload: str) -> None:
+        self.client.execute("SET", self.KEY_PREFIX + key, payload, "PX", int(self.ttl * 1000))
+
+    def add(self, key: str, payload: str, ttl: float) -> bool:
+        reply = self.client.execute("SET", self.KEY_PREFIX + key, payload, "PX", int(ttl * 1000), "NX")
+        return reply is not None
+
+    def delete(self, key: str) -> None:
+        self.client.execute("DEL", self.KEY_PREFIX + key)
@@ -0,0 +1,70 @@
+import decimal
+from datetime import date
+from typing import Any
+
+from flask import Flask, Response
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:  # pragma: no cover - orjson is optional
+    HAS_ORJSON = False
+
+
+def init_app(app: Flask) -> None:
+    """Picks the app's JSON provider from the JSON_PROVIDER config.
+
+    "auto" (the default) uses orjson when it's installed, "orjson" requires it
+    and "default" keeps Flask's stdlib based provider.
+    """
+    provider = app.config.get("JSON_PROVIDER", "auto")
+    if provider == "default" or (provider == "auto" and not HAS_ORJSON):
+        return
+    if provider not in ("auto", "orjson"):
+        raise ValueError(f"Unknown JSON_PROVIDER: {provider}")
+    if not HAS_ORJSON:
+        raise RuntimeError("JSON_PROVIDER is orjson but orjson isn't installed")
+    app.json = OrjsonProvider(app)
+
+
+# Dates are passed through so they're formatted like Flask's default provider does
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if HAS_ORJSON else 0
+
+
+def _default(o: Any) -> Any:
+    # The extra types Flask's default provider handles that orjson doesn't
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """Encodes and decodes with orjson, which also serializes enums like
+    InteractionCallbackType natively."""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return self.dumps_bytes(obj).decode()
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        if self._app.debug:
+            body = orjson.dumps(obj, default=_default, option=_OPTIONS | orjson.OPT_INDENT_2)
+        else:
+            body = self.dumps_bytes(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
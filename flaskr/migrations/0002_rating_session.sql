@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS rating_session (
+  cache_key TEXT PRIMARY KEY,
+  payload TEXT NOT NULL,
+  expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS rating_session_expires_at_idx ON rating_session (expires_at);
@@ -0,0 +1,2 @@
+-- Adding a nullable column without a default only touches the catalog
+ALTER TABLE rating ADD COLUMN IF NOT EXISTS rank_key BIGINT;
@@ -0,0 +1,12 @@
+-- migrate: no-transaction
+-- Built concurrently so a live database keeps serving reads and writes.
+-- Matches the case-insensitive lookups in Rating.get_by_name_for_user.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS rating_user_lower_type_lower_name_key
+  ON rating (user_id, LOWER(type), LOWER(name));
+
+-- Serves the type-scoped listings in both storage modes
+CREATE INDEX CONCURRENTLY IF NOT EXISTS rating_user_type_value_idx
+  ON rating (user_id, type, value, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS rating_user_type_rank_key_idx
+  ON rating (user_id, type, rank_key, id);
@@ -0,0 +1,2 @@
+-- Discord's immutable snowflake id, unlike usernames which users can change
+ALTER TABLE hearrd_user ADD COLUMN IF NOT EXISTS discord_id BIGINT;
@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS hearrd_user_discord_id_key
+  ON hearrd_user (discord_id);
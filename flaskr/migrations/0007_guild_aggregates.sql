@@ -0,0 +1,42 @@
+-- Guild wide rankings, kept up to date as each member's ratings change.
+-- `flask rebuild-aggregates` recomputes them, e.g. after changing RATING_STORAGE_MODE.
+CREATE TABLE IF NOT EXISTS guild_member (
+  guild_id BIGINT NOT NULL,
+  user_id INTEGER NOT NULL,
+  joined TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (guild_id, user_id),
+  FOREIGN KEY (user_id) REFERENCES hearrd_user (id)
+);
+
+CREATE INDEX IF NOT EXISTS guild_member_user_id_idx ON guild_member (user_id);
+
+-- Each member's share of the aggregates, so it can be taken back out when their
+-- ratings change. Numeric so adding and removing shares never drifts.
+CREATE TABLE IF NOT EXISTS rating_contribution (
+  user_id INTEGER NOT NULL,
+  type_key TEXT NOT NULL,
+  name_key TEXT NOT NULL,
+  name TEXT NOT NULL,
+  percentile NUMERIC NOT NULL,
+  borda INTEGER NOT NULL,
+  PRIMARY KEY (user_id, type_key, name_key),
+  FOREIGN KEY (user_id) REFERENCES hearrd_user (id)
+);
+
+CREATE TABLE IF NOT EXISTS rating_aggregate (
+  guild_id BIGINT NOT NULL,
+  type_key TEXT NOT NULL,
+  name_key TEXT NOT NULL,
+  name TEXT NOT NULL,
+  rating_count INTEGER NOT NULL,
+  percentile_sum NUMERIC NOT NULL,
+  borda_score BIGINT NOT NULL,
+  PRIMARY KEY (guild_id, type_key, name_key)
+);
+
+-- Serve the top of a guild's list in either order without sorting
+CREATE INDEX IF NOT EXISTS rating_aggregate_borda_idx
+  ON rating_aggregate (guild_id, type_key, borda_score DESC, name_key);
+
+CREATE INDEX IF NOT EXISTS rating_aggregate_mean_idx
+  ON rating_aggregate (guild_id, type_key, (percentile_sum / NULLIF(rating_count, 0)) DESC, name_key);
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Serves recomputing an aggregate's name from the contributions still behind it
+CREATE INDEX CONCURRENTLY IF NOT EXISTS rating_contribution_type_name_idx
+  ON rating_contribution (type_key, name_key);
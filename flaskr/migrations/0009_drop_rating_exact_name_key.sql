@@ -0,0 +1,4 @@
+-- The case-insensitive index from 0004 already covers this constraint, and is
+-- the one GET_OR_CREATE_RATING_SQL resolves conflicts on. Left in place, two
+-- concurrent inserts of the same name still fail on it with a unique violation.
+ALTER TABLE rating DROP CONSTRAINT IF EXISTS rating_user_id_type_name_key;
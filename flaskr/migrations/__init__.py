@@ -0,0 +1,98 @@
+import os
+import re
+
+from flask import current_app
+
+MIGRATIONS_DIR = os.path.dirname(__file__)
+
+# Statements like CREATE INDEX CONCURRENTLY refuse to run inside a transaction
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+# Held while migrating so workers starting at the same time don't race each other
+_MIGRATION_LOCK_ID = 4242001
+
+
+class MigrationError(Exception):
+    pass
+
+
+def get_migration_files() -> list[str]:
+    return sorted(
+        f for f in os.listdir(MIGRATIONS_DIR) if re.match(r"^\d{4}_.*\.sql$", f)
+    )
+
+
+def migrate(conn) -> list[str]:
+    """Applies every migration that hasn't been applied yet, in order.
+
+    Returns the names of the migrations that were applied.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migration ("
+            " version TEXT PRIMARY KEY,"
+            " applied TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        cursor.execute("SELECT pg_advisory_lock(%s)", (_MIGRATION_LOCK_ID,))
+    conn.commit()
+
+    applied = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT version FROM schema_migration")
+            already_applied = {row["version"] for row in cursor.fetchall()}
+        conn.commit()
+
+        for filename in get_migration_files():
+            version = filename[: -len(".sql")]
+            if version in already_applied:
+                continue
+            current_app.logger.info(f"Applying migration {version}")
+            with open(os.path.join(MIGRATIONS_DIR, filename), encoding="utf8") as f:
+                sql = f.read()
+            if sql.startswith(NO_TRANSACTION_MARKER):
+                _apply_without_transaction(conn, version, sql)
+            else:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql)
+                    cursor.execute("INSERT INTO schema_migration (version) VALUES (%s)", (version,))
+                conn.commit()
+            applied.append(version)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (_MIGRATION_LOCK_ID,))
+        conn.commit()
+    return applied
+
+
+def _apply_without_transaction(conn, version: str, sql: str) -> None:
+    # Sent one statement at a time, since a multi-statement query is run as one transaction
+    statements = [s.strip() for s in re.split(r";\s*$", sql, flags=re.MULTILINE)]
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for statement in statements:
+                if _strip_comments(statement):
+                    cursor.execute(statement)
+            # A failed concurrent build leaves an invalid index behind that
+            # IF NOT EXISTS would then silently skip on the next attempt
+            cursor.execute(
+                "SELECT indexrelid::regclass::text AS name FROM pg_index WHERE NOT indisvalid"
+            )
+            invalid = [row["name"] for row in cursor.fetchall()]
+            if invalid:
+                raise MigrationError(
+                    f"Migration {version} left invalid indexes, drop them and migrate again: {invalid}"
+                )
+            cursor.execute("INSERT INTO schema_migration (version) VALUES (%s)", (version,))
+    finally:
+        conn.autocommit = False
+
+
+def _strip_comments(statement: str) -> str:
+    return "\n".join(
+        line for line in statement.splitlines() if not line.strip().startswith("--")
+    ).strip()
@@ -0,0 +1,338 @@
+"""Guild wide rankings of each type, kept up to date as members' ratings change.
+
+Every member of a guild contributes to ``rating_aggregate`` for each item they
+rated, by normalized type and name: a count, their percentile for it and a
+Borda score (how many of their other items it beats). Items are shown under the
+first in sort order of the spellings their members currently use. A member's
+current share is kept in ``rating_contribution``, so when one of their lists
+changes their old share is taken out of their guilds' rows and the new one
+added, in the same transaction as the change. Reading a guild's top items is
+then an index scan.
+
+The statements are shared with the async data layer in aio.py.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, TYPE_CHECKING
+
+from flask import current_app
+
+from flaskr.db import get_db
+
+if TYPE_CHECKING:
+    from .user import User
+
+AGGREGATE_SORTS = ("borda", "mean")
+
+# Serializes the aggregate updates for each user, alongside _MIGRATION_LOCK_ID
+_AGGREGATE_LOCK_NAMESPACE = 4242002
+
+# Cast since psycopg 3 may send Python ints as bigints, and the two key form takes ints
+LOCK_USER_SQL = "SELECT pg_advisory_xact_lock(%(lock_namespace)s::int, %(user_id)s::int)"
+IS_GUILD_MEMBER_SQL = (
+    "SELECT EXISTS (SELECT 1 FROM guild_member WHERE user_id = %(user_id)s) AS is_member"
+)
+
+# The first spelling of an aggregate's item among its guild's contributions
+_LIVE_NAME_SQL = (
+    "(SELECT MIN(o.name) FROM rating_contribution o JOIN guild_member og ON og.user_id = o.user_id"
+    " WHERE og.guild_id = {aggregate}.guild_id AND o.type_key = {aggregate}.type_key"
+    " AND o.name_key = {aggregate}.name_key{condition})"
+)
+
+# A member's spelling that was shown falls back to the others', or is kept until
+# _ADD_CONTRIBUTIONS_SQL recomputes it if nobody else contributes to the row
+_SUBTRACT_CONTRIBUTIONS_SQL = (
+    "UPDATE rating_aggregate a"
+    " SET rating_count = a.rating_count - 1,"
+    "  percentile_sum = a.percentile_sum - c.percentile,"
+    "  borda_score = a.borda_score - c.borda,"
+    "  name = CASE WHEN a.name = c.name THEN COALESCE("
+    + _LIVE_NAME_SQL.format(aggregate="a", condition=" AND o.user_id <> c.user_id")
+    + ", a.name) ELSE a.name END"
+    " FROM rating_contribution c JOIN guild_member g ON g.user_id = c.user_id"
+    " WHERE c.user_id = %(user_id)s AND c.type_key = %(type_key)s"
+    " AND a.guild_id = g.guild_id AND a.type_key = c.type_key AND a.name_key = c.name_key"
+)
+CLEAR_CONTRIBUTIONS_SQL = "DELETE FROM rating_contribution WHERE user_id = %(user_id)s"
+_DELETE_CONTRIBUTIONS_SQL = (
+    "DELETE FROM rating_contribution WHERE user_id = %(user_id)s AND type_key = %(type_key)s"
+)
+_ADD_CONTRIBUTIONS_SQL = (
+    "INSERT INTO rating_aggregate"
+    " (guild_id, type_key, name_key, name, rating_count, percentile_sum, borda_score)"
+    " SELECT g.guild_id, c.type_key, c.name_key, c.name, 1, c.percentile, c.borda"
+    " FROM rating_contribution c JOIN guild_member g ON g.user_id = c.user_id"
+    " WHERE c.user_id = %(user_id)s AND c.type_key = %(type_key)s"
+    " ON CONFLICT (guild_id, type_key, name_key) DO UPDATE SET"
+    "  name = " + _LIVE_NAME_SQL.format(aggregate="rating_aggregate", condition="") + ","
+    "  rating_count = rating_aggregate.rating_count + 1,"
+    "  percentile_sum = rating_aggregate.percentile_sum + EXCLUDED.percentile_sum,"
+    "  borda_score = rating_aggregate.borda_score + EXCLUDED.borda_score"
+)
+_DELETE_EMPTY_AGGREGATES_SQL = (
+    "DELETE FROM rating_aggregate"
+    " WHERE type_key = %(type_key)s AND rating_count <= 0"
+    " AND guild_id IN (SELECT guild_id FROM guild_member WHERE user_id = %(user_id)s)"
+)
+
+# Adds all of a new member's contributions to the guild in the same statement.
+# Nothing is taken away, so the first spelling is the lesser of the two.
+JOIN_GUILD_SQL = (
+    "WITH joined AS ("
+    "  INSERT INTO guild_member (guild_id, user_id) VALUES (%(guild_id)s, %(user_id)s)"
+    "  ON CONFLICT DO NOTHING"
+    "  RETURNING guild_id, user_id"
+    ")"
+    " INSERT INTO rating_aggregate"
+    " (guild_id, type_key, name_key, name, rating_count, percentile_sum, borda_score)"
+    " SELECT j.guild_id, c.type_key, c.name_key, c.name, 1, c.percentile, c.borda"
+    " FROM joined j JOIN rating_contribution c ON c.user_id = j.user_id"
+    " ON CONFLICT (guild_id, type_key, name_key) DO UPDATE SET"
+    "  name = LEAST(rating_aggregate.name, EXCLUDED.name),"
+    "  rating_count = rating_aggregate.rating_count + 1,"
+    "  percentile_sum = rating_aggregate.percentile_sum + EXCLUDED.percentile_sum,"
+    "  borda_score = rating_aggregate.borda_score + EXCLUDED.borda_score"
+)
+
+_ORDER_BY_SQL = {
+    "borda": "borda_score DESC, name_key",
+    "mean": "(percentile_sum / NULLIF(rating_count, 0)) DESC, name_key",
+}
+
+
+def contributions_sql(sort_column: str, all_types: bool = False, members_only: bool = False) -> str:
+    """Inserts a user's contributions for a type, or for every type, from their
+    ratings ordered by sort_column, or nothing when members_only and they are in
+    no guild.
+
+    Percentiles are spaced like the displayed values. Ratings that were never
+    placed, and lists too short to rank, don't contribute.
+    """
+    type_condition = "" if all_types else " AND LOWER(type) = %(type_key)s"
+    if members_only:
+        type_condition += " AND EXISTS (SELECT 1 FROM guild_member WHERE user_id = %(user_id)s)"
+    return (
+        "INSERT INTO rating_contribution (user_id, type_key, name_key, name, percentile, borda)"
+        " SELECT user_id, LOWER(type), LOWER(name), name, percentile, borda FROM ("
+        "  SELECT user_id, type, name, ROW_NUMBER() OVER w - 1 AS borda,"
+        "   ROUND((ROW_NUMBER() OVER w - 1) * 100.0"
+        "    / NULLIF(COUNT(*) OVER (PARTITION BY type) - 1, 0), 4) AS percentile"
+        f"  FROM rating WHERE user_id = %(user_id)s AND {sort_column} IS NOT NULL{type_condition}"
+        f"  WINDOW w AS (PARTITION BY type ORDER BY {sort_column}, id)"
+        " ) ranked WHERE percentile IS NOT NULL"
+    )
+
+
+class GuildMemberCache:
+    """A bounded, per-process LRU cache of the (guild, user) pairs already
+    recorded, so membership is written once rather than on every interaction.
+
+    It also remembers for non_member_ttl seconds the users found to be in no
+    guild, so their writes skip the aggregates entirely. A user who joins a guild
+    through another process in that time has the lists they change here left out
+    of its aggregates until their next change after it expires.
+    """
+
+    def __init__(self, max_entries: int, non_member_ttl: float = 60.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.non_member_ttl = non_member_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._members: "OrderedDict[tuple[int, int], bool]" = OrderedDict()
+        self._non_members: "OrderedDict[int, float]" = OrderedDict()
+
+    @staticmethod
+    def get() -> "GuildMemberCache":
+        cache = current_app.extensions.get("guild_member_cache")
+        if cache is None:
+            cache = current_app.extensions.setdefault(
+                "guild_member_cache",
+                GuildMemberCache(
+                    current_app.config.get("GUILD_MEMBER_CACHE_MAX_ENTRIES", 10000),
+                    current_app.config.get("GUILD_MEMBER_CACHE_NON_MEMBER_TTL_SECONDS", 60.0),
+                ),
+            )
+        return cache
+
+    def has_member(self, guild_id: int, user_id: int) -> bool:
+        with self._lock:
+            if (guild_id, user_id) not in self._members:
+                return False
+            self._members.move_to_end((guild_id, user_id))
+            return True
+
+    def store_member(self, guild_id: int, user_id: int) -> None:
+        with self._lock:
+            self._non_members.pop(user_id, None)
+            self._members[(guild_id, user_id)] = True
+            self._members.move_to_end((guild_id, user_id))
+            while len(self._members) > self.max_entries:
+                self._members.popitem(last=False)
+
+    def is_non_member(self, user_id: int) -> bool:
+        with self._lock:
+            expires_at = self._non_members.get(user_id)
+            if expires_at is None:
+                return False
+            if expires_at <= self._clock():
+                del self._non_members[user_id]
+                return False
+            return True
+
+    def store_non_member(self, user_id: int) -> None:
+        with self._lock:
+            self._non_members[user_id] = self._clock() + self.non_member_ttl
+            self._non_members.move_to_end(user_id)
+            while len(self._non_members) > self.max_entries:
+                self._non_members.popitem(last=False)
+
+
+class RatingAggregate:
+    def __init__(self, guild_id: int, type: str, name: str, rating_count: int, mean_percentile: float, borda_score: int):
+        self.guild_id = guild_id
+        self.type = type
+        self.name = name
+        self.rating_count = rating_count
+        self.mean_percentile = mean_percentile
+        self.borda_score = borda_score
+
+    def to_json(self):
+        return {
+            "guild_id": self.guild_id,
+            "type": self.type,
+            "name": self.name,
+            "rating_count": self.rating_count,
+            "mean_percentile": self.mean_percentile,
+            "borda_score": self.borda_score,
+        }
+
+    @classmethod
+    def create_from_db_row(cls, row: dict):
+        return cls(
+            guild_id=row["guild_id"],
+            type=row["type_key"],
+            name=row["name"],
+            rating_count=row["rating_count"],
+            mean_percentile=round(float(row["mean_percentile"]), 2),
+            borda_score=row["borda_score"],
+        )
+
+    @staticmethod
+    def get_sort_column() -> str:
+        from .rating import Rating
+
+        return "rank_key" if Rating.uses_rank_keys() else "value"
+
+    @staticmethod
+    def lock_params(user: "User", rating_type: Optional[str] = None) -> dict:
+        return {
+            "lock_namespace": _AGGREGATE_LOCK_NAMESPACE,
+            "user_id": user.id,
+            "type_key": rating_type.lower() if rating_type is not None else None,
+        }
+
+    @classmethod
+    def refresh_statements(cls) -> list[str]:
+        """Replaces the user's contributions for a type under LOCK_USER_SQL, and
+        ends by selecting IS_GUILD_MEMBER_SQL. Each statement does nothing for a
+        user in no guild, so they can all be sent at once."""
+        return [
+            LOCK_USER_SQL,
+            _SUBTRACT_CONTRIBUTIONS_SQL,
+            _DELETE_CONTRIBUTIONS_SQL,
+            contributions_sql(cls.get_sort_column(), members_only=True),
+            _ADD_CONTRIBUTIONS_SQL,
+            _DELETE_EMPTY_AGGREGATES_SQL,
+            IS_GUILD_MEMBER_SQL,
+        ]
+
+    @classmethod
+    def refresh_for_user(cls, cursor, user: "User", rating_type: str) -> None:
+        """Brings the aggregates of the user's guilds up to date with their list
+        of rating_type. Runs on the caller's cursor, in the caller's transaction.
+
+        Takes one round trip and about as long as rewriting the list itself,
+        whatever the size of the guilds, and nothing at all for users recently
+        found to be in no guild.
+        """
+        cache = GuildMemberCache.get()
+        if cache.is_non_member(user.id):
+            return
+        cursor.execute("; ".join(cls.refresh_statements()), cls.lock_params(user, rating_type))
+        if not cursor.fetchone()["is_member"]:
+            cache.store_non_member(user.id)
+
+    @classmethod
+    def join_guild(cls, guild_id: int, user: "User") -> None:
+        """Records that the user is in the guild, adding their ratings to its
+        aggregates the first time."""
+        cache = GuildMemberCache.get()
+        if cache.has_member(guild_id, user.id):
+            return
+
+        params = {**cls.lock_params(user), "guild_id": guild_id}
+        db = get_db()
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(LOCK_USER_SQL, params)
+                cursor.execute(IS_GUILD_MEMBER_SQL, params)
+                if not cursor.fetchone()["is_member"]:
+                    # Contributions are only kept for guild members, so start them now
+                    cursor.execute(CLEAR_CONTRIBUTIONS_SQL, params)
+                    cursor.execute(contributions_sql(cls.get_sort_column(), all_types=True), params)
+                cursor.execute(JOIN_GUILD_SQL, params)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        cache.store_member(guild_id, user.id)
+
+    @staticmethod
+    def top_query(guild_id: int, rating_type: str, limit: int, sort: str = "borda") -> tuple[str, tuple]:
+        if sort not in _ORDER_BY_SQL:
+            raise ValueError(f"sort must be one of {', '.join(AGGREGATE_SORTS)}")
+        return (
+            "SELECT guild_id, type_key, name, rating_count, borda_score,"
+            " percentile_sum / NULLIF(rating_count, 0) AS mean_percentile"
+            " FROM rating_aggregate WHERE guild_id = %s AND type_key = LOWER(%s)"
+            f" ORDER BY {_ORDER_BY_SQL[sort]} LIMIT %s",
+            (guild_id, rating_type, limit),
+        )
+
+    @classmethod
+    def get_top(cls, guild_id: int, rating_type: str, limit: int, sort: str = "borda") -> list["RatingAggregate"]:
+        """The guild's highest ranked items of a type, by total Borda score or
+        by mean percentile."""
+        with get_db().cursor() as cursor:
+            cursor.execute(*cls.top_query(guild_id, rating_type, limit, sort))
+            rows = cursor.fetchall()
+        return [cls.create_from_db_row(row) for row in rows]
+
+    @classmethod
+    def rebuild_all(cls) -> int:
+        """Recomputes every contribution and aggregate from scratch. Returns the
+        aggregate rows written."""
+        db = get_db()
+        try:
+            with db.cursor() as cursor:
+                cursor.execute("TRUNCATE rating_aggregate, rating_contribution")
+                cursor.execute("SELECT DISTINCT user_id FROM guild_member")
+                for row in cursor.fetchall():
+                    cursor.execute(
+                        contributions_sql(cls.get_sort_column(), all_types=True), {"user_id": row["user_id"]}
+                    )
+                cursor.execute(
+                    "INSERT INTO rating_aggregate"
+                    " (guild_id, type_key, name_key, name, rating_count, percentile_sum, borda_score)"
+                    " SELECT g.guild_id, c.type_key, c.name_key, MIN(c.name), COUNT(*), SUM(c.percentile), SUM(c.borda)"
+                    " FROM rating_contribution c JOIN guild_member g ON g.user_id = c.user_id"
+                    " GROUP BY g.guild_id, c.type_key, c.name_key"
+                )
+                written = cursor.rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return written
@@ -0,0 +1,294 @@
+"""Async versions of the Rating and User data access methods, for the ASGI entry point.
+
+They run the same statements as the sync models through psycopg 3 and return the
+same Rating and User objects, so everything above the data layer is shared.
+"""
+from typing import Any, Optional
+
+from flask import current_app
+from psycopg.errors import UniqueViolation
+
+from ..db_async import async_connection
+from .aggregate import (
+    CLEAR_CONTRIBUTIONS_SQL,
+    IS_GUILD_MEMBER_SQL,
+    JOIN_GUILD_SQL,
+    LOCK_USER_SQL,
+    GuildMemberCache,
+    RatingAggregate,
+    contributions_sql,
+)
+from .rating import (
+    CREATE_RATING_SQL,
+    GET_OR_CREATE_RATING_SQL,
+    RANK_KEY_GAP,
+    REBALANCE_RANK_KEYS_SQL,
+    Rating,
+    RatingPage,
+)
+from .user import (
+    UPSERT_FOR_DISCORD_ID_SQL,
+    User,
+    UserIdentityCache,
+    UsernameTakenException,
+    disambiguated_usernames,
+)
+
+
+class AsyncUser:
+    @classmethod
+    async def get_or_create_for_discord_user(cls, discord_user: dict) -> User:
+        username: str = discord_user["username"]
+        if "id" not in discord_user:
+            user = await cls.get_by_username(username)
+            if user is not None:
+                return user
+            return await cls.create_user(username)
+
+        discord_id = int(discord_user["id"])
+        cache = UserIdentityCache.get()
+        user = cache.get_user(discord_id)
+        if user is None:
+            user = await cls.upsert_for_discord_id(discord_id, username)
+            cache.store_user(discord_id, user)
+        return user
+
+    @classmethod
+    async def upsert_for_discord_id(cls, discord_id: int, username: str) -> User:
+        for candidate in disambiguated_usernames(discord_id, username):
+            row = await cls._upsert_for_discord_id(discord_id, candidate)
+            if row is not None:
+                return User.create_from_db_row(row)
+            current_app.logger.warning(f"Username {candidate} belongs to another Discord user")
+        raise UsernameTakenException(f"No free username for Discord user {discord_id}")
+
+    @staticmethod
+    async def _upsert_for_discord_id(discord_id: int, username: str) -> Optional[Any]:
+        row = None
+        for attempt in range(2):
+            try:
+                async with async_connection() as conn:
+                    cursor = await conn.execute(
+                        UPSERT_FOR_DISCORD_ID_SQL,
+                        {"discord_id": discord_id, "username": username},
+                    )
+                    row = await cursor.fetchone()
+                break
+            except UniqueViolation:
+                # Another request created this Discord user first, so it exists now
+                if attempt == 1:
+                    raise
+        return row
+
+    @classmethod
+    async def get_by_username(cls, username: str) -> Optional[User]:
+        async with async_connection() as conn:
+            cursor = await conn.execute(
+                "SELECT u.id, u.username FROM hearrd_user u WHERE u.username = %s",
+                (username,),
+            )
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        return User.create_from_db_row(row)
+
+    @classmethod
+    async def create_user(cls, username: str) -> User:
+        async with async_connection() as conn:
+            current_app.logger.info(f"Creating user {username}")
+            cursor = await conn.execute(
+                "INSERT INTO hearrd_user (username) VALUES (%s) RETURNING id, username",
+                (username,),
+            )
+            row = await cursor.fetchone()
+        return User.create_from_db_row(row)
+
+
+class AsyncRating:
+    @classmethod
+    async def get_or_create_rating(cls, user: User, rating_name: str, rating_type: str) -> Rating:
+        async with async_connection() as conn:
+            cursor = await conn.execute(
+                Rating._returning_sql(GET_OR_CREATE_RATING_SQL),
+                (user.id, rating_name, rating_type),
+            )
+            row = await cursor.fetchone()
+        return Rating.create_from_db_row(row)
+
+    @classmethod
+    async def create_rating(
+        cls, user: User, rating_name: str, rating_type: str, value: Optional[float] = None
+    ) -> Rating:
+        async with async_connection() as conn:
+            cursor = await conn.execute(
+                Rating._returning_sql(CREATE_RATING_SQL),
+                (user.id, rating_name, rating_type, value),
+            )
+            row = await cursor.fetchone()
+            await refresh_aggregates(conn, user, rating_type)
+        return Rating.create_from_db_row(row)
+
+    @classmethod
+    async def get_ratings_for_user_by_type(cls, user: User, rating_type: str) -> list[Rating]:
+        async with async_connection() as conn:
+            cursor = await conn.execute(Rating._ratings_by_type_sql(), (user.id, rating_type))
+            rows = await cursor.fetchall()
+        return [Rating.create_from_db_row(row) for row in rows]
+
+    @classmethod
+    async def get_ratings_page(
+        cls,
+        user: User,
+        rating_type: str,
+        page_size: int,
+        after: Optional[tuple[Any, int]] = None,
+        before: Optional[tuple[Any, int]] = None,
+    ) -> RatingPage:
+        async with async_connection() as conn:
+            cursor = await conn.execute(*Rating._ratings_page_query(user, rating_type, page_size, after, before))
+            rows = await cursor.fetchall()
+            ratings = [Rating.create_from_db_row(row) for row in rows[:page_size]]
+            if Rating.uses_rank_keys() and ratings:
+                cursor = await conn.execute(*Rating._rank_position_query(user, rating_type, ratings))
+                Rating._set_rank_values(ratings, await cursor.fetchone())
+        return Rating._make_page(ratings, len(rows) > page_size, after, before)
+
+    @classmethod
+    async def get_ratings_types_for_user(cls, user: User) -> list[str]:
+        async with async_connection() as conn:
+            cursor = await conn.execute(
+                "SELECT DISTINCT type FROM rating WHERE user_id = %s ORDER BY type ASC",
+                (user.id,),
+            )
+            rows = await cursor.fetchall()
+        return [row["type"] for row in rows]
+
+    @classmethod
+    async def get_by_id_for_user(cls, user: User, rating_id: int) -> Optional[Rating]:
+        async with async_connection() as conn:
+            cursor = await conn.execute(
+                f"{Rating._select_sql()} WHERE r.user_id = %s AND r.id = %s",
+                (user.id, rating_id),
+            )
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        return Rating.create_from_db_row(row)
+
+    @classmethod
+    async def get_by_name_for_user(cls, user: User, rating_name: str, rating_type: str) -> Optional[Rating]:
+        async with async_connection() as conn:
+            cursor = await conn.execute(
+                f"{Rating._select_sql()} WHERE r.user_id = %s AND LOWER(r.name) = LOWER(%s) AND LOWER(r.type) = LOWER(%s)",
+                (user.id, rating_name, rating_type),
+            )
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        return Rating.create_from_db_row(row)
+
+    @classmethod
+    async def update_all_with_new_ratings(cls, user: User, new_ratings: list[Rating]) -> None:
+        if not new_ratings:
+            return
+        async with async_connection() as conn:
+            # Arrays instead of execute_values, which psycopg 3 doesn't have
+            await conn.execute(
+                "UPDATE rating"
+                " SET value = new_rating.value"
+                " FROM unnest(%s::int[], %s::real[]) AS new_rating (id, value)"
+                " WHERE rating.id = new_rating.id AND rating.user_id = %s",
+                ([r.id for r in new_ratings], [r.value for r in new_ratings], user.id),
+            )
+            await refresh_aggregates(conn, user, new_ratings[0].type)
+
+    @classmethod
+    async def save_new_order(cls, user: User, new_ratings: list[Rating], placed_rating: Rating) -> None:
+        if not Rating.uses_rank_keys():
+            if len(new_ratings) > 1:
+                await cls.update_all_with_new_ratings(user, new_ratings)
+            return
+
+        idx = next(i for (i, r) in enumerate(new_ratings) if r.id == placed_rating.id)
+        lower = new_ratings[idx - 1] if idx > 0 else None
+        upper = new_ratings[idx + 1] if idx + 1 < len(new_ratings) else None
+        await cls.place_between(user, placed_rating, lower, upper)
+
+    @classmethod
+    async def place_between(
+        cls, user: User, rating: Rating, lower: Optional[Rating], upper: Optional[Rating]
+    ) -> None:
+        async with async_connection() as conn:
+            rank_key = await cls._get_rank_key_between(conn, lower, upper)
+            if rank_key is None:
+                await conn.execute(REBALANCE_RANK_KEYS_SQL, (RANK_KEY_GAP, user.id, rating.type))
+                rank_key = await cls._get_rank_key_between(conn, lower, upper)
+            await conn.execute(
+                "UPDATE rating SET rank_key = %s WHERE user_id = %s AND id = %s",
+                (rank_key, user.id, rating.id),
+            )
+            await refresh_aggregates(conn, user, rating.type)
+        rating.rank_key = rank_key
+
+    @staticmethod
+    async def _get_rank_key_between(conn, lower: Optional[Rating], upper: Optional[Rating]) -> Optional[int]:
+        neighbour_ids = [r.id for r in (lower, upper) if r is not None]
+        rank_keys = {}
+        if neighbour_ids:
+            cursor = await conn.execute(
+                "SELECT id, rank_key FROM rating WHERE id = ANY(%s)",
+                (neighbour_ids,),
+            )
+            rank_keys = {row["id"]: row["rank_key"] for row in await cursor.fetchall()}
+        return Rating.rank_key_between(
+            rank_keys.get(lower.id) if lower is not None else None,
+            rank_keys.get(upper.id) if upper is not None else None,
+        )
+
+    @classmethod
+    async def remove_rating_for_user(cls, user: User, rating: Rating) -> None:
+        async with async_connection() as conn:
+            await conn.execute(
+                "DELETE FROM rating WHERE user_id = %s AND id = %s",
+                (user.id, rating.id),
+            )
+            await refresh_aggregates(conn, user, rating.type)
+
+
+class AsyncRatingAggregate:
+    @classmethod
+    async def join_guild(cls, guild_id: int, user: User) -> None:
+        cache = GuildMemberCache.get()
+        if cache.has_member(guild_id, user.id):
+            return
+
+        params = {**RatingAggregate.lock_params(user), "guild_id": guild_id}
+        async with async_connection() as conn:
+            await conn.execute(LOCK_USER_SQL, params)
+            cursor = await conn.execute(IS_GUILD_MEMBER_SQL, params)
+            if not (await cursor.fetchone())["is_member"]:
+                await conn.execute(CLEAR_CONTRIBUTIONS_SQL, params)
+                await conn.execute(contributions_sql(RatingAggregate.get_sort_column(), all_types=True), params)
+            await conn.execute(JOIN_GUILD_SQL, params)
+        cache.store_member(guild_id, user.id)
+
+    @classmethod
+    async def get_top(cls, guild_id: int, rating_type: str, limit: int, sort: str = "borda") -> list[RatingAggregate]:
+        async with async_connection() as conn:
+            cursor = await conn.execute(*RatingAggregate.top_query(guild_id, rating_type, limit, sort))
+            rows = await cursor.fetchall()
+        return [RatingAggregate.create_from_db_row(row) for row in rows]
+
+
+async def refresh_aggregates(conn, user: User, rating_type: str) -> None:
+    """RatingAggregate.refresh_for_user on an async connection, pipelined since
+    psycopg 3 sends one statement per execute."""
+    cache = GuildMemberCache.get()
+    if cache.is_non_member(user.id):
+        return
+    params = RatingAggregate.lock_params(user, rating_type)
+    async with conn.pipeline():
+        for sql in RatingAggregate.refresh_statements():
+            cursor = await conn.execute(sql, params)
+    if not (await cursor.fetchone())["is_member"]:
+        cache.store_non_member(user.id)
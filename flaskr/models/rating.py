@@ -1,24 +1,95 @@
 import sqlite3
-from typing import Optional, TYPE_CHECKING
+import uuid
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Iterator, Optional, TYPE_CHECKING
 from typing_extensions import Self
 
+from flask import current_app
+from psycopg2.extras import execute_values
+
 if TYPE_CHECKING:
     from .user import User
 
 from flaskr.db import get_db
+from .aggregate import RatingAggregate
+
+# Space between neighbouring rank keys when they are (re)assigned. Every insert
+# between two neighbours halves the gap, so ~32 inserts can land in the same spot
+# before that user's list of that type has to be rebalanced.
+RANK_KEY_GAP = 2**32
+
+# SQL types of the columns lists are sorted by, for casting keyset cursors
+_KEY_COLUMN_TYPES = {"value": "real", "rank_key": "bigint"}
+
+# In rank key mode the displayed percentage is derived from each rating's position.
+# Ratings that were never placed (e.g. an abandoned first comparison) have no value.
+_RANK_VALUE_WINDOW_SQL = (
+    "CASE WHEN rank_key IS NULL THEN NULL ELSE ROUND("
+    "((ROW_NUMBER() OVER (PARTITION BY user_id, type ORDER BY rank_key, id) - 1) * 100.0"
+    " / NULLIF(COUNT(rank_key) OVER (PARTITION BY user_id, type) - 1, 0))::numeric, 2)::float8 END"
+)
+_RANK_VALUE_SUBQUERY_SQL = (
+    "CASE WHEN r.rank_key IS NULL THEN NULL ELSE ROUND(("
+    "(SELECT COUNT(*) FROM rating o WHERE o.user_id = r.user_id AND o.type = r.type"
+    " AND (o.rank_key, o.id) < (r.rank_key, r.id)) * 100.0"
+    " / NULLIF((SELECT COUNT(o.rank_key) FROM rating o"
+    " WHERE o.user_id = r.user_id AND o.type = r.type) - 1, 0))::numeric, 2)::float8 END"
+)
+
+
+# Shared with the async data layer in aio.py, which runs the same statements
+GET_OR_CREATE_RATING_SQL = (
+    "INSERT INTO rating (user_id, name, type) VALUES (%s, %s, %s)"
+    " ON CONFLICT (user_id, LOWER(type), LOWER(name)) DO UPDATE SET name = rating.name"
+)
+CREATE_RATING_SQL = "INSERT INTO rating (user_id, name, type, value) VALUES (%s, %s, %s, %s)"
+REBALANCE_RANK_KEYS_SQL = (
+    "UPDATE rating SET rank_key = spaced.rank_key"
+    " FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY rank_key, id) * %s AS rank_key"
+    "  FROM rating WHERE user_id = %s AND type = %s AND rank_key IS NOT NULL) spaced"
+    " WHERE rating.id = spaced.id"
+)
 
 
 class RatingExistsException(Exception):
     pass
 
 
+class RatingPage:
+    """One page of a user's ratings of a type, highest rated first.
+
+    Pages are keyset paginated on the rating's sort key (its value, or its rank
+    key in rank key mode) and id, so the first and last rating are the cursors
+    for the neighbouring pages.
+    """
+
+    def __init__(self, ratings: list["Rating"], has_previous: bool, has_next: bool):
+        self.ratings = ratings
+        self.has_previous = has_previous
+        self.has_next = has_next
+
+    @classmethod
+    def first_page_of(cls, ratings: list["Rating"], page_size: int) -> "RatingPage":
+        """The first page of an already loaded list of ratings, lowest first."""
+        return cls(list(reversed(ratings[-page_size:])), has_previous=False, has_next=len(ratings) > page_size)
+
+
 class Rating:
-    def __init__(self, id: int, type: str, name: str, value: float, user_id: int):
+    def __init__(
+        self,
+        id: int,
+        type: str,
+        name: str,
+        value: Optional[float],
+        user_id: int,
+        rank_key: Optional[int] = None,
+    ):
         self.id = id
         self.name = name
         self.type = type
         self.value = value
         self.user_id = user_id
+        self.rank_key = rank_key
 
     def __repr__(self):
         return f"Rating(id={self.id}, type={self.type}, name={self.name}, value={self.value}, user_id={self.user_id})"
@@ -38,6 +109,7 @@ class Rating:
             "type": self.type,
             "value": self.value,
             "user_id": self.user_id,
+            "rank_key": self.rank_key,
         }
 
     def update_value_property(self, new_value: float) -> Self:
@@ -52,30 +124,305 @@ class Rating:
             name=row["name"],
             value=row["value"],
             user_id=row["user_id"],
+            rank_key=row.get("rank_key"),
         )
 
+    @staticmethod
+    def uses_rank_keys() -> bool:
+        return current_app.config.get("RATING_STORAGE_MODE", "value") == "rank_key"
+
+    @classmethod
+    def _select_sql(cls) -> str:
+        """Columns for single rating lookups of the rating table aliased as r"""
+        if cls.uses_rank_keys():
+            return f"SELECT r.id, r.user_id, r.type, r.name, r.rank_key, {_RANK_VALUE_SUBQUERY_SQL} AS value FROM rating r"
+        return "SELECT * FROM rating r"
+
+    @classmethod
+    def _returning_sql(cls, write_sql: str) -> str:
+        """Makes an INSERT/UPDATE of the rating table return the rows it wrote"""
+        if cls.uses_rank_keys():
+            return (
+                f"WITH r AS ({write_sql} RETURNING *)"
+                f" SELECT r.id, r.user_id, r.type, r.name, r.rank_key, {_RANK_VALUE_SUBQUERY_SQL} AS value FROM r"
+            )
+        return f"{write_sql} RETURNING *"
+
+    @classmethod
+    def _ratings_by_type_sql(cls) -> str:
+        if cls.uses_rank_keys():
+            return (
+                "SELECT id, user_id, type, name, rank_key,"
+                f" {_RANK_VALUE_WINDOW_SQL} AS value"
+                " FROM rating WHERE user_id = %s AND type = %s"
+                " ORDER BY rank_key ASC NULLS LAST, id ASC"
+            )
+        return "SELECT * FROM rating WHERE user_id = %s AND type = %s ORDER BY value ASC, id ASC"
+
     @classmethod
     def get_or_create_rating(
         cls, user: "User", rating_name: str, rating_type: str
     ) -> Self:
-        rating = cls.get_by_name_for_user(
-            user=user, rating_name=rating_name, rating_type=rating_type
-        )
-        if rating is None:
-            rating = cls.create_rating(user, rating_name, rating_type=rating_type)
-        return rating
+        # One atomic statement, so concurrent adds of the same name can't collide.
+        # The no-op update is what makes RETURNING hand back an existing row.
+        db = get_db()
+        with db.cursor() as cursor:
+            cursor.execute(
+                cls._returning_sql(GET_OR_CREATE_RATING_SQL),
+                (user.id, rating_name, rating_type),
+            )
+            rating = cursor.fetchone()
+        db.commit()
+        return cls.create_from_db_row(rating)
+
+    @classmethod
+    def get_or_create_ratings(cls, user: "User", rating_names: list[str], rating_type: str) -> list[Self]:
+        """get_or_create_rating for several names in one statement, in the same order."""
+        if not rating_names:
+            return []
+        db = get_db()
+        with db.cursor() as cursor:
+            rows = execute_values(
+                cursor,
+                cls._returning_sql(
+                    "INSERT INTO rating (user_id, name, type) VALUES %s"
+                    " ON CONFLICT (user_id, LOWER(type), LOWER(name)) DO UPDATE SET name = rating.name"
+                ),
+                [(user.id, name, rating_type) for name in rating_names],
+                page_size=len(rating_names),
+                fetch=True,
+            )
+        db.commit()
+        by_name = {row["name"].lower(): cls.create_from_db_row(row) for row in rows}
+        return [by_name[name.lower()] for name in rating_names]
 
     @classmethod
     def get_ratings_for_user(cls, user: "User"):
         ratings = []
         with get_db().cursor() as cursor:
-            cursor.execute(
-                "SELECT * FROM rating WHERE user_id = %s ORDER BY value ASC",
-                (user.id,),
-            )
+            if cls.uses_rank_keys():
+                cursor.execute(
+                    "SELECT id, user_id, type, name, rank_key,"
+                    f" {_RANK_VALUE_WINDOW_SQL} AS value"
+                    " FROM rating WHERE user_id = %s"
+                    " ORDER BY rank_key ASC NULLS LAST, id ASC",
+                    (user.id,),
+                )
+            else:
+                cursor.execute(
+                    "SELECT * FROM rating WHERE user_id = %s ORDER BY value ASC",
+                    (user.id,),
+                )
             ratings = cursor.fetchall()
         return [cls.create_from_db_row(rating) for rating in ratings]
 
+    @classmethod
+    def get_ratings_for_user_by_type(cls, user: "User", rating_type: str):
+        ratings = []
+        with get_db().cursor() as cursor:
+            cursor.execute(cls._ratings_by_type_sql(), (user.id, rating_type))
+            ratings = cursor.fetchall()
+        return [cls.create_from_db_row(rating) for rating in ratings]
+
+    @classmethod
+    def get_ratings_page(
+        cls,
+        user: "User",
+        rating_type: str,
+        page_size: int,
+        after: Optional[tuple[Any, int]] = None,
+        before: Optional[tuple[Any, int]] = None,
+    ) -> RatingPage:
+        """Reads one page of ratings, starting after (lower than) or before
+        (higher than) the given (sort key, id) cursor."""
+        with get_db().cursor() as cursor:
+            cursor.execute(*cls._ratings_page_query(user, rating_type, page_size, after, before))
+            rows = cursor.fetchall()
+            ratings = [cls.create_from_db_row(row) for row in rows[:page_size]]
+            if cls.uses_rank_keys() and ratings:
+                cursor.execute(*cls._rank_position_query(user, rating_type, ratings))
+                cls._set_rank_values(ratings, cursor.fetchone())
+        return cls._make_page(ratings, len(rows) > page_size, after, before)
+
+    @staticmethod
+    def get_sort_key(rating: "Rating") -> Any:
+        return rating.rank_key if Rating.uses_rank_keys() else rating.value
+
+    @classmethod
+    def _ratings_page_query(
+        cls,
+        user: "User",
+        rating_type: str,
+        page_size: int,
+        after: Optional[tuple[Any, int]],
+        before: Optional[tuple[Any, int]],
+    ) -> tuple[str, tuple]:
+        if cls.uses_rank_keys():
+            # Values are derived from positions afterwards, see _set_rank_values
+            key = "rank_key"
+            columns = "id, user_id, type, name, rank_key, NULL::float8 AS value"
+        else:
+            key = "value"
+            columns = "*"
+        condition, params, order = cls._keyset_condition(key, after, before)
+        return (
+            f"SELECT {columns} FROM rating WHERE user_id = %s AND type = %s{condition} ORDER BY {order} LIMIT %s",
+            (user.id, rating_type, *params, page_size + 1),
+        )
+
+    @staticmethod
+    def _keyset_condition(
+        key: str, after: Optional[tuple[Any, int]], before: Optional[tuple[Any, int]]
+    ) -> tuple[str, list, str]:
+        """Returns the WHERE condition, its params and the ORDER BY for reading
+        highest first after a cursor, or lowest first before one.
+
+        Highest first is the reverse of the ascending NULLS LAST order lists use
+        everywhere else, which the (user_id, type, <key>, id) indexes serve.
+        Cursor keys are cast to the column's type, since a REAL read back as a
+        Python float no longer compares equal to itself as float8.
+        """
+        bound = f"%s::{_KEY_COLUMN_TYPES[key]}"
+        if before is not None:
+            before_key, before_id = before
+            if before_key is None:
+                return f" AND {key} IS NULL AND id > %s", [before_id], f"{key} ASC NULLS LAST, id ASC"
+            return (
+                f" AND (({key}, id) > ({bound}, %s) OR {key} IS NULL)",
+                [before_key, before_id],
+                f"{key} ASC NULLS LAST, id ASC",
+            )
+
+        order = f"{key} DESC NULLS FIRST, id DESC"
+        if after is None:
+            return "", [], order
+        after_key, after_id = after
+        if after_key is None:
+            return f" AND (({key} IS NULL AND id < %s) OR {key} IS NOT NULL)", [after_id], order
+        return f" AND ({key}, id) < ({bound}, %s)", [after_key, after_id], order
+
+    @classmethod
+    def stream_ratings_for_user_by_type(
+        cls,
+        user: "User",
+        rating_type: str,
+        after: Optional[tuple[Any, int]] = None,
+        itersize: int = 500,
+    ) -> Iterator["Rating"]:
+        """Yields a user's ratings of a type highest first, through a server side
+        cursor that only holds ``itersize`` rows in memory at a time."""
+        if cls.uses_rank_keys():
+            condition, params, order = cls._keyset_condition("rank_key", after, None)
+            sql = (
+                "SELECT * FROM (SELECT id, user_id, type, name, rank_key,"
+                f" {_RANK_VALUE_WINDOW_SQL} AS value"
+                " FROM rating WHERE user_id = %s AND type = %s) rating"
+                f" WHERE TRUE{condition} ORDER BY {order}"
+            )
+        else:
+            condition, params, order = cls._keyset_condition("value", after, None)
+            sql = f"SELECT * FROM rating WHERE user_id = %s AND type = %s{condition} ORDER BY {order}"
+
+        for row in cls._stream_rows(sql, (user.id, rating_type, *params), itersize):
+            yield cls.create_from_db_row(row)
+
+    @classmethod
+    def stream_export(
+        cls,
+        user: Optional["User"] = None,
+        rating_type: Optional[str] = None,
+        itersize: int = 500,
+    ) -> Iterator[dict]:
+        """Yields every rating, or a user's and/or a type's, with its user's
+        username. Ordered by user and type, then highest first like the lists."""
+        conditions = []
+        params: list = []
+        if user is not None:
+            conditions.append("user_id = %s")
+            params.append(user.id)
+        if rating_type is not None:
+            conditions.append("type = %s")
+            params.append(rating_type)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        if cls.uses_rank_keys():
+            key = "rank_key"
+            columns = f"id, user_id, type, name, rank_key, {_RANK_VALUE_WINDOW_SQL} AS value"
+        else:
+            key = "value"
+            columns = "id, user_id, type, name, rank_key, value"
+        sql = (
+            "SELECT u.username, r.* FROM"
+            f" (SELECT {columns} FROM rating{where}) r"
+            " JOIN hearrd_user u ON u.id = r.user_id"
+            f" ORDER BY r.user_id, r.type, r.{key} DESC NULLS FIRST, r.id DESC"
+        )
+        for row in cls._stream_rows(sql, tuple(params), itersize):
+            yield {"username": row["username"], **cls.create_from_db_row(row).to_json()}
+
+    @staticmethod
+    def _stream_rows(sql: str, params: tuple, itersize: int) -> Iterator[dict]:
+        db = get_db()
+        # Named cursors live on the server and need a transaction around them
+        cursor = db.cursor(name=f"stream_ratings_{uuid.uuid4().hex}")
+        cursor.itersize = itersize
+        try:
+            cursor.execute(sql, params)
+            yield from cursor
+        finally:
+            cursor.close()
+            db.rollback()
+
+    @staticmethod
+    def _rank_position_query(user: "User", rating_type: str, ratings: list["Rating"]) -> tuple[str, tuple]:
+        # A page's values only need the number of placed ratings below it, not a
+        # window over the user's whole list
+        placed = [r for r in ratings if r.rank_key is not None]
+        lowest = min(placed, key=lambda r: (r.rank_key, r.id)) if placed else None
+        return (
+            "SELECT COUNT(rank_key) AS total,"
+            " COUNT(*) FILTER (WHERE (rank_key, id) < (%s, %s)) AS below"
+            " FROM rating WHERE user_id = %s AND type = %s",
+            (
+                lowest.rank_key if lowest else None,
+                lowest.id if lowest else None,
+                user.id,
+                rating_type,
+            ),
+        )
+
+    @staticmethod
+    def _set_rank_values(ratings: list["Rating"], positions: dict) -> None:
+        """Matches the values _RANK_VALUE_WINDOW_SQL gives the same ratings, which
+        were read without one."""
+        placed = sorted((r for r in ratings if r.rank_key is not None), key=lambda r: (r.rank_key, r.id))
+        if positions["total"] < 2:
+            return
+        for idx, rating in enumerate(placed):
+            percentage = Decimal((positions["below"] + idx) * 100) / Decimal(positions["total"] - 1)
+            rating.value = float(percentage.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+
+    @staticmethod
+    def _make_page(
+        ratings: list["Rating"],
+        has_more: bool,
+        after: Optional[tuple[Any, int]],
+        before: Optional[tuple[Any, int]],
+    ) -> RatingPage:
+        if before is not None:
+            return RatingPage(list(reversed(ratings)), has_previous=has_more, has_next=True)
+        return RatingPage(ratings, has_previous=after is not None, has_next=has_more)
+
+    @staticmethod
+    def get_ids_in_created_order(user: "User", rating_type: str) -> list[int]:
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM rating WHERE user_id = %s AND type = %s ORDER BY created ASC, id ASC",
+                (user.id, rating_type),
+            )
+            rows = cursor.fetchall()
+        return [row["id"] for row in rows]
+
     @classmethod
     def get_ratings_types_for_user(cls, user: "User") -> list[str]:
         ratings = []
@@ -98,18 +445,20 @@ class Rating:
         db = get_db()
         with db.cursor() as cursor:
             cursor.execute(
-                "INSERT INTO rating (user_id, name, type, value) VALUES (%s, %s, %s, %s)",
+                cls._returning_sql(CREATE_RATING_SQL),
                 (user.id, rating_name, rating_type, value),
             )
+            rating = cursor.fetchone()
+            RatingAggregate.refresh_for_user(cursor, user, rating_type)
         db.commit()
-        return cls.get_by_name_for_user(user, rating_name, rating_type)
+        return cls.create_from_db_row(rating)
 
     @classmethod
     def get_by_id_for_user(cls, user: "User", rating_id: int):
         rating = None
         with get_db().cursor() as cursor:
             cursor.execute(
-                "SELECT * FROM rating WHERE user_id = %s AND id = %s",
+                f"{cls._select_sql()} WHERE r.user_id = %s AND r.id = %s",
                 (user.id, rating_id),
             )
             rating = cursor.fetchone()
@@ -122,7 +471,7 @@ class Rating:
         rating = None
         with get_db().cursor() as cursor:
             cursor.execute(
-                "SELECT * FROM rating WHERE user_id = %s AND LOWER(name) = LOWER(%s) AND LOWER(type) = LOWER(%s)",
+                f"{cls._select_sql()} WHERE r.user_id = %s AND LOWER(r.name) = LOWER(%s) AND LOWER(r.type) = LOWER(%s)",
                 (user.id, rating_name, rating_type),
             )
             rating = cursor.fetchone()
@@ -133,17 +482,216 @@ class Rating:
 
     @classmethod
     def update_all_with_new_ratings(cls, user: "User", new_ratings: list[Self]):
+        if not new_ratings:
+            return
         db = get_db()
         with db.cursor() as cursor:
-            for rating in new_ratings:
-                cursor.execute(
-                    "UPDATE rating"
-                    " SET value = %s"
-                    " WHERE name = %s AND user_id = %s AND type = %s",
-                    (rating.value, rating.name, user.id, rating.type),
+            # A single statement (and round trip) for the whole list
+            execute_values(
+                cursor,
+                "UPDATE rating"
+                " SET value = new_rating.value"
+                " FROM (VALUES %s) AS new_rating (id, user_id, value)"
+                " WHERE rating.id = new_rating.id AND rating.user_id = new_rating.user_id",
+                [(rating.id, user.id, rating.value) for rating in new_ratings],
+                template="(%s, %s, %s::real)",
+                page_size=len(new_ratings),
+            )
+            RatingAggregate.refresh_for_user(cursor, user, new_ratings[0].type)
+        db.commit()
+
+    @classmethod
+    def save_new_order(cls, user: "User", new_ratings: list[Self], placed_rating: Self):
+        """Persists new_ratings (lowest first) after placed_rating was inserted into it.
+
+        In rank key mode only placed_rating's row is written.
+        """
+        if not cls.uses_rank_keys():
+            if len(new_ratings) > 1:
+                cls.update_all_with_new_ratings(user, new_ratings)
+            return
+
+        idx = next(i for (i, r) in enumerate(new_ratings) if r.id == placed_rating.id)
+        lower = new_ratings[idx - 1] if idx > 0 else None
+        upper = new_ratings[idx + 1] if idx + 1 < len(new_ratings) else None
+        cls.place_between(user, placed_rating, lower, upper)
+
+    @classmethod
+    def place_between(
+        cls,
+        user: "User",
+        rating: Self,
+        lower: Optional[Self],
+        upper: Optional[Self],
+    ) -> None:
+        db = get_db()
+        with db.cursor() as cursor:
+            rank_key = cls._get_rank_key_between(cursor, lower, upper)
+            if rank_key is None:
+                cls._rebalance_rank_keys(cursor, user, rating.type)
+                rank_key = cls._get_rank_key_between(cursor, lower, upper)
+            cursor.execute(
+                "UPDATE rating SET rank_key = %s WHERE user_id = %s AND id = %s",
+                (rank_key, user.id, rating.id),
+            )
+            RatingAggregate.refresh_for_user(cursor, user, rating.type)
+        db.commit()
+        rating.rank_key = rank_key
+
+    @staticmethod
+    def _get_rank_key_between(cursor, lower: Optional["Rating"], upper: Optional["Rating"]) -> Optional[int]:
+        # Read the neighbours' current keys, they may have moved since the rating started
+        neighbour_ids = [r.id for r in (lower, upper) if r is not None]
+        rank_keys = {}
+        if neighbour_ids:
+            cursor.execute(
+                "SELECT id, rank_key FROM rating WHERE id = ANY(%s)",
+                (neighbour_ids,),
+            )
+            rank_keys = {row["id"]: row["rank_key"] for row in cursor.fetchall()}
+        return Rating.rank_key_between(
+            rank_keys.get(lower.id) if lower is not None else None,
+            rank_keys.get(upper.id) if upper is not None else None,
+        )
+
+    @staticmethod
+    def rank_key_between(lower_key: Optional[int], upper_key: Optional[int]) -> Optional[int]:
+        """Returns None when there is no room left between the two keys."""
+        if lower_key is None:
+            return 0 if upper_key is None else upper_key - RANK_KEY_GAP
+        if upper_key is None:
+            return lower_key + RANK_KEY_GAP
+        if upper_key - lower_key < 2:
+            return None
+        return (lower_key + upper_key) // 2
+
+    @staticmethod
+    def _rebalance_rank_keys(cursor, user: "User", rating_type: str) -> None:
+        cursor.execute(REBALANCE_RANK_KEYS_SQL, (RANK_KEY_GAP, user.id, rating_type))
+
+    @staticmethod
+    def assign_rank_keys_from_values() -> int:
+        """Gives every rating a rank key matching its current value, for switching
+        an existing database over to rank key mode. Returns the rows updated."""
+        db = get_db()
+        with db.cursor() as cursor:
+            cursor.execute(
+                "UPDATE rating SET rank_key = spaced.rank_key"
+                " FROM (SELECT id, ROW_NUMBER() OVER"
+                "  (PARTITION BY user_id, type ORDER BY value ASC NULLS FIRST, id) * %s AS rank_key"
+                "  FROM rating) spaced"
+                " WHERE rating.id = spaced.id",
+                (RANK_KEY_GAP,),
+            )
+            updated = cursor.rowcount
+        db.commit()
+        return updated
+
+    @classmethod
+    def import_ordered(
+        cls,
+        user: "User",
+        rating_type: str,
+        names: list[str],
+        replace: bool = False,
+    ) -> int:
+        """Saves names as a user's ratings of a type, highest rated first, in one
+        transaction. Returns the rows written.
+
+        Existing ratings with the same names are moved to their new position. The
+        user's other ratings of the type are removed with ``replace``, and otherwise
+        keep their order below the imported ones.
+        """
+        lowered = [name.lower() for name in names]
+        if len(set(lowered)) != len(lowered):
+            raise ValueError("Ratings to import must have unique names")
+
+        db = get_db()
+        try:
+            with db.cursor() as cursor:
+                if replace:
+                    cursor.execute(
+                        "DELETE FROM rating WHERE user_id = %s AND LOWER(type) = LOWER(%s)"
+                        " AND NOT LOWER(name) = ANY(%s)",
+                        (user.id, rating_type, lowered),
+                    )
+                    other_ids: list[int] = []
+                else:
+                    other_ids = cls._get_other_placed_ids(cursor, user, rating_type, lowered)
+                positions = cls._spaced_positions(len(other_ids) + len(names))
+                cls._write_positions(cursor, user, other_ids, positions[: len(other_ids)])
+                rows = [
+                    (user.id, name, rating_type, value, rank_key)
+                    for (name, (value, rank_key)) in zip(reversed(names), positions[len(other_ids):])
+                ]
+                execute_values(
+                    cursor,
+                    "INSERT INTO rating (user_id, name, type, value, rank_key) VALUES %s"
+                    " ON CONFLICT (user_id, LOWER(type), LOWER(name))"
+                    " DO UPDATE SET value = EXCLUDED.value, rank_key = EXCLUDED.rank_key",
+                    rows,
+                    template="(%s, %s, %s, %s::real, %s)",
+                    page_size=current_app.config.get("RATING_IMPORT_PAGE_SIZE", 1000),
                 )
+                RatingAggregate.refresh_for_user(cursor, user, rating_type)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return len(rows)
+
+    @classmethod
+    def save_order(cls, user: "User", rating_type: str, rating_ids: list[int]) -> None:
+        """Rewrites the value and rank key of every rating in rating_ids, lowest
+        first, with a single statement."""
+        if not rating_ids:
+            return
+        db = get_db()
+        with db.cursor() as cursor:
+            cls._write_positions(cursor, user, rating_ids, cls._spaced_positions(len(rating_ids)))
+            RatingAggregate.refresh_for_user(cursor, user, rating_type)
         db.commit()
 
+    @staticmethod
+    def _write_positions(
+        cursor, user: "User", rating_ids: list[int], positions: list[tuple[Optional[float], int]]
+    ) -> None:
+        if not rating_ids:
+            return
+        execute_values(
+            cursor,
+            "UPDATE rating"
+            " SET value = new_rating.value, rank_key = new_rating.rank_key"
+            " FROM (VALUES %s) AS new_rating (id, user_id, value, rank_key)"
+            " WHERE rating.id = new_rating.id AND rating.user_id = new_rating.user_id",
+            [(rating_id, user.id, value, rank_key) for (rating_id, (value, rank_key)) in zip(rating_ids, positions)],
+            template="(%s, %s, %s::real, %s::bigint)",
+            page_size=len(rating_ids),
+        )
+
+    @classmethod
+    def _get_other_placed_ids(cls, cursor, user: "User", rating_type: str, lowered: list[str]) -> list[int]:
+        """The ids of the user's placed ratings of a type not named in lowered,
+        lowest first, locked until the import commits."""
+        key = "rank_key" if cls.uses_rank_keys() else "value"
+        cursor.execute(
+            "SELECT id FROM rating WHERE user_id = %s AND LOWER(type) = LOWER(%s)"
+            f" AND NOT LOWER(name) = ANY(%s) AND {key} IS NOT NULL"
+            f" ORDER BY {key}, id FOR UPDATE",
+            (user.id, rating_type, lowered),
+        )
+        return [row["id"] for row in cursor.fetchall()]
+
+    @staticmethod
+    def _spaced_positions(count: int) -> list[tuple[Optional[float], int]]:
+        """(value, rank key) for each of count ratings lowest first, spaced like
+        the calculator and rebalancing space them."""
+        denominator = count - 1
+        return [
+            (round((idx / denominator) * 100, 2) if denominator else None, (idx + 1) * RANK_KEY_GAP)
+            for idx in range(count)
+        ]
+
     @classmethod
     def remove_rating_for_user(cls, user: "User", rating: Self):
         db = get_db()
@@ -152,4 +700,5 @@ class Rating:
                 "DELETE FROM rating WHERE user_id = %s AND id = %s",
                 (user.id, rating.id),
             )
+            RatingAggregate.refresh_for_user(cursor, user, rating.type)
         db.commit()
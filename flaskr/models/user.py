@@ -1,9 +1,70 @@
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
 from flask import current_app
+from psycopg2.errors import UniqueViolation
 
 from flaskr.db import get_db
 from .rating import Rating
 
+# Shared with the async data layer in aio.py
+UPSERT_FOR_DISCORD_ID_SQL = (
+    "WITH existing AS ("
+    "  SELECT id, username FROM hearrd_user WHERE discord_id = %(discord_id)s"
+    "), created AS ("
+    "  INSERT INTO hearrd_user (username, discord_id)"
+    "  SELECT %(username)s, %(discord_id)s WHERE NOT EXISTS (SELECT 1 FROM existing)"
+    "  ON CONFLICT (username) DO UPDATE SET discord_id = EXCLUDED.discord_id"
+    "  WHERE hearrd_user.discord_id IS NULL"
+    "  RETURNING id, username"
+    ")"
+    " SELECT id, username FROM existing UNION ALL SELECT id, username FROM created"
+)
+
+
+class UsernameTakenException(Exception):
+    pass
+
+
+def disambiguated_usernames(discord_id: int, username: str) -> Tuple[str, str]:
+    """The usernames to try, in order, for a Discord user. The upsert never returns a
+    row owned by another Discord id, so a taken name falls through to the next one."""
+    return (username, f"{username}#{discord_id}")
+
+
+class UserIdentityCache:
+    """A bounded, per-process LRU cache of users keyed by their Discord snowflake id."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[int, User]" = OrderedDict()
+
+    @staticmethod
+    def get() -> "UserIdentityCache":
+        cache = current_app.extensions.get("user_identity_cache")
+        if cache is None:
+            cache = current_app.extensions.setdefault(
+                "user_identity_cache",
+                UserIdentityCache(current_app.config.get("USER_CACHE_MAX_ENTRIES", 10000)),
+            )
+        return cache
+
+    def get_user(self, discord_id: int) -> Optional["User"]:
+        with self._lock:
+            user = self._users.get(discord_id)
+            if user is not None:
+                self._users.move_to_end(discord_id)
+            return user
+
+    def store_user(self, discord_id: int, user: "User") -> None:
+        with self._lock:
+            self._users[discord_id] = user
+            self._users.move_to_end(discord_id)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+
+
 class User:
     def __init__(self, user_id: int, username: str):
         self.id = user_id
@@ -18,11 +79,55 @@ class User:
     @classmethod
     def get_or_create_for_discord_user(cls, discord_user: dict):
         username: str = discord_user["username"]
-        user = cls.get_by_username(username)
-        if user is not None:
-            return user
-        
-        return cls.create_user(username)
+        if "id" not in discord_user:
+            user = cls.get_by_username(username)
+            if user is not None:
+                return user
+            return cls.create_user(username)
+
+        discord_id = int(discord_user["id"])
+        cache = UserIdentityCache.get()
+        user = cache.get_user(discord_id)
+        if user is None:
+            user = cls.upsert_for_discord_id(discord_id, username)
+            cache.store_user(discord_id, user)
+        return user
+
+    @classmethod
+    def upsert_for_discord_id(cls, discord_id: int, username: str):
+        """Finds or creates the user for a Discord id in a single statement.
+
+        Users created before Discord ids were stored are claimed by username. When the
+        username already belongs to a different Discord user, the new user is created
+        under a name disambiguated by its Discord id instead.
+        """
+        for candidate in disambiguated_usernames(discord_id, username):
+            user = cls._upsert_for_discord_id(discord_id, candidate)
+            if user is not None:
+                return cls.create_from_db_row(user)
+            current_app.logger.warning(f"Username {candidate} belongs to another Discord user")
+        raise UsernameTakenException(f"No free username for Discord user {discord_id}")
+
+    @staticmethod
+    def _upsert_for_discord_id(discord_id: int, username: str) -> Optional[dict]:
+        db = get_db()
+        user = None
+        for attempt in range(2):
+            try:
+                with db.cursor() as cursor:
+                    cursor.execute(
+                        UPSERT_FOR_DISCORD_ID_SQL,
+                        {"discord_id": discord_id, "username": username},
+                    )
+                    user = cursor.fetchone()
+                db.commit()
+                break
+            except UniqueViolation:
+                # Another request created this Discord user first, so it exists now
+                db.rollback()
+                if attempt == 1:
+                    raise
+        return user
 
     @classmethod
     def get_by_id(cls, user_id: int):
@@ -70,7 +175,7 @@ class User:
         return Rating.get_ratings_types_for_user(self)
 
     def get_ratings(self, rating_type: str) -> list[Rating]:
-        return [r for r in self.get_all_ratings() if r.type == rating_type]
+        return Rating.get_ratings_for_user_by_type(self, rating_type)
     
     def get_all_ratings(self) -> list[Rating]:
         return Rating.get_ratings_for_user(self)
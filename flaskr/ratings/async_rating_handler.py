@@ -0,0 +1,233 @@
+import asyncio
+import functools
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from flask import current_app, Response
+
+from ..discord import InteractionCallbackType
+from ..models.aio import AsyncRating, AsyncRatingAggregate, AsyncUser
+from .custom_id import decode_list_page, get_list_version
+from .rating_calculator import RatingCalculator, StaleComparisonException
+from .rating_handler import (
+    RatingHandler,
+    RatingJsonResponder,
+    get_comparison_width,
+    get_list_page_size,
+    get_page_bounds,
+    get_top_limit,
+)
+
+
+T = TypeVar("T")
+
+
+class AsyncRatingHandler:
+    """RatingHandler for the ASGI entry point, returning response dicts.
+
+    Ratings run on the event loop with the async data layer, and sessions are
+    carried in signed custom_ids. The cache stores are blocking, so writing a
+    session to the InteractionCache fallback runs on a thread. So does anything
+    that has to read the cache: legacy custom_ids, comparisons sent before the
+    list changed, and the batch sort sessions of add_many, rerank and their
+    answers, which run the sync handler whole.
+    """
+
+    @staticmethod
+    async def handle_add_rating(discord_user: dict, interaction_data: dict) -> dict:
+        rating_type: str = RatingHandler._parse_rating_type(interaction_data["options"][0]["value"])
+        rating_name: str = RatingHandler._parse_rating_name(interaction_data["options"][1]["value"])
+        user = await AsyncUser.get_or_create_for_discord_user(discord_user)
+
+        ratings_for_user = await AsyncRating.get_ratings_for_user_by_type(user, rating_type)
+        new_rating = await AsyncRating.get_or_create_rating(
+            user=user, rating_name=rating_name, rating_type=rating_type
+        )
+        other_items = [r for r in ratings_for_user if r.id != new_rating.id]
+        use_cache = RatingHandler._should_cache_sessions()
+        begin_rating = functools.partial(
+            RatingCalculator.begin_rating,
+            item_being_rated=new_rating,
+            other_items=other_items,
+            use_cache=use_cache,
+            width=get_comparison_width(),
+        )
+        rating_calculator = await run_in_app_context(begin_rating) if use_cache else begin_rating()
+        next_comparison = rating_calculator.get_next_comparison()
+        if next_comparison is None:
+            await AsyncRating.save_new_order(user=user, new_ratings=[new_rating], placed_rating=new_rating)
+            if use_cache:
+                await run_in_app_context(rating_calculator.complete)
+            return RatingJsonResponder.get_first_rating_json(rating_type)
+
+        return RatingJsonResponder.get_comparison_json(
+            rating_calculator.item_being_rated,
+            next_comparison,
+            rating_calculator.get_list_version(),
+        )
+
+    @staticmethod
+    async def handle_remove_rating(discord_user: dict, interaction_data: dict) -> dict:
+        rating_type: str = RatingHandler._parse_rating_type(interaction_data["options"][0]["value"])
+        rating_name: str = RatingHandler._parse_rating_name(interaction_data["options"][1]["value"])
+        user = await AsyncUser.get_or_create_for_discord_user(discord_user)
+
+        rating = await AsyncRating.get_by_name_for_user(
+            user=user, rating_name=rating_name, rating_type=rating_type
+        )
+        if rating is None:
+            return RatingJsonResponder.get_not_found_json(
+                f"**{rating_name}** of type **{rating_type}**",
+                discord_user["username"],
+            )
+
+        await AsyncRating.remove_rating_for_user(user=user, rating=rating)
+        return RatingJsonResponder.get_removed_success_json(rating)
+
+    @staticmethod
+    async def handle_list_ratings(discord_user: dict, interaction_data: dict) -> dict:
+        rating_type: str = RatingHandler._parse_rating_type(interaction_data["options"][0]["value"])
+        user = await AsyncUser.get_or_create_for_discord_user(discord_user)
+
+        page = await AsyncRating.get_ratings_page(user, rating_type, get_list_page_size())
+        return RatingJsonResponder.get_ratings_page_json(rating_type, page)
+
+    @staticmethod
+    async def handle_list_page(discord_user: dict, interaction_data: dict) -> dict:
+        cursor = decode_list_page(interaction_data["custom_id"])
+        if cursor is None:
+            raise Exception(f"Could not parse custom ID: {interaction_data['custom_id']}")
+        user = await AsyncUser.get_or_create_for_discord_user(discord_user)
+
+        page = await AsyncRating.get_ratings_page(
+            user, cursor.rating_type, get_list_page_size(), *get_page_bounds(cursor)
+        )
+        if not page.ratings:
+            page = await AsyncRating.get_ratings_page(user, cursor.rating_type, get_list_page_size())
+        return RatingJsonResponder.get_ratings_page_json(
+            cursor.rating_type, page, InteractionCallbackType.UPDATE_MESSAGE
+        )
+
+    @staticmethod
+    async def handle_list_types(discord_user: dict) -> dict:
+        user = await AsyncUser.get_or_create_for_discord_user(discord_user)
+
+        rating_types = await AsyncRating.get_ratings_types_for_user(user)
+        return RatingJsonResponder.get_types_list_json(rating_types)
+
+    @staticmethod
+    async def handle_responded_to_comparison(discord_user: dict, interaction_data: dict) -> dict:
+        (rating_id, comparison, state) = RatingHandler._parse_custom_id(interaction_data["custom_id"])
+        if state is None:
+            # Legacy custom_ids only work through the cache
+            return await run_sync_handler(
+                RatingHandler.handle_responded_to_comparison,
+                discord_user=discord_user,
+                interaction_data=interaction_data,
+            )
+
+        user = await AsyncUser.get_or_create_for_discord_user(discord_user)
+        rating = await AsyncRating.get_by_id_for_user(user=user, rating_id=rating_id)
+        if rating is None:
+            return RatingJsonResponder.get_not_found_json(f"id:{rating_id}", discord_user["username"])
+
+        other_items = [
+            r for r in await AsyncRating.get_ratings_for_user_by_type(user, rating.type) if r.id != rating.id
+        ]
+        if get_list_version(other_items) != state.list_version:
+            # The list changed since the button was sent, so the cache may know better
+            return await run_sync_handler(
+                RatingHandler.handle_responded_to_comparison,
+                discord_user=discord_user,
+                interaction_data=interaction_data,
+            )
+
+        try:
+            rating_calculator = RatingCalculator.resume_rating(
+                item_being_rated=rating,
+                other_items=other_items,
+                lowest_possible_idx=state.lowest_possible_idx,
+                highest_possible_idx=state.highest_possible_idx,
+                comparison=comparison,
+                strategy=state.strategy,
+                step=state.step,
+                width=state.width,
+            )
+        except StaleComparisonException:
+            return RatingJsonResponder.get_stale_comparison_json(rating)
+
+        next_comparison = rating_calculator.get_next_comparison()
+        if next_comparison:
+            return RatingJsonResponder.get_comparison_json(
+                rating_calculator.item_being_rated,
+                next_comparison,
+                rating_calculator.get_list_version(),
+            )
+
+        new_ratings = rating_calculator.get_overall_ratings()
+        await AsyncRating.save_new_order(user=user, new_ratings=new_ratings, placed_rating=rating)
+        if RatingHandler._should_cache_sessions():
+            # The rating may have been cached when it began
+            await run_in_app_context(rating_calculator.complete)
+        return RatingJsonResponder.get_ratings_list_json(rating.type, new_ratings)
+
+    @staticmethod
+    async def handle_add_many_ratings(discord_user: dict, interaction_data: dict) -> dict:
+        # Sort sessions live in the InteractionCache, and read it on every answer
+        return await run_sync_handler(
+            RatingHandler.handle_add_many_ratings, discord_user=discord_user, interaction_data=interaction_data
+        )
+
+    @staticmethod
+    async def handle_rerank_ratings(discord_user: dict, interaction_data: dict) -> dict:
+        return await run_sync_handler(
+            RatingHandler.handle_rerank_ratings, discord_user=discord_user, interaction_data=interaction_data
+        )
+
+    @staticmethod
+    async def handle_sort_answer(discord_user: dict, interaction_data: dict) -> dict:
+        return await run_sync_handler(
+            RatingHandler.handle_sort_answer, discord_user=discord_user, interaction_data=interaction_data
+        )
+
+    @staticmethod
+    async def handle_top_ratings(discord_user: dict, interaction_data: dict, guild_id: Optional[str]) -> dict:
+        if guild_id is None:
+            return RatingJsonResponder.get_top_outside_guild_json()
+        rating_type: str = RatingHandler._parse_rating_type(interaction_data["options"][0]["value"])
+        options = {option["name"]: option["value"] for option in interaction_data["options"][1:]}
+
+        aggregates = await AsyncRatingAggregate.get_top(
+            int(guild_id), rating_type, options.get("limit", get_top_limit()), options.get("sort", "borda")
+        )
+        return RatingJsonResponder.get_top_json(rating_type, aggregates)
+
+    @staticmethod
+    def as_guild_member(
+        discord_user: dict, guild_id: Optional[str], handle: Callable[[], Awaitable[dict]]
+    ) -> Callable[[], Awaitable[dict]]:
+        if guild_id is None:
+            return handle
+
+        async def handle_as_member() -> dict:
+            user = await AsyncUser.get_or_create_for_discord_user(discord_user)
+            await AsyncRatingAggregate.join_guild(int(guild_id), user)
+            return await handle()
+
+        return handle_as_member
+
+
+async def run_in_app_context(func: Callable[[], T]) -> T:
+    """Runs blocking code on a thread in its own app context, so it gets its own
+    db connection rather than sharing the calling request's."""
+    app = current_app._get_current_object()  # type: ignore[attr-defined]
+
+    def run() -> T:
+        with app.app_context():
+            return func()
+
+    return await asyncio.to_thread(run)
+
+
+async def run_sync_handler(handler: Callable[..., Response], **kwargs) -> dict:
+    """Runs a sync handler on a thread, returning its response dict."""
+    return await run_in_app_context(lambda: handler(**kwargs).get_json())
@@ -0,0 +1,290 @@
+import base64
+import hashlib
+import hmac
+import zlib
+from functools import lru_cache
+from typing import Optional, Sequence, TYPE_CHECKING, Union
+
+from .pivot import DEFAULT_PIVOT_STRATEGY, PIVOT_STRATEGIES
+
+if TYPE_CHECKING:
+    from ..models.rating import Rating
+
+# Discord rejects component custom_ids longer than this
+CUSTOM_ID_MAX_LENGTH = 100
+
+_PREFIX = "s2"
+# Sent before custom_ids carried the pivot strategy, when every session bisected
+_LEGACY_PREFIX = "s1"
+_SIGNATURE_LENGTH = 16
+
+
+class InvalidCustomIdException(Exception):
+    pass
+
+
+class ComparisonState:
+    """Everything needed to continue a bisection from a single button click.
+
+    ``lowest_possible_idx``/``highest_possible_idx`` are the search bounds the
+    comparison at ``index`` was chosen from, ``step`` is how many comparisons
+    came before it and ``list_version`` identifies the list of other items those
+    indexes refer to.
+    """
+
+    # Binary comparisons only ever show one item
+    width = 1
+
+    def __init__(
+        self,
+        rating_id: int,
+        compared_id: int,
+        index: int,
+        lowest_possible_idx: int,
+        highest_possible_idx: int,
+        list_version: int,
+        is_preferred: bool,
+        strategy: str = DEFAULT_PIVOT_STRATEGY,
+        step: int = 0,
+    ):
+        self.rating_id = rating_id
+        self.compared_id = compared_id
+        self.index = index
+        self.lowest_possible_idx = lowest_possible_idx
+        self.highest_possible_idx = highest_possible_idx
+        self.list_version = list_version
+        self.is_preferred = is_preferred
+        self.strategy = strategy
+        self.step = step
+
+
+def get_list_version(items: Sequence["Rating"]) -> int:
+    return zlib.crc32(",".join(str(item.id) for item in items).encode())
+
+
+def encode_comparison_state(state: ComparisonState, secret: str) -> str:
+    fields = [
+        state.rating_id,
+        state.compared_id,
+        state.index,
+        state.lowest_possible_idx,
+        state.highest_possible_idx,
+        state.list_version,
+        list(PIVOT_STRATEGIES).index(state.strategy),
+        state.step,
+    ]
+    body = ".".join([_PREFIX] + [_to_base36(f) for f in fields] + ["y" if state.is_preferred else "n"])
+    custom_id = f"{body}.{_sign(body, secret)}"
+    if len(custom_id) > CUSTOM_ID_MAX_LENGTH:
+        raise InvalidCustomIdException(f"Custom ID is too long: {custom_id}")
+    return custom_id
+
+
+def decode_comparison_state(custom_id: str, secret: str) -> Optional[ComparisonState]:
+    """Returns None for custom_ids in any other format so callers can fall back."""
+    prefix = custom_id.partition(".")[0]
+    if prefix not in (_PREFIX, _LEGACY_PREFIX):
+        return None
+
+    body, _, signature = custom_id.rpartition(".")
+    if not hmac.compare_digest(signature, _sign(body, secret)):
+        raise InvalidCustomIdException(f"Invalid signature for custom ID: {custom_id}")
+
+    parts = body.split(".")
+    field_count = 8 if prefix == _PREFIX else 6
+    if len(parts) != field_count + 2 or parts[-1] not in ("y", "n"):
+        raise InvalidCustomIdException(f"Could not parse custom ID: {custom_id}")
+    # Legacy custom_ids are midpoint (strategy 0), which doesn't use the step
+    fields = [int(p, 36) for p in parts[1:-1]] + [0, 0]
+    if fields[6] >= len(PIVOT_STRATEGIES):
+        raise InvalidCustomIdException(f"Unknown pivot strategy in custom ID: {custom_id}")
+    return ComparisonState(
+        rating_id=fields[0],
+        compared_id=fields[1],
+        index=fields[2],
+        lowest_possible_idx=fields[3],
+        highest_possible_idx=fields[4],
+        list_version=fields[5],
+        is_preferred=parts[-1] == "y",
+        strategy=list(PIVOT_STRATEGIES)[fields[6]],
+        step=fields[7],
+    )
+
+
+_MULTI_PREFIX = "m1"
+
+
+class MultiComparisonState:
+    """Everything needed to continue a search after picking one of the gaps
+    between the ``width`` items a comparison showed.
+
+    The items are always spread evenly over the bounds, so they aren't carried.
+    """
+
+    # Spread pivots don't use the pivot strategy
+    strategy = DEFAULT_PIVOT_STRATEGY
+    step = 0
+
+    def __init__(
+        self,
+        rating_id: int,
+        lowest_possible_idx: int,
+        highest_possible_idx: int,
+        list_version: int,
+        width: int,
+        gap: int,
+    ):
+        self.rating_id = rating_id
+        self.lowest_possible_idx = lowest_possible_idx
+        self.highest_possible_idx = highest_possible_idx
+        self.list_version = list_version
+        self.width = width
+        self.gap = gap
+
+
+def encode_multi_comparison_state(state: MultiComparisonState, secret: str) -> str:
+    fields = [
+        state.rating_id,
+        state.lowest_possible_idx,
+        state.highest_possible_idx,
+        state.list_version,
+        state.width,
+        state.gap,
+    ]
+    body = ".".join([_MULTI_PREFIX] + [_to_base36(f) for f in fields])
+    custom_id = f"{body}.{_sign(body, secret)}"
+    if len(custom_id) > CUSTOM_ID_MAX_LENGTH:
+        raise InvalidCustomIdException(f"Custom ID is too long: {custom_id}")
+    return custom_id
+
+
+def decode_multi_comparison_state(custom_id: str, secret: str) -> Optional[MultiComparisonState]:
+    """Returns None for custom_ids in any other format so callers can fall back."""
+    if not custom_id.startswith(f"{_MULTI_PREFIX}."):
+        return None
+
+    body, _, signature = custom_id.rpartition(".")
+    if not hmac.compare_digest(signature, _sign(body, secret)):
+        raise InvalidCustomIdException(f"Invalid signature for custom ID: {custom_id}")
+
+    parts = body.split(".")
+    if len(parts) != 7:
+        raise InvalidCustomIdException(f"Could not parse custom ID: {custom_id}")
+    fields = [int(p, 36) for p in parts[1:]]
+    return MultiComparisonState(
+        rating_id=fields[0],
+        lowest_possible_idx=fields[1],
+        highest_possible_idx=fields[2],
+        list_version=fields[3],
+        width=fields[4],
+        gap=fields[5],
+    )
+
+
+def _sign(body: str, secret: str) -> str:
+    signer = _get_signer(secret).copy()
+    signer.update(body.encode())
+    return base64.urlsafe_b64encode(signer.digest()).decode()[:_SIGNATURE_LENGTH]
+
+
+@lru_cache(maxsize=8)
+def _get_signer(secret: str) -> "hmac.HMAC":
+    # Copying a keyed HMAC skips hashing the key again for every custom_id
+    return hmac.new(secret.encode(), digestmod=hashlib.sha256)
+
+
+def _to_base36(value: int) -> str:
+    if value < 0:
+        raise InvalidCustomIdException(f"Cannot encode negative value {value}")
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = ""
+    while True:
+        value, remainder = divmod(value, 36)
+        encoded = digits[remainder] + encoded
+        if value == 0:
+            return encoded
+
+
+LIST_PAGE_PREFIX = "rl"
+
+
+class ListPageCursor:
+    """Where a /rating list page button continues from. ``sort_key`` and
+    ``rating_id`` are the last rating shown for Next or the first for Prev."""
+
+    def __init__(self, is_next: bool, rating_type: str, sort_key: Optional[Union[int, float]], rating_id: int):
+        self.is_next = is_next
+        self.rating_type = rating_type
+        self.sort_key = sort_key
+        self.rating_id = rating_id
+
+
+def encode_list_page(cursor: ListPageCursor) -> Optional[str]:
+    """Returns None when the rating type is too long to fit in a custom_id."""
+    sort_key = "" if cursor.sort_key is None else repr(cursor.sort_key)
+    custom_id = ":".join(
+        [LIST_PAGE_PREFIX, "n" if cursor.is_next else "p", sort_key, str(cursor.rating_id), cursor.rating_type]
+    )
+    if len(custom_id) > CUSTOM_ID_MAX_LENGTH:
+        return None
+    return custom_id
+
+
+def decode_list_page(custom_id: str) -> Optional[ListPageCursor]:
+    """Returns None for custom_ids that aren't list page buttons."""
+    if not custom_id.startswith(f"{LIST_PAGE_PREFIX}:"):
+        return None
+    parts = custom_id.split(":", 4)
+    if len(parts) != 5 or parts[1] not in ("n", "p"):
+        raise InvalidCustomIdException(f"Could not parse custom ID: {custom_id}")
+    try:
+        sort_key = _parse_sort_key(parts[2])
+        rating_id = int(parts[3])
+    except ValueError:
+        raise InvalidCustomIdException(f"Could not parse custom ID: {custom_id}")
+    return ListPageCursor(is_next=parts[1] == "n", rating_type=parts[4], sort_key=sort_key, rating_id=rating_id)
+
+
+def _parse_sort_key(sort_key: str) -> Optional[Union[int, float]]:
+    if sort_key == "":
+        return None
+    # Rank keys are ints and values are floats, which repr always gives a "." or exponent
+    if "." in sort_key or "e" in sort_key:
+        return float(sort_key)
+    return int(sort_key)
+
+
+SORT_ANSWER_PREFIX = "bs"
+
+
+class SortAnswer:
+    """A button answering which of two items is preferred in a sort session.
+
+    Sort sessions are kept in the InteractionCache, so only the session and the
+    answer are carried.
+    """
+
+    def __init__(self, session_id: str, first_id: int, second_id: int, preferred_id: int):
+        self.session_id = session_id
+        self.first_id = first_id
+        self.second_id = second_id
+        self.preferred_id = preferred_id
+
+
+def encode_sort_answer(answer: SortAnswer) -> str:
+    return ":".join(
+        [SORT_ANSWER_PREFIX, answer.session_id, str(answer.first_id), str(answer.second_id), str(answer.preferred_id)]
+    )
+
+
+def decode_sort_answer(custom_id: str) -> Optional[SortAnswer]:
+    """Returns None for custom_ids that aren't sort session buttons."""
+    if not custom_id.startswith(f"{SORT_ANSWER_PREFIX}:"):
+        return None
+    parts = custom_id.split(":")
+    try:
+        if len(parts) != 5:
+            raise ValueError(custom_id)
+        return SortAnswer(parts[1], int(parts[2]), int(parts[3]), int(parts[4]))
+    except ValueError:
+        raise InvalidCustomIdException(f"Could not parse custom ID: {custom_id}")
@@ -0,0 +1,97 @@
+"""Counts how many comparisons each pivot strategy needs to place an item, on
+synthetic insert positions or ones replayed from a user's real ratings."""
+import math
+import random
+from typing import Iterator, Optional
+
+from ..models.rating import Rating
+from .pivot import SELECTABLE_PIVOT_STRATEGIES
+from .rating_calculator import CompletedComparison, ComparisonToSend, RatingCalculator
+
+SYNTHETIC_DISTRIBUTIONS = ("uniform", "top", "bottom", "rerate")
+
+# (other items lowest first, index the new item belongs at, its previous value)
+Trial = tuple[list[Rating], int, Optional[float]]
+
+
+def count_comparisons(strategy: str, other_items: list[Rating], target_idx: int, item_value: Optional[float] = None) -> int:
+    """Places an item that belongs at target_idx, answering every comparison truthfully."""
+    item = Rating(id=0, type="simulated", name="simulated", value=item_value, user_id=0)
+    calculator = RatingCalculator(item, other_items, strategy=strategy)
+    while True:
+        next_comparison = calculator.get_next_comparison()
+        # Simulated calculators are one item wide, so this is only None once placed
+        if not isinstance(next_comparison, ComparisonToSend):
+            return calculator.step
+        calculator.add_comparison(
+            CompletedComparison(
+                id=next_comparison.id,
+                index=next_comparison.index,
+                is_preferred=next_comparison.index >= target_idx,
+            )
+        )
+
+
+def summarize(counts: list[int]) -> dict:
+    ordered = sorted(counts)
+    return {
+        "mean": sum(ordered) / len(ordered),
+        # Nearest rank, so it's always a count that actually happened
+        "p95": ordered[math.ceil(0.95 * len(ordered)) - 1],
+        "max": ordered[-1],
+    }
+
+
+def simulate(trials: list[Trial]) -> dict[str, dict]:
+    return {
+        strategy: summarize([count_comparisons(strategy, *trial) for trial in trials])
+        for strategy in SELECTABLE_PIVOT_STRATEGIES
+    }
+
+
+def synthetic_trials(distribution: str, size: int, count: int, rng: random.Random) -> Iterator[Trial]:
+    """Inserts into a list of ``size`` evenly valued items.
+
+    ``top`` and ``bottom`` cluster new items near one end of the list and
+    ``rerate`` re-places an item near the value it already had.
+    """
+    other_items = _evenly_valued(list(range(1, size + 1)))
+    spread = max(size / 10, 1)
+    for _ in range(count):
+        item_value = None
+        if distribution == "uniform":
+            target_idx = rng.randint(0, size)
+        elif distribution == "top":
+            target_idx = size - min(int(abs(rng.gauss(0, spread))), size)
+        elif distribution == "bottom":
+            target_idx = min(int(abs(rng.gauss(0, spread))), size)
+        elif distribution == "rerate":
+            target_idx = rng.randint(0, size)
+            item_value = (target_idx / size if size else 0) * 100 + rng.gauss(0, 2.5)
+        else:
+            raise ValueError(f"Unknown distribution: {distribution}")
+        yield (other_items, target_idx, item_value)
+
+
+def recorded_trials(ratings: list[Rating], created_order: list[int]) -> Iterator[Trial]:
+    """Replays adding a user's ratings (lowest first) in the order they were
+    created, each into the ratings created before it."""
+    position = {r.id: idx for (idx, r) in enumerate(ratings)}
+    added: list[int] = []
+    for rating_id in created_order:
+        if rating_id not in position:
+            continue
+        earlier = sorted(added, key=position.__getitem__)
+        target_idx = sum(1 for other_id in earlier if position[other_id] < position[rating_id])
+        if earlier:
+            yield (_evenly_valued(earlier), target_idx, None)
+        added.append(rating_id)
+
+
+def _evenly_valued(ids: list[int]) -> list[Rating]:
+    # The values the calculator would have given the same list
+    denominator = max(len(ids) - 1, 1)
+    return [
+        Rating(id=rating_id, type="simulated", name=str(rating_id), value=round(idx / denominator * 100, 2), user_id=0)
+        for (idx, rating_id) in enumerate(ids)
+    ]
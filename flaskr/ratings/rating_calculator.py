@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Union
 from typing_extensions import Self
 
 
@@ -6,10 +6,16 @@ from flask import current_app
 
 from ..interaction_cache import InteractionCache
 from ..models.rating import Rating
+from .custom_id import get_list_version
+from .pivot import DEFAULT_PIVOT_STRATEGY, choose_pivot, get_pivot_strategy, spread_pivots
 
 MAX_COMPARISONS = 100000
 
 
+class StaleComparisonException(Exception):
+    pass
+
+
 # TODO: Make this an abstract base class
 class _Comparison:
     def __init__(self, id: int, index: int):
@@ -19,9 +25,23 @@ class _Comparison:
 
 class ComparisonToSend(_Comparison):
     # Same constructor as the parent, but can also take a name that we can then send to the user
-    def __init__(self, id: int, index: int, name: str):
+    # and the search state the comparison was picked from
+    def __init__(
+        self,
+        id: int,
+        index: int,
+        name: str,
+        lowest_possible_idx: int = 0,
+        highest_possible_idx: int = 0,
+        strategy: str = DEFAULT_PIVOT_STRATEGY,
+        step: int = 0,
+    ):
         super().__init__(id, index)
         self.name = name
+        self.lowest_possible_idx = lowest_possible_idx
+        self.highest_possible_idx = highest_possible_idx
+        self.strategy = strategy
+        self.step = step
 
     def to_json(self):
         return {
@@ -37,12 +57,133 @@ class CompletedComparison(_Comparison):
         super().__init__(id, index)
         self.is_preferred = is_preferred
 
+    def to_json(self):
+        return {
+            "id": self.id,
+            "index": self.index,
+            "is_preferred": self.is_preferred,
+        }
+
+    @classmethod
+    def create_from_json(cls, data: dict):
+        return cls(
+            id=data["id"],
+            index=data["index"],
+            is_preferred=data["is_preferred"],
+        )
+
+
+class MultiComparisonToSend:
+    """Several items to compare against at once, lowest first, picked from the
+    given search bounds. The answer is the gap between them the item belongs in."""
+
+    def __init__(
+        self,
+        pivots: list[ComparisonToSend],
+        lowest_possible_idx: int,
+        highest_possible_idx: int,
+        width: int,
+    ):
+        self.pivots = pivots
+        self.lowest_possible_idx = lowest_possible_idx
+        self.highest_possible_idx = highest_possible_idx
+        self.width = width
+
+    def to_json(self):
+        return {
+            "pivots": [p.to_json() for p in self.pivots],
+            "lowest_possible_idx": self.lowest_possible_idx,
+            "highest_possible_idx": self.highest_possible_idx,
+            "width": self.width,
+        }
+
+
+class CompletedMultiComparison:
+    """``gap`` counts the pivots the item was rated above, so 0 is below them
+    all. The bounds are the ones the pivots were picked from."""
+
+    def __init__(self, gap: int, lowest_possible_idx: int, highest_possible_idx: int):
+        self.gap = gap
+        self.lowest_possible_idx = lowest_possible_idx
+        self.highest_possible_idx = highest_possible_idx
+
+    def to_json(self):
+        return {
+            "gap": self.gap,
+            "lowest_possible_idx": self.lowest_possible_idx,
+            "highest_possible_idx": self.highest_possible_idx,
+        }
+
+    @classmethod
+    def create_from_json(cls, data: dict):
+        return cls(
+            gap=data["gap"],
+            lowest_possible_idx=data["lowest_possible_idx"],
+            highest_possible_idx=data["highest_possible_idx"],
+        )
+
+
+AnyCompletedComparison = Union[CompletedComparison, CompletedMultiComparison]
+
 
 class RatingCalculator:
-    def __init__(self, item_being_rated: Rating, other_items: list[Rating]):
+    def __init__(
+        self,
+        item_being_rated: Rating,
+        other_items: list[Rating],
+        lowest_possible_idx: int = 0,
+        highest_possible_idx: Optional[int] = None,
+        strategy: str = DEFAULT_PIVOT_STRATEGY,
+        step: int = 0,
+        width: int = 1,
+    ):
         self.item_being_rated = item_being_rated
         self.other_items = other_items
-        self.comparisons: list[CompletedComparison] = []
+        # The live search bounds, narrowed by every comparison added. They start out
+        # narrower than the whole list when resuming a rating from a button click.
+        self.lowest_possible_idx = lowest_possible_idx
+        self.highest_possible_idx = (
+            len(other_items) - 1 if highest_possible_idx is None else highest_possible_idx
+        )
+        # How the next comparison is picked and how many have been answered so far
+        self.strategy = strategy
+        self.step = step
+        # How many items each comparison shows. Wider comparisons spread their
+        # pivots evenly rather than using the strategy.
+        self.width = width
+        self.comparisons: list[AnyCompletedComparison] = []
+        self.idx_for_comparison = self._get_idx_for_comparison()
+
+    def to_json(self):
+        return {
+            "item_being_rated": self.item_being_rated.to_json(),
+            "other_items": [r.to_json() for r in self.other_items],
+            "lowest_possible_idx": self.lowest_possible_idx,
+            "highest_possible_idx": self.highest_possible_idx,
+            "strategy": self.strategy,
+            "step": self.step,
+            "width": self.width,
+            "comparisons": [c.to_json() for c in self.comparisons],
+        }
+
+    @classmethod
+    def create_from_json(cls, data: dict) -> Self:
+        rating_calculator = cls(
+            item_being_rated=Rating.create_from_db_row(data["item_being_rated"]),
+            other_items=[Rating.create_from_db_row(r) for r in data["other_items"]],
+            lowest_possible_idx=data["lowest_possible_idx"],
+            highest_possible_idx=data["highest_possible_idx"],
+            # Sessions cached before there were strategies bisected
+            strategy=data.get("strategy", DEFAULT_PIVOT_STRATEGY),
+            step=data.get("step", len(data["comparisons"])),
+            width=data.get("width", 1),
+        )
+        # The bounds already account for these, so they must not be replayed
+        rating_calculator.comparisons = [
+            CompletedMultiComparison.create_from_json(c) if "gap" in c else CompletedComparison.create_from_json(c)
+            for c in data["comparisons"]
+        ]
+        return rating_calculator
 
     @staticmethod
     def get_cache_key(item: Rating) -> str:
@@ -59,79 +200,171 @@ class RatingCalculator:
             RatingCalculator.get_cache_key(self.item_being_rated)
         )
 
+    def get_list_version(self) -> int:
+        return get_list_version(self.other_items)
+
     @classmethod
-    def begin_rating(cls, item_being_rated: Rating, other_items: list[Rating]) -> Self:
-        rating_calulator = cls(item_being_rated, other_items)
-        InteractionCache.store_rating_calculator(
-            cache_key=RatingCalculator.get_cache_key(item_being_rated),
-            rating_calculator=rating_calulator,
-        )
+    def begin_rating(
+        cls,
+        item_being_rated: Rating,
+        other_items: list[Rating],
+        use_cache: bool = True,
+        width: int = 1,
+    ) -> Self:
+        rating_calulator = cls(item_being_rated, other_items, strategy=get_pivot_strategy(), width=width)
+        if use_cache:
+            InteractionCache.store_rating_calculator(
+                cache_key=RatingCalculator.get_cache_key(item_being_rated),
+                rating_calculator=rating_calulator,
+            )
         return rating_calulator
 
+    @classmethod
+    def resume_rating(
+        cls,
+        item_being_rated: Rating,
+        other_items: list[Rating],
+        lowest_possible_idx: int,
+        highest_possible_idx: int,
+        comparison: AnyCompletedComparison,
+        strategy: str = DEFAULT_PIVOT_STRATEGY,
+        step: int = 0,
+        width: int = 1,
+    ) -> Self:
+        """Rebuilds a rating from the state carried in a comparison's custom_id
+        instead of looking it up in the InteractionCache."""
+        rating_calculator = cls(
+            item_being_rated,
+            other_items,
+            lowest_possible_idx=lowest_possible_idx,
+            highest_possible_idx=highest_possible_idx,
+            strategy=strategy,
+            step=step,
+            width=width,
+        )
+        rating_calculator.add_comparison(comparison)
+        return rating_calculator
+
     @classmethod
     def continue_rating(
-        cls, item_being_rated: Rating, comparison: CompletedComparison
+        cls, item_being_rated: Rating, comparison: AnyCompletedComparison
     ) -> Optional[Self]:
         rating_calculator = RatingCalculator.find_for_item(item_being_rated)
         if rating_calculator is None:
             return None
         rating_calculator.add_comparison(comparison)
+        # The cache holds a serialized copy, so write the new comparison back to it
+        InteractionCache.store_rating_calculator(
+            cache_key=RatingCalculator.get_cache_key(item_being_rated),
+            rating_calculator=rating_calculator,
+        )
         return rating_calculator
 
-    def add_comparison(self: Self, comparison: CompletedComparison) -> None:
+    def add_comparison(self: Self, comparison: AnyCompletedComparison) -> None:
+        if isinstance(comparison, CompletedMultiComparison):
+            self._add_multi_comparison(comparison)
+            return
+        if (
+            self.idx_for_comparison is None
+            or comparison.index != self.idx_for_comparison
+            or comparison.id != self.other_items[comparison.index].id
+        ):
+            # Usually a duplicated or out of date button click
+            raise StaleComparisonException(
+                f"Expected a comparison at index {self.idx_for_comparison}, got {comparison.index}"
+            )
+
+        if comparison.is_preferred:
+            self.highest_possible_idx = comparison.index - 1
+        else:
+            self.lowest_possible_idx = comparison.index + 1
         self.comparisons.append(comparison)
+        self.step += 1
+        self.idx_for_comparison = self._get_idx_for_comparison()
 
-    def get_next_comparison(self: Self) -> Optional[ComparisonToSend]:
-        if not self.other_items:
-            return None
+    def _add_multi_comparison(self: Self, comparison: CompletedMultiComparison) -> None:
+        pivot_idxs = self._get_pivot_idxs()
+        if (
+            comparison.lowest_possible_idx != self.lowest_possible_idx
+            or comparison.highest_possible_idx != self.highest_possible_idx
+            or not 0 <= comparison.gap <= len(pivot_idxs)
+            or not pivot_idxs
+        ):
+            raise StaleComparisonException(
+                f"Expected a comparison between {self.lowest_possible_idx} and {self.highest_possible_idx},"
+                f" got one between {comparison.lowest_possible_idx} and {comparison.highest_possible_idx}"
+            )
 
+        if comparison.gap > 0:
+            self.lowest_possible_idx = pivot_idxs[comparison.gap - 1] + 1
+        if comparison.gap < len(pivot_idxs):
+            self.highest_possible_idx = pivot_idxs[comparison.gap] - 1
+        self.comparisons.append(comparison)
+        self.step += 1
+
+    def _get_pivot_idxs(self: Self) -> list[int]:
+        if self.width == 1 or self.highest_possible_idx < self.lowest_possible_idx:
+            return []
+        return spread_pivots(self.lowest_possible_idx, self.highest_possible_idx, self.width)
+
+    def get_next_comparison(self: Self) -> Optional[Union[ComparisonToSend, MultiComparisonToSend]]:
         if len(self.comparisons) >= MAX_COMPARISONS:
             return None
-        lowest_possible_idx = 0
-        highest_possible_idx = len(self.other_items) - 1
-        idx_for_comparison = (
-            int((highest_possible_idx - lowest_possible_idx) / 2) + lowest_possible_idx
-        )
-        current_app.logger.info(
-            f"lowest: {lowest_possible_idx}, highest: {highest_possible_idx}, comparison: {idx_for_comparison}"
-        )
-        for comparison in self.comparisons:
-            if comparison.is_preferred:
-                highest_possible_idx = idx_for_comparison - 1
-            else:
-                lowest_possible_idx = idx_for_comparison + 1
-
-            if highest_possible_idx < lowest_possible_idx:
-                return None
-            idx_for_comparison = (
-                int((highest_possible_idx - lowest_possible_idx) / 2)
-                + lowest_possible_idx
-            )
 
-            current_app.logger.info(
-                f"is_preferred: {comparison.is_preferred}, lowest: {lowest_possible_idx}, highest: {highest_possible_idx}, comparison: {idx_for_comparison}"
-            )
+        if self.width > 1:
+            return self._get_next_multi_comparison()
+
+        if self.idx_for_comparison is None:
+            return None
 
-        next_item = self.other_items[idx_for_comparison]
-        current_app.logger.info(f"next item: {self.other_items[idx_for_comparison]}")
+        next_item = self.other_items[self.idx_for_comparison]
+        current_app.logger.debug(
+            f"lowest: {self.lowest_possible_idx}, highest: {self.highest_possible_idx}, next item: {next_item}"
+        )
         return ComparisonToSend(
             id=next_item.id,
             name=next_item.name,
-            index=idx_for_comparison,
+            index=self.idx_for_comparison,
+            lowest_possible_idx=self.lowest_possible_idx,
+            highest_possible_idx=self.highest_possible_idx,
+            strategy=self.strategy,
+            step=self.step,
+        )
+
+    def _get_next_multi_comparison(self: Self) -> Optional[MultiComparisonToSend]:
+        pivot_idxs = self._get_pivot_idxs()
+        if not pivot_idxs:
+            return None
+        pivots = [
+            ComparisonToSend(
+                id=self.other_items[idx].id,
+                name=self.other_items[idx].name,
+                index=idx,
+                lowest_possible_idx=self.lowest_possible_idx,
+                highest_possible_idx=self.highest_possible_idx,
+            )
+            for idx in pivot_idxs
+        ]
+        return MultiComparisonToSend(pivots, self.lowest_possible_idx, self.highest_possible_idx, self.width)
+
+    def _get_idx_for_comparison(self: Self) -> Optional[int]:
+        if self.width > 1 or self.highest_possible_idx < self.lowest_possible_idx:
+            return None
+        return choose_pivot(
+            self.strategy,
+            self.other_items,
+            self.item_being_rated.value,
+            self.lowest_possible_idx,
+            self.highest_possible_idx,
+            self.step,
         )
 
     def get_overall_ratings(self: Self) -> list[Rating]:
         # Make a copy of the list
         ratings = self.other_items[:]
 
-        # Insert the new item in the appropriate spot in the list
-        last_comparison = self.comparisons[-1]
-        index_for_rating = (
-            last_comparison.index
-            if last_comparison.is_preferred
-            else last_comparison.index + 1
-        )
-        ratings.insert(index_for_rating, self.item_being_rated)
+        # Once the search is done the lowest possible index is where the new item goes
+        ratings.insert(self.lowest_possible_idx, self.item_being_rated)
 
         # Recalculate the ratings
         denominator = len(ratings) - 1
@@ -0,0 +1,31 @@
+import csv
+import io
+from typing import Callable, Iterable, Iterator
+
+# The name column is what import reads, so a user's export of a type imports back as is
+EXPORT_FIELDS = ("username", "type", "name", "value", "rank_key", "id", "user_id")
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+
+def to_csv_lines(rows: Iterable[dict]) -> Iterator[str]:
+    """Formats exported rows as CSV one line at a time, header first."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    yield _take(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield _take(buffer)
+
+
+def to_ndjson_lines(rows: Iterable[dict], dumps: Callable[[dict], str]) -> Iterator[str]:
+    for row in rows:
+        yield f"{dumps({field: row[field] for field in EXPORT_FIELDS})}\n"
+
+
+def _take(buffer: io.StringIO) -> str:
+    line = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return line
@@ -1,15 +1,45 @@
 import re
+from typing import Callable, Optional, Union
 
-from flask import jsonify
+from flask import current_app, jsonify, Response
 
 from ..discord import InteractionCallbackType, MessageComponentType
+from ..models.aggregate import RatingAggregate
 from ..models.user import User
-from ..models.rating import Rating
+from ..models.rating import Rating, RatingPage
 from ..ratings.rating_calculator import (
     RatingCalculator,
+    AnyCompletedComparison,
     CompletedComparison,
+    CompletedMultiComparison,
     ComparisonToSend,
+    MultiComparisonToSend,
+    StaleComparisonException,
 )
+from .custom_id import (
+    ComparisonState,
+    ListPageCursor,
+    MultiComparisonState,
+    SortAnswer,
+    decode_comparison_state,
+    decode_list_page,
+    decode_multi_comparison_state,
+    decode_sort_answer,
+    encode_comparison_state,
+    encode_list_page,
+    encode_multi_comparison_state,
+    encode_sort_answer,
+    get_list_version,
+)
+from .sort_session import SortSession
+
+# Discord rejects message content longer than this
+MESSAGE_MAX_LENGTH = 2000
+
+# Discord allows 25 buttons a message, one for each gap around the items shown
+MAX_COMPARISON_WIDTH = 24
+BUTTON_LABEL_MAX_LENGTH = 80
+BUTTONS_PER_ROW = 5
 
 
 class RatingHandler:
@@ -31,9 +61,12 @@ class RatingHandler:
         rating_calculator = RatingCalculator.begin_rating(
             item_being_rated=new_rating,
             other_items=other_items,
+            use_cache=RatingHandler._should_cache_sessions(),
+            width=get_comparison_width(),
         )
         next_comparison = rating_calculator.get_next_comparison()
         if next_comparison is None:
+            Rating.save_new_order(user=user, new_ratings=[new_rating], placed_rating=new_rating)
             rating_calculator.complete()
             return jsonify(RatingJsonResponder.get_first_rating_json(rating_type))
 
@@ -41,10 +74,70 @@ class RatingHandler:
             RatingJsonResponder.get_comparison_json(
                 rating_calculator.item_being_rated,
                 next_comparison,
-                next_comparison.index,
+                rating_calculator.get_list_version(),
             )
         )
 
+    @staticmethod
+    def handle_add_many_ratings(discord_user: dict, interaction_data: dict):
+        rating_type: str = RatingHandler._parse_rating_type(
+            interaction_data["options"][0]["value"]
+        )
+        rating_names = RatingHandler._parse_rating_names(
+            interaction_data["options"][1]["value"]
+        )
+        max_items = get_batch_max_items()
+        if not rating_names or len(rating_names) > max_items:
+            return jsonify(RatingJsonResponder.get_invalid_batch_json(max_items))
+        user = User.get_or_create_for_discord_user(discord_user)
+
+        sort_session = SortSession.begin_adding(user, rating_type, rating_names)
+        return jsonify(RatingHandler._advance_sort_session(user, sort_session))
+
+    @staticmethod
+    def handle_rerank_ratings(discord_user: dict, interaction_data: dict):
+        rating_type: str = RatingHandler._parse_rating_type(
+            interaction_data["options"][0]["value"]
+        )
+        # The rank options are optional, so they're found by name
+        ranks = {option["name"]: option["value"] for option in interaction_data["options"][1:]}
+        user = User.get_or_create_for_discord_user(discord_user)
+
+        sort_session = SortSession.begin_reranking(user, rating_type, ranks.get("from", 1), ranks.get("to"))
+        return jsonify(RatingHandler._advance_sort_session(user, sort_session))
+
+    @staticmethod
+    def handle_sort_answer(discord_user: dict, interaction_data: dict):
+        answer = decode_sort_answer(interaction_data["custom_id"])
+        if answer is None:
+            raise Exception(f"Could not parse custom ID: {interaction_data['custom_id']}")
+
+        user = User.get_or_create_for_discord_user(discord_user)
+        sort_session = SortSession.find(answer.session_id)
+        if sort_session is None or sort_session.user_id != user.id:
+            return jsonify(
+                RatingJsonResponder.get_not_found_json(
+                    f"session:{answer.session_id}", discord_user["username"]
+                )
+            )
+        try:
+            sort_session.add_answer(answer.first_id, answer.second_id, answer.preferred_id)
+        except StaleComparisonException:
+            return jsonify(RatingJsonResponder.get_stale_sort_comparison_json())
+        return jsonify(RatingHandler._advance_sort_session(user, sort_session))
+
+    @staticmethod
+    def _advance_sort_session(user: User, sort_session: SortSession) -> dict:
+        next_comparison = sort_session.advance(user)
+        if next_comparison is not None:
+            sort_session.store()
+            return RatingJsonResponder.get_sort_comparison_json(sort_session, next_comparison)
+
+        sort_session.complete()
+        return RatingJsonResponder.get_ratings_list_json(
+            sort_session.rating_type, user.get_ratings(rating_type=sort_session.rating_type)
+        )
+
     @staticmethod
     def handle_remove_rating(discord_user: dict, interaction_data: dict):
         rating_type: str = RatingHandler._parse_rating_type(
@@ -76,13 +169,57 @@ class RatingHandler:
         )
         user = User.get_or_create_for_discord_user(discord_user)
 
-        ratings_for_user = user.get_ratings(rating_type=rating_type)
+        page = Rating.get_ratings_page(user, rating_type, get_list_page_size())
+        return jsonify(RatingJsonResponder.get_ratings_page_json(rating_type, page))
+
+    @staticmethod
+    def handle_list_page(discord_user: dict, interaction_data: dict):
+        cursor = decode_list_page(interaction_data["custom_id"])
+        if cursor is None:
+            raise Exception(f"Could not parse custom ID: {interaction_data['custom_id']}")
+        user = User.get_or_create_for_discord_user(discord_user)
+
+        page = Rating.get_ratings_page(user, cursor.rating_type, get_list_page_size(), *get_page_bounds(cursor))
+        if not page.ratings:
+            # The ratings around the cursor were removed since the page was sent
+            page = Rating.get_ratings_page(user, cursor.rating_type, get_list_page_size())
         return jsonify(
-            RatingJsonResponder.get_ratings_list_json(
-                rating_type=rating_type, ratings=ratings_for_user
+            RatingJsonResponder.get_ratings_page_json(
+                cursor.rating_type, page, InteractionCallbackType.UPDATE_MESSAGE
             )
         )
 
+    @staticmethod
+    def handle_top_ratings(discord_user: dict, interaction_data: dict, guild_id: Optional[str]):
+        if guild_id is None:
+            return jsonify(RatingJsonResponder.get_top_outside_guild_json())
+        rating_type: str = RatingHandler._parse_rating_type(
+            interaction_data["options"][0]["value"]
+        )
+        # The limit and sort options are optional, so they're found by name
+        options = {option["name"]: option["value"] for option in interaction_data["options"][1:]}
+
+        aggregates = RatingAggregate.get_top(
+            int(guild_id), rating_type, options.get("limit", get_top_limit()), options.get("sort", "borda")
+        )
+        return jsonify(RatingJsonResponder.get_top_json(rating_type, aggregates))
+
+    @staticmethod
+    def as_guild_member(
+        discord_user: dict, guild_id: Optional[str], handle: Callable[[], Response]
+    ) -> Callable[[], Response]:
+        """Wraps a handler to first record that the user is in the guild the
+        interaction came from, so their ratings count towards its aggregates."""
+        if guild_id is None:
+            return handle
+
+        def handle_as_member() -> Response:
+            user = User.get_or_create_for_discord_user(discord_user)
+            RatingAggregate.join_guild(int(guild_id), user)
+            return handle()
+
+        return handle_as_member
+
     @staticmethod
     def handle_list_types(discord_user: dict):
         user = User.get_or_create_for_discord_user(discord_user)
@@ -92,11 +229,11 @@ class RatingHandler:
 
     @staticmethod
     def handle_responded_to_comparison(discord_user: dict, interaction_data: dict):
-        (rating_id, comparison) = RatingHandler._parse_custom_id(
+        (rating_id, comparison, state) = RatingHandler._parse_custom_id(
             interaction_data["custom_id"]
         )
 
-        user = User.get_by_username(discord_user["username"])
+        user = User.get_or_create_for_discord_user(discord_user)
         rating = Rating.get_by_id_for_user(user=user, rating_id=rating_id)
         if rating is None:
             return jsonify(
@@ -105,10 +242,18 @@ class RatingHandler:
                 )
             )
 
-        rating_calculator = RatingCalculator.continue_rating(
-            item_being_rated=rating,
-            comparison=comparison,
-        )
+        rating_calculator = None
+        try:
+            if state is not None:
+                rating_calculator = RatingHandler._resume_from_state(user, rating, comparison, state)
+            if rating_calculator is None:
+                # Either a legacy custom_id or the list changed since the button was sent
+                rating_calculator = RatingCalculator.continue_rating(
+                    item_being_rated=rating,
+                    comparison=comparison,
+                )
+        except StaleComparisonException:
+            return jsonify(RatingJsonResponder.get_stale_comparison_json(rating))
         if rating_calculator is None:
             return jsonify(
                 RatingJsonResponder.get_not_found_json(
@@ -122,17 +267,72 @@ class RatingHandler:
                 RatingJsonResponder.get_comparison_json(
                     rating_calculator.item_being_rated,
                     next_comparison,
-                    next_comparison.index,
+                    rating_calculator.get_list_version(),
                 )
             )
 
         new_ratings = rating_calculator.get_overall_ratings()
-        Rating.update_all_with_new_ratings(user=user, new_ratings=new_ratings)
+        Rating.save_new_order(user=user, new_ratings=new_ratings, placed_rating=rating)
         rating_calculator.complete()
         return jsonify(RatingJsonResponder.get_ratings_list_json(rating.type, new_ratings))
 
     @staticmethod
-    def _parse_custom_id(custom_id: str) -> tuple[int, CompletedComparison]:
+    def _resume_from_state(
+        user: User,
+        rating: Rating,
+        comparison: AnyCompletedComparison,
+        state: Union[ComparisonState, MultiComparisonState],
+    ) -> Optional[RatingCalculator]:
+        other_items = [r for r in user.get_ratings(rating_type=rating.type) if r.id != rating.id]
+        if get_list_version(other_items) != state.list_version:
+            return None
+        return RatingCalculator.resume_rating(
+            item_being_rated=rating,
+            other_items=other_items,
+            lowest_possible_idx=state.lowest_possible_idx,
+            highest_possible_idx=state.highest_possible_idx,
+            comparison=comparison,
+            strategy=state.strategy,
+            step=state.step,
+            width=state.width,
+        )
+
+    @staticmethod
+    def _should_cache_sessions() -> bool:
+        # Signed custom_ids carry the whole session, so the cache is only a fallback
+        if get_custom_id_secret() is None:
+            return True
+        return current_app.config.get("INTERACTION_CACHE_FALLBACK", True)
+
+    @staticmethod
+    def _parse_custom_id(
+        custom_id: str,
+    ) -> tuple[int, AnyCompletedComparison, Optional[Union[ComparisonState, MultiComparisonState]]]:
+        secret = get_custom_id_secret()
+        multi_state = decode_multi_comparison_state(custom_id, secret) if secret else None
+        if multi_state is not None:
+            return (
+                multi_state.rating_id,
+                CompletedMultiComparison(
+                    gap=multi_state.gap,
+                    lowest_possible_idx=multi_state.lowest_possible_idx,
+                    highest_possible_idx=multi_state.highest_possible_idx,
+                ),
+                multi_state,
+            )
+
+        state = decode_comparison_state(custom_id, secret) if secret else None
+        if state is not None:
+            return (
+                state.rating_id,
+                CompletedComparison(
+                    id=state.compared_id,
+                    index=state.index,
+                    is_preferred=state.is_preferred,
+                ),
+                state,
+            )
+
         matches = re.search(
             "r_([0-9]*)_c_([0-9]*)_cidx_([0-9]*)_pc_(no|yes)",
             custom_id,
@@ -152,6 +352,7 @@ class RatingHandler:
                 index=compared_rating_index,
                 is_preferred=is_preferred,
             ),
+            None,
         )
 
     @staticmethod
@@ -162,12 +363,73 @@ class RatingHandler:
     def _parse_rating_name(rating_name: str) -> str:
         return rating_name.strip()
 
+    @staticmethod
+    def _parse_rating_names(rating_names: str) -> list[str]:
+        """Splits a list of names on commas or new lines, dropping blanks and repeats."""
+        names: dict[str, str] = {}
+        for name in re.split("[,\n]", rating_names):
+            name = RatingHandler._parse_rating_name(name)
+            if name:
+                names.setdefault(name.lower(), name)
+        return list(names.values())
+
+
+def get_custom_id_secret() -> Optional[str]:
+    return current_app.config.get("CUSTOM_ID_SECRET") or current_app.config.get("SECRET_KEY")
+
+
+def get_comparison_width() -> int:
+    """How many items each comparison shows, from RATING_COMPARISON_WIDTH."""
+    # Answers to wider comparisons only fit in signed custom_ids
+    if get_custom_id_secret() is None:
+        return 1
+    return min(max(current_app.config.get("RATING_COMPARISON_WIDTH", 1), 1), MAX_COMPARISON_WIDTH)
+
+
+def get_batch_max_items() -> int:
+    return current_app.config.get("RATING_BATCH_MAX_ITEMS", 25)
+
+
+def get_top_limit() -> int:
+    return current_app.config.get("RATING_TOP_LIMIT", 10)
+
+
+def get_list_page_size() -> int:
+    return current_app.config.get("RATING_LIST_PAGE_SIZE", 20)
+
+
+def get_page_bounds(cursor: ListPageCursor) -> tuple:
+    """The (after, before) arguments of Rating.get_ratings_page for a page button."""
+    bound = (cursor.sort_key, cursor.rating_id)
+    return (bound, None) if cursor.is_next else (None, bound)
+
+
+# The static parts of the responses are built once. Responses are only ever
+# serialized, so the shared dicts are never mutated.
+_NO_TYPES_JSON = {
+    "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
+    "data": {"content": "You haven't rated anything yet!"},
+}
+_BUTTON_SKELETON = {"type": MessageComponentType.BUTTON, "style": 1}
+_PAGE_BUTTON_SKELETON = {"type": MessageComponentType.BUTTON, "style": 2}
+
+
+def _message_json(
+    content: str,
+    response_type: InteractionCallbackType = InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
+) -> dict:
+    return {"type": response_type, "data": {"content": content}}
+
 
 class RatingJsonResponder:
     @staticmethod
     def get_comparison_json(
-        rating: Rating, rating_to_compare: ComparisonToSend, rating_to_compare_idx: int
+        rating: Rating,
+        rating_to_compare: Union[ComparisonToSend, MultiComparisonToSend],
+        list_version: int,
     ) -> dict:
+        if isinstance(rating_to_compare, MultiComparisonToSend):
+            return RatingJsonResponder.get_multi_comparison_json(rating, rating_to_compare, list_version)
         return {
             "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
             "data": {
@@ -177,16 +439,18 @@ class RatingJsonResponder:
                         "type": MessageComponentType.ACTION_ROW,
                         "components": [
                             {
-                                "type": MessageComponentType.BUTTON,
-                                "label": f"{rating.name}",
-                                "style": 1,
-                                "custom_id": f"r_{rating.id}_c_{rating_to_compare.id}_cidx_{rating_to_compare_idx}_pc_no",
+                                **_BUTTON_SKELETON,
+                                "label": rating.name,
+                                "custom_id": RatingJsonResponder._get_comparison_custom_id(
+                                    rating, rating_to_compare, list_version, False
+                                ),
                             },
                             {
-                                "type": MessageComponentType.BUTTON,
-                                "label": f"{rating_to_compare.name}",
-                                "style": 1,
-                                "custom_id": f"r_{rating.id}_c_{rating_to_compare.id}_cidx_{rating_to_compare_idx}_pc_yes",
+                                **_BUTTON_SKELETON,
+                                "label": rating_to_compare.name,
+                                "custom_id": RatingJsonResponder._get_comparison_custom_id(
+                                    rating, rating_to_compare, list_version, True
+                                ),
                             },
                         ],
                     }
@@ -195,61 +459,205 @@ class RatingJsonResponder:
         }
 
     @staticmethod
-    def get_ratings_list_json(rating_type: str, ratings: list[Rating]):
-        if len(ratings) == 0:
-            return {
-                "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
-                "data": {"content": f"You have no ratings of **{rating_type}s**"},
+    def _get_comparison_custom_id(
+        rating: Rating,
+        rating_to_compare: ComparisonToSend,
+        list_version: int,
+        is_preferred: bool,
+    ) -> str:
+        secret = get_custom_id_secret()
+        if secret is None:
+            answer = "yes" if is_preferred else "no"
+            return f"r_{rating.id}_c_{rating_to_compare.id}_cidx_{rating_to_compare.index}_pc_{answer}"
+
+        return encode_comparison_state(
+            ComparisonState(
+                rating_id=rating.id,
+                compared_id=rating_to_compare.id,
+                index=rating_to_compare.index,
+                lowest_possible_idx=rating_to_compare.lowest_possible_idx,
+                highest_possible_idx=rating_to_compare.highest_possible_idx,
+                list_version=list_version,
+                is_preferred=is_preferred,
+                strategy=rating_to_compare.strategy,
+                step=rating_to_compare.step,
+            ),
+            secret,
+        )
+
+    @staticmethod
+    def get_multi_comparison_json(rating: Rating, comparison: MultiComparisonToSend, list_version: int) -> dict:
+        """Asks for the best of several items the rating is better than, with a
+        button for each gap between them from the top down."""
+        # Only called with a signed custom_id secret, see get_comparison_width
+        secret = str(get_custom_id_secret())
+        pivots = comparison.pivots
+        labels = [f"Better than {p.name}" for p in reversed(pivots)] + [f"Worse than {pivots[0].name}"]
+        buttons = [
+            {
+                **_BUTTON_SKELETON,
+                "label": label[:BUTTON_LABEL_MAX_LENGTH],
+                "custom_id": encode_multi_comparison_state(
+                    MultiComparisonState(
+                        rating_id=rating.id,
+                        lowest_possible_idx=comparison.lowest_possible_idx,
+                        highest_possible_idx=comparison.highest_possible_idx,
+                        list_version=list_version,
+                        width=comparison.width,
+                        gap=gap,
+                    ),
+                    secret,
+                ),
             }
-        lines = []
-        for r in ratings:
-            lines.append(f"{r.name}: {r.value}")
-        lines.reverse()
-        ratings_message = "\n".join(lines)
+            for (label, gap) in zip(labels, range(len(pivots), -1, -1))
+        ]
         return {
             "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
             "data": {
-                "content": f"Your ratings for **{rating_type}s** are:\n\n{ratings_message}"
+                "content": f"Which of these **{rating.type}s** is **{rating.name}** better than? Pick the best one.",
+                "components": [
+                    {"type": MessageComponentType.ACTION_ROW, "components": buttons[start : start + BUTTONS_PER_ROW]}
+                    for start in range(0, len(buttons), BUTTONS_PER_ROW)
+                ],
             },
         }
 
     @staticmethod
-    def get_types_list_json(rating_types: list[str]):
-        if len(rating_types) == 0:
-            return {
-                "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
-                "data": {"content": "You haven't rated anything yet!"},
-            }
-
-        types_message = "\n".join(rating_types)
+    def get_sort_comparison_json(sort_session: SortSession, comparison: tuple[int, int]) -> dict:
+        (first_id, second_id) = comparison
         return {
             "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
             "data": {
-                "content": f"You have ratings of the following types:\n\n{types_message}"
+                "content": f"Which of these **{sort_session.rating_type}s** do you prefer?",
+                "components": [
+                    {
+                        "type": MessageComponentType.ACTION_ROW,
+                        "components": [
+                            {
+                                **_BUTTON_SKELETON,
+                                "label": sort_session.names[preferred_id][:BUTTON_LABEL_MAX_LENGTH],
+                                "custom_id": encode_sort_answer(
+                                    SortAnswer(sort_session.session_id, first_id, second_id, preferred_id)
+                                ),
+                            }
+                            for preferred_id in comparison
+                        ],
+                    }
+                ],
             },
         }
 
+    @staticmethod
+    def get_ratings_list_json(rating_type: str, ratings: list[Rating]):
+        """The first page of ``ratings``, lowest first, when they're already loaded."""
+        return RatingJsonResponder.get_ratings_page_json(
+            rating_type, RatingPage.first_page_of(ratings, get_list_page_size())
+        )
+
+    @staticmethod
+    def get_ratings_page_json(
+        rating_type: str,
+        page: RatingPage,
+        response_type: InteractionCallbackType = InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
+    ):
+        if len(page.ratings) == 0:
+            return _message_json(f"You have no ratings of **{rating_type}s**", response_type)
+
+        header = f"Your ratings for **{rating_type}s** are:\n\n"
+        length = len(header)
+        lines: list[str] = []
+        for r in page.ratings:
+            line = f"{r.name}: {r.value}"
+            length += len(line) + (1 if lines else 0)
+            if length > MESSAGE_MAX_LENGTH:
+                if not lines:
+                    lines.append(line[: MESSAGE_MAX_LENGTH - len(header)])
+                break
+            lines.append(line)
+        shown = page.ratings[: len(lines)]
+        # Whatever didn't fit is the start of the next page
+        has_next = page.has_next or len(shown) < len(page.ratings)
+
+        data: dict = {"content": header + "\n".join(lines)}
+        buttons = RatingJsonResponder._get_page_buttons(rating_type, shown, page.has_previous, has_next)
+        # An update replaces the whole message, so the row must be cleared explicitly
+        if buttons or response_type == InteractionCallbackType.UPDATE_MESSAGE:
+            data["components"] = (
+                [{"type": MessageComponentType.ACTION_ROW, "components": buttons}] if buttons else []
+            )
+        return {"type": response_type, "data": data}
+
+    @staticmethod
+    def _get_page_buttons(rating_type: str, shown: list[Rating], has_previous: bool, has_next: bool) -> list:
+        if not has_previous and not has_next:
+            return []
+        first, last = shown[0], shown[-1]
+        previous_id = encode_list_page(ListPageCursor(False, rating_type, Rating.get_sort_key(first), first.id))
+        next_id = encode_list_page(ListPageCursor(True, rating_type, Rating.get_sort_key(last), last.id))
+        if previous_id is None or next_id is None:
+            current_app.logger.warning(f"Rating type {rating_type} is too long for page buttons")
+            return []
+        return [
+            {**_PAGE_BUTTON_SKELETON, "label": "Prev", "custom_id": previous_id, "disabled": not has_previous},
+            {**_PAGE_BUTTON_SKELETON, "label": "Next", "custom_id": next_id, "disabled": not has_next},
+        ]
+
+    @staticmethod
+    def get_top_json(rating_type: str, aggregates: list[RatingAggregate]):
+        if not aggregates:
+            return _message_json(f"Nobody in this server has ranked any **{rating_type}s** yet")
+
+        header = f"This server's top **{rating_type}s** are:\n\n"
+        lines: list[str] = []
+        length = len(header)
+        for (idx, aggregate) in enumerate(aggregates):
+            raters = "rating" if aggregate.rating_count == 1 else "ratings"
+            line = (
+                f"{idx + 1}. {aggregate.name}: {aggregate.mean_percentile} on average"
+                f" from {aggregate.rating_count} {raters}"
+            )
+            length += len(line) + (1 if lines else 0)
+            if length > MESSAGE_MAX_LENGTH:
+                break
+            lines.append(line)
+        return _message_json(header + "\n".join(lines))
+
+    @staticmethod
+    def get_top_outside_guild_json():
+        return _message_json("Server rankings are only available in a server")
+
+    @staticmethod
+    def get_types_list_json(rating_types: list[str]):
+        if len(rating_types) == 0:
+            return _NO_TYPES_JSON
+
+        types_message = "\n".join(rating_types)
+        return _message_json(f"You have ratings of the following types:\n\n{types_message}")
+
     @staticmethod
     def get_first_rating_json(rating_type: str):
-        return {
-            "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
-            "data": {
-                "content": f"Thanks for adding your first **{rating_type}**! Rate another **{rating_type}** to create a relative ranking."
-            },
-        }
+        return _message_json(
+            f"Thanks for adding your first **{rating_type}**! Rate another **{rating_type}** to create a relative ranking."
+        )
 
     @staticmethod
     def get_removed_success_json(rating: Rating):
-        return {
-            "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
-            "data": {
-                "content": f"Removed **{rating.name}** from your **{rating.type}s** ratings"
-            },
-        }
+        return _message_json(f"Removed **{rating.name}** from your **{rating.type}s** ratings")
+
+    @staticmethod
+    def get_stale_comparison_json(rating: Rating):
+        return _message_json(
+            f"That comparison for **{rating.name}** was already answered, use the latest one instead"
+        )
+
+    @staticmethod
+    def get_stale_sort_comparison_json():
+        return _message_json("That comparison was already answered, use the latest one instead")
+
+    @staticmethod
+    def get_invalid_batch_json(max_items: int):
+        return _message_json(f"Add between 1 and {max_items} names, separated by commas")
 
     @staticmethod
     def get_not_found_json(identifier: str, username: str):
-        return {
-            "type": InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE,
-            "data": {"content": f"Cannot find rating {identifier} for user {username}"},
-        }
+        return _message_json(f"Cannot find rating {identifier} for user {username}")
@@ -0,0 +1,36 @@
+import csv
+from typing import Any, Iterable
+
+
+class InvalidImportException(Exception):
+    pass
+
+
+def parse_json_names(content: Any) -> list[str]:
+    """Reads the ordered names from a JSON list of names or of rating objects
+    with a ``name``, or from an object with that list under ``ratings``."""
+    if isinstance(content, dict):
+        content = content.get("ratings")
+    if not isinstance(content, list):
+        raise InvalidImportException("Expected a list of ratings")
+    names = [item.get("name") if isinstance(item, dict) else item for item in content]
+    return _check_names(names)
+
+
+def parse_csv_names(lines: Iterable[str]) -> list[str]:
+    """Reads the ordered names from CSV with a ``name`` column, such as a
+    ratings export."""
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None or "name" not in reader.fieldnames:
+        raise InvalidImportException("CSV must have a header row with a name column")
+    return _check_names([row["name"] for row in reader])
+
+
+def _check_names(names: list) -> list[str]:
+    if not all(isinstance(name, str) and name.strip() for name in names):
+        raise InvalidImportException("Every rating needs a name")
+    names = [name.strip() for name in names]
+    lowered = {name.lower() for name in names}
+    if len(lowered) != len(names):
+        raise InvalidImportException("Rating names must be unique")
+    return names
@@ -0,0 +1,405 @@
+"""Sort sessions rank several ratings at once from the user's answers to pairwise
+comparisons.
+
+The sort algorithms are plain functions of a comparator. A session keeps every
+answer it has been given and replays its algorithm from the start on each
+click: the first comparison it hasn't been given an answer for is the next
+question, and once the algorithm finishes the session has the final order.
+Replaying keeps the session state down to the items and the answers, and lets
+a session carry its answers over to a list that changed under it.
+"""
+import uuid
+from typing import Callable, Optional, TYPE_CHECKING
+
+from flask import current_app
+
+from ..interaction_cache import InteractionCache
+from ..models.rating import Rating
+from .rating_calculator import StaleComparisonException
+
+if TYPE_CHECKING:
+    from ..models.user import User
+
+# Whether the first item is rated lower than the second
+Comparator = Callable[[int, int], bool]
+
+# How many times in a row one list has to win before a merge starts galloping
+MIN_GALLOP = 7
+# Runs shorter than this are grown by binary insertion before merging
+MIN_RUN = 4
+
+
+class ComparisonNeeded(Exception):
+    """Raised by a session's comparator for a pair it has no answer for yet."""
+
+    def __init__(self, first_id: int, second_id: int):
+        super().__init__(first_id, second_id)
+        self.first_id = first_id
+        self.second_id = second_id
+
+
+def binary_insertion_point(items: list[int], item: int, lowest: int, highest: int, less: Comparator) -> int:
+    """How many of items[lowest:highest], lowest first, item is rated above."""
+    while lowest < highest:
+        middle = (lowest + highest) // 2
+        if less(item, items[middle]):
+            highest = middle
+        else:
+            lowest = middle + 1
+    return lowest
+
+
+def merge_insertion_sort(items: list[int], less: Comparator) -> list[int]:
+    """Sorts items lowest first with Ford-Johnson merge insertion, which needs
+    close to the fewest comparisons possible for small lists.
+
+    Items are paired and compared, the larger of each pair is sorted
+    recursively, then the smaller ones are binary inserted in an order that
+    keeps each search within a range of 2^k - 1 items.
+    """
+    if len(items) <= 1:
+        return list(items)
+    pairs = []
+    for idx in range(0, len(items) - 1, 2):
+        first, second = items[idx], items[idx + 1]
+        pairs.append((second, first) if less(first, second) else (first, second))
+    smaller_of = dict(pairs)
+
+    chain = merge_insertion_sort([larger for (larger, _) in pairs], less)
+    pending = [smaller_of[larger] for larger in chain]
+    # Each pending item is below its larger partner, except a leftover odd one
+    bounds: list[Optional[int]] = list(chain)
+    if len(items) % 2:
+        pending.append(items[-1])
+        bounds.append(None)
+
+    chain.insert(0, pending[0])
+    for idx in _insertion_order(len(pending)):
+        bound = bounds[idx]
+        highest = len(chain) if bound is None else chain.index(bound)
+        chain.insert(binary_insertion_point(chain, pending[idx], 0, highest, less), pending[idx])
+    return chain
+
+
+def _insertion_order(count: int) -> list[int]:
+    # Groups end at the Jacobsthal numbers 3, 5, 11, 21, ... and go in descending order
+    order: list[int] = []
+    previous, end = 1, 3
+    while len(order) < count - 1:
+        order.extend(idx - 1 for idx in range(min(end, count), previous, -1))
+        previous, end = end, end + 2 * previous
+    return order
+
+
+def insert_sorted(existing: list[int], new_items: list[int], less: Comparator) -> list[int]:
+    """Merges already sorted new items into a sorted list, both lowest first.
+
+    The highest new item is inserted first, and every lower one only has to be
+    searched for below where the one above it went.
+    """
+    positions = []
+    highest = len(existing)
+    for item in reversed(new_items):
+        highest = binary_insertion_point(existing, item, 0, highest, less)
+        positions.append(highest)
+    positions.reverse()
+
+    merged = []
+    start = 0
+    for (item, position) in zip(new_items, positions):
+        merged.extend(existing[start:position])
+        merged.append(item)
+        start = position
+    merged.extend(existing[start:])
+    return merged
+
+
+def natural_merge_sort(items: list[int], less: Comparator) -> list[int]:
+    """Sorts items lowest first, taking advantage of any order they're already in.
+
+    The ascending runs already in items are found with one comparison per
+    item, growing runs shorter than MIN_RUN by binary insertion, and then
+    merged pairwise with galloping_merge. An already sorted list takes
+    len(items) - 1 comparisons and each item out of place adds a few more,
+    while a shuffled one costs about as much as a plain merge sort.
+    """
+    if not items:
+        return []
+    runs = [[items[0]]]
+    for item in items[1:]:
+        run = runs[-1]
+        if not less(item, run[-1]):
+            run.append(item)
+        elif len(run) < MIN_RUN:
+            # Short runs are grown by binary insertion, which takes fewer
+            # comparisons than merging many tiny runs
+            run.insert(binary_insertion_point(run, item, 0, len(run) - 1, less), item)
+        else:
+            runs.append([item])
+    while len(runs) > 1:
+        runs = [
+            galloping_merge(runs[idx], runs[idx + 1], less) if idx + 1 < len(runs) else runs[idx]
+            for idx in range(0, len(runs), 2)
+        ]
+    return runs[0]
+
+
+def galloping_merge(left: list[int], right: list[int], less: Comparator) -> list[int]:
+    """Merges two sorted lists, lowest first, keeping left first on ties.
+
+    Like Timsort, the ends of the lists already in order are skipped by
+    galloping from where they meet. The rest is merged one item at a time until
+    one list wins MIN_GALLOP times in a row, and only then by galloping along
+    whichever list the next items come from, which costs about 2 log2(d)
+    comparisons for a stretch of d items. Galloping stops again once stretches
+    get short, and the threshold adapts like Timsort's, so a list that
+    alternates costs no more than a plain merge.
+    """
+    if not left or not right:
+        return left + right
+    # Where right[0] goes in left, and where left[-1] goes in right
+    start = _gallop(lambda idx: less(right[0], left[idx]), 0, len(left))
+    if start == len(left):
+        return left + right
+    end = _gallop(lambda idx: not less(right[idx], left[-1]), 0, len(right), from_end=True)
+
+    # right[0] and left[-1] are already placed, so only what's between them is merged
+    last = len(left) - 1
+    merged = left[:start] + right[:1]
+    (i, j) = (start, 1)
+    min_gallop = MIN_GALLOP
+    while i < last and j < end:
+        (left_wins, right_wins) = (0, 0)
+        while i < last and j < end and max(left_wins, right_wins) < min_gallop:
+            if less(right[j], left[i]):
+                merged.append(right[j])
+                j += 1
+                (left_wins, right_wins) = (0, right_wins + 1)
+            else:
+                merged.append(left[i])
+                i += 1
+                (left_wins, right_wins) = (left_wins + 1, 0)
+
+        min_gallop += 1
+        while i < last and j < end:
+            min_gallop -= min_gallop > 1
+            k = _gallop(lambda idx: less(right[j], left[idx]), i, last)
+            merged.extend(left[i:k])
+            (left_wins, i) = (k - i, k)
+            if i == last:
+                break
+            k = _gallop(lambda idx: not less(right[idx], left[i]), j, end)
+            merged.extend(right[j:k])
+            (right_wins, j) = (k - j, k)
+            if left_wins < MIN_GALLOP and right_wins < MIN_GALLOP:
+                break
+        # Leaving galloping makes it harder to start again
+        min_gallop += 1
+    return merged + left[i:last] + right[j:end] + left[last:] + right[end:]
+
+
+def _gallop(is_past: Callable[[int], bool], lowest: int, highest: int, from_end: bool = False) -> int:
+    """The first index in [lowest, highest) where is_past is true, or highest.
+
+    Probes at doubling distances from one end, then binary searches the range
+    the answer was bracketed in, so an answer d from that end costs about
+    2 log2(d) calls.
+    """
+    offset = 1
+    if from_end:
+        probe = highest - 1
+        while probe >= lowest and is_past(probe):
+            highest = probe
+            probe = highest - offset
+            offset *= 2
+        lowest = max(probe + 1, lowest)
+    else:
+        probe = lowest
+        while probe < highest and not is_past(probe):
+            lowest = probe + 1
+            probe = lowest + offset - 1
+            offset *= 2
+        highest = min(probe, highest)
+    while lowest < highest:
+        middle = (lowest + highest) // 2
+        if is_past(middle):
+            highest = middle
+        else:
+            lowest = middle + 1
+    return lowest
+
+
+SORT_SESSION_KINDS = ("add", "rerank")
+
+
+class SortSession:
+    """Ranks the user's list of a type, both ``existing_ids`` and ``new_ids`` lowest first.
+
+    An ``add`` session ranks ``new_ids`` into the already ranked
+    ``existing_ids``. A ``rerank`` session re-sorts ``new_ids``, the window of
+    ``existing_ids`` being re-ranked, in place in the list.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        user_id: int,
+        rating_type: str,
+        names: dict[int, str],
+        existing_ids: list[int],
+        new_ids: list[int],
+        answers: Optional[dict[str, int]] = None,
+        kind: str = "add",
+    ):
+        if kind not in SORT_SESSION_KINDS:
+            raise ValueError(f"Unknown sort session kind: {kind}")
+        self.session_id = session_id
+        self.user_id = user_id
+        self.rating_type = rating_type
+        self.names = names
+        self.existing_ids = existing_ids
+        self.new_ids = new_ids
+        self.kind = kind
+        # The preferred id of each compared pair, keyed by the pair's ids in order
+        self.answers = answers or {}
+
+    def to_json(self):
+        return {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "rating_type": self.rating_type,
+            "names": {str(rating_id): name for (rating_id, name) in self.names.items()},
+            "existing_ids": self.existing_ids,
+            "new_ids": self.new_ids,
+            "answers": self.answers,
+            "kind": self.kind,
+        }
+
+    @classmethod
+    def create_from_json(cls, data: dict) -> "SortSession":
+        return cls(
+            session_id=data["session_id"],
+            user_id=data["user_id"],
+            rating_type=data["rating_type"],
+            names={int(rating_id): name for (rating_id, name) in data["names"].items()},
+            existing_ids=data["existing_ids"],
+            new_ids=data["new_ids"],
+            answers=data["answers"],
+            kind=data.get("kind", "add"),
+        )
+
+    @staticmethod
+    def get_cache_key(session_id: str) -> str:
+        return f"sort:{session_id}"
+
+    @classmethod
+    def find(cls, session_id: str) -> Optional["SortSession"]:
+        return InteractionCache.get_sort_session(cls.get_cache_key(session_id))
+
+    def store(self) -> None:
+        InteractionCache.store_sort_session(self.get_cache_key(self.session_id), self)
+
+    def complete(self) -> None:
+        InteractionCache.remove_sort_session(self.get_cache_key(self.session_id))
+
+    @classmethod
+    def begin_adding(cls, user: "User", rating_type: str, rating_names: list[str]) -> "SortSession":
+        """Creates the new ratings and starts ranking them into the user's list,
+        which is loaded just this once until the session finishes."""
+        new_ratings = Rating.get_or_create_ratings(user, rating_names, rating_type)
+        new_ids = [r.id for r in new_ratings]
+        existing = [r for r in Rating.get_ratings_for_user_by_type(user, rating_type) if r.id not in new_ids]
+        return cls(
+            session_id=uuid.uuid4().hex[:16],
+            user_id=user.id,
+            rating_type=rating_type,
+            names={r.id: r.name for r in existing + new_ratings},
+            existing_ids=[r.id for r in existing],
+            new_ids=new_ids,
+        )
+
+    @classmethod
+    def begin_reranking(
+        cls, user: "User", rating_type: str, highest_rank: int = 1, lowest_rank: Optional[int] = None
+    ) -> "SortSession":
+        """Starts re-sorting the user's ratings ranked highest_rank to lowest_rank
+        inclusive, counting from 1 for the highest rated."""
+        ratings = Rating.get_ratings_for_user_by_type(user, rating_type)
+        lowest_rank = len(ratings) if lowest_rank is None else lowest_rank
+        window = ratings[max(len(ratings) - lowest_rank, 0) : max(len(ratings) - highest_rank + 1, 0)]
+        return cls(
+            session_id=uuid.uuid4().hex[:16],
+            user_id=user.id,
+            rating_type=rating_type,
+            names={r.id: r.name for r in window},
+            existing_ids=[r.id for r in ratings],
+            new_ids=[r.id for r in window],
+            kind="rerank",
+        )
+
+    def sort(self, less: Comparator) -> list[int]:
+        if self.kind == "add":
+            return insert_sorted(self.existing_ids, merge_insertion_sort(self.new_ids, less), less)
+        window = set(self.new_ids)
+        ranked = iter(natural_merge_sort(self.new_ids, less))
+        return [next(ranked) if rating_id in window else rating_id for rating_id in self.existing_ids]
+
+    def get_next_comparison(self) -> Optional[tuple[int, int]]:
+        """The next pair of ids to compare, or None once the order is known."""
+        try:
+            self.sort(self._answered_less)
+        except ComparisonNeeded as e:
+            return (e.first_id, e.second_id)
+        return None
+
+    def add_answer(self, first_id: int, second_id: int, preferred_id: int) -> None:
+        if self.get_next_comparison() != (first_id, second_id) or preferred_id not in (first_id, second_id):
+            # Usually a duplicated or out of date button click
+            raise StaleComparisonException(f"{first_id} and {second_id} aren't the next comparison")
+        self.answers[_pair_key(first_id, second_id)] = preferred_id
+
+    def get_final_order(self) -> list[int]:
+        """Every id, lowest first. Raises ComparisonNeeded until all are answered."""
+        return self.sort(self._answered_less)
+
+    def advance(self, user: "User") -> Optional[tuple[int, int]]:
+        """Returns the next comparison to ask, or saves the final order with at
+        most a single write and returns None when there are none left.
+
+        The user's list is checked for changes before saving. Ratings added or
+        removed since the session began are ranked in using the answers so far.
+        """
+        next_comparison = self.get_next_comparison()
+        if next_comparison is None and self._refresh(Rating.get_ratings_for_user_by_type(user, self.rating_type)):
+            next_comparison = self.get_next_comparison()
+        if next_comparison is not None:
+            return next_comparison
+
+        order = self.get_final_order()
+        # A re-rank that confirmed the existing order has nothing to save
+        if order != self.existing_ids:
+            Rating.save_order(user, self.rating_type, order)
+        current_app.logger.info(f"Sort session {self.session_id} finished after {len(self.answers)} comparisons")
+        return None
+
+    def _refresh(self, current: list[Rating]) -> bool:
+        current_ids = {r.id for r in current}
+        new_ids = [rating_id for rating_id in self.new_ids if rating_id in current_ids]
+        # A re-ranked window stays where it is in the list
+        existing_ids = [r.id for r in current if self.kind == "rerank" or r.id not in new_ids]
+        if new_ids == self.new_ids and existing_ids == self.existing_ids:
+            return False
+        self.names.update({r.id: r.name for r in current})
+        self.new_ids = new_ids
+        self.existing_ids = existing_ids
+        return True
+
+    def _answered_less(self, first_id: int, second_id: int) -> bool:
+        preferred_id = self.answers.get(_pair_key(first_id, second_id))
+        if preferred_id is None:
+            raise ComparisonNeeded(first_id, second_id)
+        return preferred_id == second_id
+
+
+def _pair_key(first_id: int, second_id: int) -> str:
+    return f"{min(first_id, second_id)}:{max(first_id, second_id)}"
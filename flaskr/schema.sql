@@ -1,18 +1,8 @@
+-- Run by init-db before applying every migration, to start from an empty database
+DROP TABLE IF EXISTS rating_aggregate;
+DROP TABLE IF EXISTS rating_contribution;
+DROP TABLE IF EXISTS guild_member;
 DROP TABLE IF EXISTS hearrd_user CASCADE;
 DROP TABLE IF EXISTS rating;
-
-CREATE TABLE hearrd_user (
-  id INTEGER PRIMARY KEY GENERATED ALWAYS AS IDENTITY,
-  username TEXT UNIQUE NOT NULL
-);
-
-CREATE TABLE rating (
-  id INTEGER PRIMARY KEY GENERATED ALWAYS AS IDENTITY,
-  user_id INTEGER NOT NULL,
-  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  type TEXT NOT NULL,
-  name TEXT NOT NULL,
-  value REAL,
-  FOREIGN KEY (user_id) REFERENCES hearrd_user (id),
-  UNIQUE(user_id, type, name)
-);
+DROP TABLE IF EXISTS rating_session;
+DROP TABLE IF EXISTS schema_migration;
@@ -1,26 +1,169 @@
-from typing import Tuple, Union, cast
-from flask import Blueprint, request, current_app, jsonify, Response
+import base64
+import io
+import json
+import time
+from typing import Optional, Sequence, Tuple, Union, cast
+from flask import Blueprint, request, current_app, jsonify, Response, stream_with_context
 
+from ..models.aggregate import AGGREGATE_SORTS, RatingAggregate
 from ..models.rating import Rating
-from ..ratings.rating_calculator import RatingCalculator, CompletedComparison
+from ..ratings.rating_export import EXPORT_FORMATS, to_csv_lines, to_ndjson_lines
+from ..ratings.rating_import import InvalidImportException, parse_csv_names, parse_json_names
+from ..ratings.sort_session import SortSession
+from ..ratings.rating_calculator import (
+    RatingCalculator,
+    CompletedComparison,
+    StaleComparisonException,
+)
 from ..models.user import User
 
 bp = Blueprint("api", __name__, url_prefix="/api")
 
 
+RATING_FIELDS = ("id", "name", "type", "value", "user_id", "rank_key")
+# rank_key is only returned when asked for, so responses keep their original shape
+DEFAULT_RATING_FIELDS = ("id", "name", "type", "value", "user_id")
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+class InvalidQueryException(Exception):
+    pass
+
+
 @bp.route("/ratings", methods=["GET"])
 def get_ratings() -> Union[Response, Tuple[Response, int]]:
+    """Lists a user's ratings of a type, highest first.
+
+    ``limit`` returns one page at a time along with the ``next_cursor`` to pass
+    as ``cursor`` for the next one. ``fields`` picks which rating fields to return
+    and ``format=ndjson`` streams every rating after ``cursor``, one per line.
+    """
     username = request.args.get("username")
     rating_type = request.args.get("rating_type")
     current_app.logger.info(f"Getting ratings of type {rating_type} for {username}")
+    try:
+        fields = _parse_fields(request.args.get("fields"))
+        after = _decode_cursor(request.args.get("cursor"))
+        limit = _parse_limit(request.args.get("limit"))
+    except InvalidQueryException as e:
+        return (jsonify({"error": str(e)}), 400)
+
     # Begin shareable part
     user = User.get_by_username(username=cast(str, username))
     if user is None:
         return (jsonify({"error": f"User {username} not found"}), 404)
-    ratings = user.get_ratings(rating_type=rating_type)
     # End shareable part
-    ratings.reverse()
-    return jsonify({"ratings": [r.to_json() for r in ratings]})
+
+    if request.args.get("format") == "ndjson" or request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        ratings = Rating.stream_ratings_for_user_by_type(
+            user,
+            cast(str, rating_type),
+            after=after,
+            itersize=current_app.config.get("API_STREAM_ITERSIZE", 500),
+        )
+        return Response(
+            stream_with_context(f"{current_app.json.dumps(_select_fields(r, fields))}\n" for r in ratings),
+            mimetype=NDJSON_MIMETYPE,
+        )
+
+    if limit is None and after is None:
+        ratings = Rating.stream_ratings_for_user_by_type(user, cast(str, rating_type))
+        return jsonify({"ratings": [_select_fields(r, fields) for r in ratings]})
+
+    page = Rating.get_ratings_page(
+        user,
+        cast(str, rating_type),
+        limit or current_app.config.get("API_RATINGS_MAX_LIMIT", 1000),
+        after=after,
+    )
+    return jsonify(
+        {
+            "ratings": [_select_fields(r, fields) for r in page.ratings],
+            "next_cursor": _encode_cursor(page.ratings[-1]) if page.has_next else None,
+        }
+    )
+
+
+def _parse_fields(fields: Optional[str]) -> Sequence[str]:
+    if not fields:
+        return DEFAULT_RATING_FIELDS
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in RATING_FIELDS]
+    if unknown:
+        raise InvalidQueryException(f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+def _parse_limit(limit: Optional[str]) -> Optional[int]:
+    if limit is None:
+        return None
+    max_limit = current_app.config.get("API_RATINGS_MAX_LIMIT", 1000)
+    try:
+        parsed = int(limit)
+    except ValueError:
+        raise InvalidQueryException(f"Invalid limit: {limit}")
+    if not 1 <= parsed <= max_limit:
+        raise InvalidQueryException(f"limit must be between 1 and {max_limit}")
+    return parsed
+
+
+def _encode_cursor(rating: Rating) -> str:
+    # Opaque to clients, so the keyset can change without breaking them
+    cursor = json.dumps([Rating.get_sort_key(rating), rating.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(cursor.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    if not cursor:
+        return None
+    try:
+        sort_key, rating_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(rating_id, int) or not (sort_key is None or isinstance(sort_key, (int, float))):
+            raise ValueError(cursor)
+    except (TypeError, ValueError):
+        raise InvalidQueryException(f"Invalid cursor: {cursor}")
+    return (sort_key, rating_id)
+
+
+def _select_fields(rating: Rating, fields: Sequence[str]) -> dict:
+    rating_json = rating.to_json()
+    return {field: rating_json[field] for field in fields}
+
+
+def _rating_json(rating: Rating) -> dict:
+    return _select_fields(rating, DEFAULT_RATING_FIELDS)
+
+
+@bp.route("/export", methods=["GET"])
+def export_ratings() -> Union[Response, Tuple[Response, int]]:
+    """Streams every rating, or only a ``username``'s and/or a ``rating_type``'s,
+    as ``format=csv`` or ``ndjson`` (the default)."""
+    username = request.args.get("username")
+    rating_type = request.args.get("rating_type")
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return (jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400)
+    current_app.logger.info(f"Exporting ratings of type {rating_type} for {username} as {export_format}")
+
+    user = None
+    if username is not None:
+        user = User.get_by_username(username=username)
+        if user is None:
+            return (jsonify({"error": f"User {username} not found"}), 404)
+
+    rows = Rating.stream_export(
+        user, rating_type, itersize=current_app.config.get("API_STREAM_ITERSIZE", 500)
+    )
+    if export_format == "csv":
+        lines, mimetype = to_csv_lines(rows), "text/csv"
+    else:
+        lines, mimetype = to_ndjson_lines(rows, current_app.json.dumps), NDJSON_MIMETYPE
+    return Response(
+        stream_with_context(lines),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=ratings.{export_format}"},
+    )
 
 
 @bp.route("/ratings", methods=["POST"])
@@ -46,10 +189,55 @@ def create_rating() -> Union[Response, Tuple[Response, int]]:
         )
     next_comparison = rating_calculator.get_next_comparison()
     if next_comparison is None:
+        Rating.save_new_order(user=user, new_ratings=[new_rating], placed_rating=new_rating)
         rating_calculator.complete()
-        return jsonify({"rating": new_rating.to_json()})
+        return jsonify({"rating": _rating_json(new_rating)})
     # End shareable part
-    return jsonify({"rating": new_rating.to_json(), "next_comparison": next_comparison.to_json()})
+    return jsonify({"rating": _rating_json(new_rating), "next_comparison": next_comparison.to_json()})
+
+
+@bp.route("/ratings/import", methods=["POST"])
+def import_ratings() -> Union[Response, Tuple[Response, int]]:
+    """Saves an already ordered list of ratings, highest first, in one go.
+
+    Takes a JSON object with ``username``, ``rating_type`` and ``ratings`` (names
+    or objects with a ``name``), or CSV with a ``name`` column and the username
+    and rating type as query args. ``replace`` removes the user's other ratings
+    of the type.
+    """
+    try:
+        if request.mimetype == "text/csv":
+            content: dict = dict(request.args)
+            names = parse_csv_names(io.StringIO(request.get_data(as_text=True)))
+        else:
+            body = request.json
+            if not isinstance(body, dict):
+                raise InvalidImportException("Expected a JSON object with the ratings under ratings")
+            content = body
+            names = parse_json_names(content)
+    except InvalidImportException as e:
+        return (jsonify({"error": str(e)}), 400)
+    username = content.get("username")
+    rating_type = content.get("rating_type")
+    replace = content.get("replace") in (True, "true", "1")
+    if not rating_type:
+        return (jsonify({"error": "rating_type is required"}), 400)
+    current_app.logger.info(f"Importing {len(names)} ratings of type {rating_type} for {username}")
+
+    user = User.get_by_username(username=cast(str, username))
+    if user is None:
+        return (jsonify({"error": f"User {username} not found"}), 404)
+    started = time.perf_counter()
+    imported = Rating.import_ordered(user, rating_type, names, replace=replace)
+    elapsed = time.perf_counter() - started
+    return jsonify(
+        {
+            "imported": imported,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(imported / elapsed) if elapsed else None,
+        }
+    )
+
 
 @bp.route("/ratings/compare", methods=["PUT"])
 def create_comparison() -> Union[Response, Tuple[Response, int]]:
@@ -72,10 +260,13 @@ def create_comparison() -> Union[Response, Tuple[Response, int]]:
     if rating is None:
         return (jsonify({"error": f"Rating with id {rating_id} not found"}), 404)
 
-    rating_calculator = RatingCalculator.continue_rating(
-        item_being_rated=rating,
-        comparison=comparison,
-    )
+    try:
+        rating_calculator = RatingCalculator.continue_rating(
+            item_being_rated=rating,
+            comparison=comparison,
+        )
+    except StaleComparisonException:
+        return (jsonify({"error": f"Comparison at index {comparison_index} is out of date"}), 409)
     if rating_calculator is None:
         return (jsonify({"error": f"No ongoing rating found for {rating.name}"}), 404)
     next_comparison = rating_calculator.get_next_comparison()
@@ -83,10 +274,91 @@ def create_comparison() -> Union[Response, Tuple[Response, int]]:
         return jsonify({"next_comparison": next_comparison.to_json()})
 
     new_ratings = rating_calculator.get_overall_ratings()
-    Rating.update_all_with_new_ratings(user=user, new_ratings=new_ratings)
+    Rating.save_new_order(user=user, new_ratings=new_ratings, placed_rating=rating)
     rating_calculator.complete()
     # End shareable part
-    return jsonify({"new_ratings": [r.to_json() for r in new_ratings]})
+    return jsonify({"new_ratings": [_rating_json(r) for r in new_ratings]})
+
+@bp.route("/ratings/batch", methods=["POST"])
+def create_ratings_batch() -> Union[Response, Tuple[Response, int]]:
+    """Adds several ratings at once and ranks them together, one pairwise
+    comparison at a time, saving the final order once every answer is in."""
+    content: dict = cast(dict, request.json)
+    username = content["username"]
+    rating_type = content["rating_type"]
+    rating_names = [name.strip() for name in content["rating_names"] if name.strip()]
+    max_items = current_app.config.get("RATING_BATCH_MAX_ITEMS", 25)
+    if not rating_names or len(rating_names) > max_items:
+        return (jsonify({"error": f"rating_names must have between 1 and {max_items} names"}), 400)
+    if len({name.lower() for name in rating_names}) != len(rating_names):
+        return (jsonify({"error": "rating_names must be unique"}), 400)
+    current_app.logger.info(f"Adding {len(rating_names)} ratings of type {rating_type} for {username}")
+
+    user = User.get_by_username(username=username)
+    if user is None:
+        return (jsonify({"error": f"User {username} not found"}), 404)
+    sort_session = SortSession.begin_adding(user, rating_type, rating_names)
+    return _advance_sort_session(user, sort_session)
+
+
+@bp.route("/ratings/rerank", methods=["POST"])
+def create_rerank() -> Union[Response, Tuple[Response, int]]:
+    """Re-sorts a user's ratings of a type, or those ranked ``from`` to ``to``
+    counting from 1 for the highest, saving the new order once it's known."""
+    content: dict = cast(dict, request.json)
+    username = content["username"]
+    rating_type = content["rating_type"]
+    highest_rank = content.get("from", 1)
+    lowest_rank = content.get("to")
+    if highest_rank < 1 or (lowest_rank is not None and lowest_rank < highest_rank):
+        return (jsonify({"error": "from must be at least 1 and no more than to"}), 400)
+    current_app.logger.info(f"Re-ranking ratings of type {rating_type} for {username}")
+
+    user = User.get_by_username(username=username)
+    if user is None:
+        return (jsonify({"error": f"User {username} not found"}), 404)
+    sort_session = SortSession.begin_reranking(user, rating_type, highest_rank, lowest_rank)
+    return _advance_sort_session(user, sort_session)
+
+
+@bp.route("/ratings/batch/compare", methods=["PUT"])
+@bp.route("/ratings/rerank/compare", methods=["PUT"])
+def create_batch_comparison() -> Union[Response, Tuple[Response, int]]:
+    content: dict = cast(dict, request.json)
+    username = content["username"]
+    session_id = content["session_id"]
+    (first_id, second_id) = content["comparison"]["ids"]
+    preferred_id = content["preferred_id"]
+
+    user = User.get_by_username(username)
+    sort_session = SortSession.find(session_id)
+    if user is None or sort_session is None or sort_session.user_id != user.id:
+        return (jsonify({"error": f"No ongoing session {session_id} found"}), 404)
+    try:
+        sort_session.add_answer(first_id, second_id, preferred_id)
+    except StaleComparisonException:
+        return (jsonify({"error": f"Comparison of {first_id} and {second_id} is out of date"}), 409)
+    return _advance_sort_session(user, sort_session)
+
+
+def _advance_sort_session(user: User, sort_session: SortSession) -> Response:
+    next_comparison = sort_session.advance(user)
+    if next_comparison is not None:
+        sort_session.store()
+        return jsonify(
+            {
+                "session_id": sort_session.session_id,
+                "next_comparison": {
+                    "ids": list(next_comparison),
+                    "names": [sort_session.names[rating_id] for rating_id in next_comparison],
+                },
+            }
+        )
+
+    sort_session.complete()
+    new_ratings = user.get_ratings(rating_type=sort_session.rating_type)
+    return jsonify({"session_id": sort_session.session_id, "new_ratings": [_rating_json(r) for r in new_ratings]})
+
 
 @bp.route("/ratings", methods=["DELETE"])
 def delete_rating() -> Union[Response, Tuple[Response, int]]:
@@ -115,6 +387,29 @@ def delete_rating() -> Union[Response, Tuple[Response, int]]:
     return jsonify({"rating_id": rating.id})
 
 
+@bp.route("/aggregate", methods=["GET"])
+def get_aggregate() -> Union[Response, Tuple[Response, int]]:
+    """A guild's top items of a type across its members, by total Borda score or
+    with ``sort=mean`` by mean percentile, read from the maintained aggregates."""
+    rating_type = request.args.get("rating_type")
+    sort = request.args.get("sort", "borda")
+    try:
+        guild_id = int(cast(str, request.args.get("guild_id")))
+    except (TypeError, ValueError):
+        return (jsonify({"error": "guild_id is required"}), 400)
+    if not rating_type:
+        return (jsonify({"error": "rating_type is required"}), 400)
+    if sort not in AGGREGATE_SORTS:
+        return (jsonify({"error": f"sort must be one of {', '.join(AGGREGATE_SORTS)}"}), 400)
+    try:
+        limit = _parse_limit(request.args.get("limit")) or current_app.config.get("RATING_TOP_LIMIT", 10)
+    except InvalidQueryException as e:
+        return (jsonify({"error": str(e)}), 400)
+
+    aggregates = RatingAggregate.get_top(guild_id, rating_type, limit, sort)
+    return jsonify({"aggregates": [a.to_json() for a in aggregates]})
+
+
 @bp.route("/rating_types", methods=["GET"])
 def ratings_types() -> Union[Response, Tuple[Response, int]]:
     username = request.args.get("username")
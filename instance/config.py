@@ -0,0 +1,4 @@
+DB_NAME="flaskr_test"
+DB_USER="postgres"
+DB_PASSWORD=""
+DB_HOST="localhost"
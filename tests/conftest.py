@@ -24,6 +24,8 @@ def app():
 
     yield app
 
+    if "db_pool" in app.extensions:
+        app.extensions["db_pool"].close()
     os.close(db_fd)
     os.unlink(db_path)
 
@@ -0,0 +1,78 @@
+import pytest
+
+from flaskr.models.aggregate import GuildMemberCache, RatingAggregate
+from flaskr.models.rating import Rating
+from flaskr.models.user import User
+
+GUILD_ID = 81384788765712384
+
+
+def top(sort: str = "borda") -> list:
+    return [
+        (a.name, a.rating_count, a.mean_percentile, a.borda_score)
+        for a in RatingAggregate.get_top(GUILD_ID, "movie", 10, sort)
+    ]
+
+
+@pytest.mark.parametrize("storage_mode", ["value", "rank_key"])
+def test_aggregates_follow_members_ratings(app, storage_mode):
+    app.config["RATING_STORAGE_MODE"] = storage_mode
+    with app.app_context():
+        alice = User.create_user("alice")
+        bob = User.create_user("bob")
+        # Ratings from before joining are counted when the member joins
+        Rating.import_ordered(alice, "movie", ["Alien", "Heat", "Jaws"])
+        RatingAggregate.join_guild(GUILD_ID, alice)
+        RatingAggregate.join_guild(GUILD_ID, bob)
+        assert top() == [("Alien", 1, 100.0, 2), ("Heat", 1, 50.0, 1), ("Jaws", 1, 0.0, 0)]
+
+        Rating.import_ordered(bob, "Movie", ["jaws", "alien"])
+        assert top() == [("Alien", 2, 50.0, 2), ("Heat", 1, 50.0, 1), ("Jaws", 2, 50.0, 1)]
+
+        ratings = alice.get_ratings(rating_type="movie")
+        Rating.remove_rating_for_user(alice, next(r for r in ratings if r.name == "Alien"))
+        Rating.save_order(bob, "Movie", [r.id for r in bob.get_ratings(rating_type="Movie")][::-1])
+        # Only bob's spelling is left behind "alien"
+        assert top() == [("alien", 1, 100.0, 1), ("Heat", 1, 100.0, 1), ("Jaws", 2, 0.0, 0)]
+        assert top("mean") == [("alien", 1, 100.0, 1), ("Heat", 1, 100.0, 1), ("Jaws", 2, 0.0, 0)]
+
+        # The same names and totals as computing them from scratch
+        maintained = top()
+        RatingAggregate.rebuild_all()
+        assert top() == maintained
+
+
+def test_aggregates_only_count_guild_members(app):
+    with app.app_context():
+        member = User.create_user("member")
+        other = User.create_user("other")
+        RatingAggregate.join_guild(GUILD_ID, member)
+        Rating.import_ordered(member, "movie", ["Alien", "Heat"])
+        Rating.import_ordered(other, "movie", ["Heat", "Alien"])
+        RatingAggregate.join_guild(GUILD_ID + 1, other)
+
+        assert top() == [("Alien", 1, 100.0, 1), ("Heat", 1, 0.0, 0)]
+        assert [a.name for a in RatingAggregate.get_top(GUILD_ID + 1, "movie", 10)] == ["Heat", "Alien"]
+
+
+def test_writes_skip_aggregates_for_users_in_no_guild(app):
+    with app.app_context():
+        loner = User.create_user("loner")
+        Rating.import_ordered(loner, "movie", ["Alien", "Heat"])
+        cache = GuildMemberCache.get()
+        assert cache.is_non_member(loner.id)
+
+        # Joining here forgets that, so later changes are counted again
+        RatingAggregate.join_guild(GUILD_ID, loner)
+        assert not cache.is_non_member(loner.id)
+        Rating.import_ordered(loner, "movie", ["Jaws"])
+        assert [a.name for a in RatingAggregate.get_top(GUILD_ID, "movie", 10)] == ["Jaws", "Alien", "Heat"]
+
+
+def test_non_members_are_forgotten_after_the_ttl():
+    now = [0.0]
+    cache = GuildMemberCache(10, non_member_ttl=60.0, clock=lambda: now[0])
+    cache.store_non_member(1)
+    assert cache.is_non_member(1)
+    now[0] = 60.0
+    assert not cache.is_non_member(1)
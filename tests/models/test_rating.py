@@ -1,3 +1,6 @@
+import threading
+
+from flaskr.db import get_db
 from flaskr.models.user import User
 from flaskr.models.rating import Rating
 
@@ -87,3 +90,120 @@ def test_update_all_with_new_ratings(app):
         assert Rating.get_by_name_for_user(user, a1.name, 'artist').value == 15.0
         assert Rating.get_by_name_for_user(user, a2.name, 'artist').value == 30.0
         assert Rating.get_by_name_for_user(user, a3.name, 'artist').value == 70.0
+
+def test_rank_key_mode_places_one_row(app, monkeypatch):
+    app.config["RATING_STORAGE_MODE"] = "rank_key"
+    # A tiny gap forces a rebalance after a couple of inserts into the same spot
+    monkeypatch.setattr("flaskr.models.rating.RANK_KEY_GAP", 4)
+    with app.app_context():
+        user = User.create_user("test")
+        low = Rating.create_rating(user, "low", 'artist')
+        Rating.place_between(user, low, None, None)
+        high = Rating.create_rating(user, "high", 'artist')
+        Rating.place_between(user, high, low, None)
+        assert [r.value for r in Rating.get_ratings_for_user(user)] == [0.0, 100.0]
+
+        lower = low
+        for name in ["m1", "m2", "m3"]:
+            middle = Rating.create_rating(user, name, 'artist')
+            Rating.place_between(user, middle, lower, high)
+            lower = middle
+
+        ratings = Rating.get_ratings_for_user(user)
+        assert [r.name for r in ratings] == ["low", "m1", "m2", "m3", "high"]
+        assert [r.value for r in ratings] == [0.0, 25.0, 50.0, 75.0, 100.0]
+        assert Rating.get_by_name_for_user(user, "m2", 'artist').value == 50.0
+        assert Rating.get_by_id_for_user(user, high.id).value == 100.0
+
+        Rating.remove_rating_for_user(user, lower)
+        assert [r.value for r in Rating.get_ratings_for_user(user)] == [0.0, 33.33, 66.67, 100.0]
+
+def test_get_or_create_rating_is_case_insensitive(app):
+    with app.app_context():
+        user = User.create_user("test")
+        rating = Rating.get_or_create_rating(user, "Adele", 'artist')
+        assert Rating.get_or_create_rating(user, "ADELE", 'Artist').id == rating.id
+        assert Rating.get_by_id_for_user(user, rating.id).name == "Adele"
+
+def test_get_or_create_rating_concurrently(app):
+    with app.app_context():
+        user = User.create_user("test")
+
+    thread_count = 8
+    barrier = threading.Barrier(thread_count)
+    rating_ids = []
+    errors = []
+
+    def add_rating():
+        try:
+            with app.app_context():
+                barrier.wait()
+                rating_ids.append(Rating.get_or_create_rating(user, "Adele", 'artist').id)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add_rating) for _ in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(rating_ids) == thread_count
+    assert len(set(rating_ids)) == 1
+
+
+def test_names_are_only_unique_case_insensitively(app):
+    with app.app_context():
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'rating'"
+                " AND indexdef LIKE 'CREATE UNIQUE%%' ORDER BY indexname"
+            )
+            unique_indexes = [row["indexname"] for row in cursor.fetchall()]
+        # ON CONFLICT only resolves conflicts on its one arbiter index
+        assert unique_indexes == ["rating_pkey", "rating_user_lower_type_lower_name_key"]
+
+
+def test_import_ordered(app):
+    with app.app_context():
+        user = User.create_user("test")
+        moved = Rating.create_rating(user, "B", "artist", 100.0)
+        Rating.create_rating(user, "stale", "artist", 50.0)
+
+        assert Rating.import_ordered(user, "artist", ["a", "b", "c"]) == 3
+        ratings = user.get_ratings(rating_type="artist")
+        # Ratings that weren't imported are kept below the imported ones
+        assert [(r.name, r.value) for r in ratings] == [("stale", 0.0), ("c", 33.33), ("B", 66.67), ("a", 100.0)]
+        assert next(r for r in ratings if r.name == "B").id == moved.id
+
+        Rating.import_ordered(user, "artist", ["a", "b", "c"], replace=True)
+        assert [r.name for r in user.get_ratings(rating_type="artist")] == ["c", "B", "a"]
+
+        app.config["RATING_STORAGE_MODE"] = "rank_key"
+        Rating.import_ordered(user, "artist", ["c", "b"])
+        assert [(r.name, r.value) for r in user.get_ratings(rating_type="artist")] == [
+            ("a", 0.0),
+            ("B", 50.0),
+            ("c", 100.0),
+        ]
+
+
+def test_stream_export_in_rank_key_mode(app):
+    app.config["RATING_STORAGE_MODE"] = "rank_key"
+    with app.app_context():
+        for username in ("first", "second"):
+            user = User.create_user(username)
+            Rating.import_ordered(user, "artist", ["a", "b", "c"])
+            Rating.import_ordered(user, "song", ["x", "y"])
+
+        rows = list(Rating.stream_export(itersize=2))
+        assert [(r["username"], r["type"], r["name"], r["value"]) for r in rows[:5]] == [
+            ("first", "artist", "a", 100.0),
+            ("first", "artist", "b", 50.0),
+            ("first", "artist", "c", 0.0),
+            ("first", "song", "x", 100.0),
+            ("first", "song", "y", 0.0),
+        ]
+        assert len(rows) == 10
+        assert [r["name"] for r in Rating.stream_export(user, "song")] == ["x", "y"]
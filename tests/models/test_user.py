@@ -1,5 +1,6 @@
 import random
 from flaskr.models.user import User
+from flaskr.models.rating import Rating
 
 def test_create_user(app):
     with app.app_context():
@@ -23,3 +24,42 @@ def test_get_by(app):
 
         assert username == User.get_by_username(username).username
         assert username == User.get_by_id(user.id).username
+
+def test_get_ratings_by_type(app):
+    with app.app_context():
+        user = User.create_user("test")
+        Rating.create_rating(user, "Adele", 'artist', 100.0)
+        Rating.create_rating(user, "21", 'album', 50.0)
+        Rating.create_rating(user, "Wolfmother", 'artist', 0.0)
+
+        assert [r.name for r in user.get_ratings('artist')] == ["Wolfmother", "Adele"]
+        assert [r.name for r in user.get_ratings('album')] == ["21"]
+
+def test_get_or_create_for_discord_user_is_cached(app, monkeypatch):
+    with app.app_context():
+        test_discord_user = {"username": "trogdor", "id": "80351110224678912"}
+        user = User.get_or_create_for_discord_user(test_discord_user)
+
+        def no_db():
+            raise AssertionError("Should not hit the database")
+
+        monkeypatch.setattr("flaskr.models.user.get_db", no_db)
+        assert User.get_or_create_for_discord_user(test_discord_user).id == user.id
+
+def test_get_or_create_for_discord_user_claims_existing_username(app):
+    with app.app_context():
+        user = User.create_user("trogdor")
+        test_discord_user = {"username": "trogdor", "id": "80351110224678912"}
+        assert User.get_or_create_for_discord_user(test_discord_user).id == user.id
+
+        # A rename keeps the same user
+        renamed_discord_user = {"username": "burninator", "id": "80351110224678912"}
+        assert User.get_or_create_for_discord_user(renamed_discord_user).id == user.id
+
+def test_get_or_create_for_discord_user_never_returns_another_discord_users_account(app):
+    with app.app_context():
+        first = User.get_or_create_for_discord_user({"username": "trogdor", "id": "80351110224678912"})
+        second = User.get_or_create_for_discord_user({"username": "trogdor", "id": "80351110224678913"})
+        assert second.id != first.id
+        assert second.username == "trogdor#80351110224678913"
+        assert User.get_by_username("trogdor").id == first.id
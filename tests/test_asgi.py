@@ -0,0 +1,165 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+pytest.importorskip("psycopg")
+pytest.importorskip("asgiref")
+
+import httpx
+from nacl.signing import SigningKey
+
+from flaskr.asgi import InteractionsAsgiApp
+from flaskr.db_async import close_async_pools
+from flaskr.models.rating import Rating
+from flaskr.models.user import User
+from flaskr.ratings.rating_calculator import RatingCalculator
+
+SIGNING_KEY = SigningKey(b"\x02" * 32)
+DISCORD_USER = {"username": "trogdor", "id": "80351110224678912"}
+
+
+def signed_headers(body: bytes) -> dict:
+    timestamp = str(int(time.time()))
+    return {
+        "X-Signature-Ed25519": SIGNING_KEY.sign(timestamp.encode() + body).signature.hex(),
+        "X-Signature-Timestamp": timestamp,
+        "Content-Type": "application/json",
+    }
+
+
+def rating_command(name: str, options: list, interaction_id: int = 0) -> dict:
+    return {
+        "id": str(interaction_id),
+        "type": 2,
+        "application_id": "1234",
+        "token": "interaction-token",
+        "member": {"user": DISCORD_USER},
+        "data": {"name": "rating", "options": [{"name": name, "options": options}]},
+    }
+
+
+def click(response: dict, button_idx: int) -> dict:
+    button = response["data"]["components"][0]["components"][button_idx]
+    return {
+        "type": 3,
+        "application_id": "1234",
+        "token": "interaction-token",
+        "member": {"user": DISCORD_USER},
+        "data": {"custom_id": button["custom_id"]},
+    }
+
+
+@pytest.fixture
+def asgi_app(app):
+    app.config.update(
+        PUBLIC_KEY=SIGNING_KEY.verify_key.encode().hex(),
+        CUSTOM_ID_SECRET="secret",
+        INTERACTION_CACHE_FALLBACK=False,
+        DEFERRED_COMMANDS=[],
+    )
+    return InteractionsAsgiApp(app)
+
+
+def run(asgi_app, interact):
+    async def main():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+
+            async def post(interaction: dict) -> httpx.Response:
+                body = json.dumps(interaction).encode()
+                return await client.post("/interactions/", content=body, headers=signed_headers(body))
+
+            try:
+                return await interact(client, post)
+            finally:
+                with asgi_app.app.app_context():
+                    await close_async_pools()
+
+    return asyncio.run(main())
+
+
+def test_rating_flow(asgi_app):
+    async def interact(client, post):
+        response = await post(rating_command("add", [{"name": "type", "value": "artist"}, {"name": "name", "value": "b"}]))
+        assert response.status_code == 200
+        response = await post(rating_command("add", [{"name": "type", "value": "artist"}, {"name": "name", "value": "a"}]))
+        # "b" is preferred over "a"
+        response = await post(click(response.json(), 1))
+        assert "a: 0.0" in response.json()["data"]["content"]
+        return (await post(rating_command("list", [{"name": "type", "value": "artist"}]))).json()
+
+    listing = run(asgi_app, interact)
+    assert listing["data"]["content"].endswith("b: 100.0\na: 0.0")
+
+    with asgi_app.app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        assert [r.name for r in user.get_ratings("artist")] == ["a", "b"]
+
+
+def test_rating_flow_with_the_session_cache(asgi_app, monkeypatch):
+    asgi_app.app.config["INTERACTION_CACHE_FALLBACK"] = True
+
+    async def no_sync_handler(handler, **kwargs):
+        raise AssertionError(f"{handler.__name__} ran on a thread")
+
+    monkeypatch.setattr("flaskr.ratings.async_rating_handler.run_sync_handler", no_sync_handler)
+
+    async def interact(client, post):
+        await post(rating_command("add", [{"name": "type", "value": "artist"}, {"name": "name", "value": "b"}]))
+        response = await post(rating_command("add", [{"name": "type", "value": "artist"}, {"name": "name", "value": "a"}]))
+        with asgi_app.app.app_context():
+            user = User.get_or_create_for_discord_user(DISCORD_USER)
+            a = Rating.get_by_name_for_user(user, "a", "artist")
+            assert RatingCalculator.find_for_item(a) is not None
+        await post(click(response.json(), 1))
+        return a
+
+    a = run(asgi_app, interact)
+    with asgi_app.app.app_context():
+        assert RatingCalculator.find_for_item(a) is None
+
+
+def test_concurrent_interactions(asgi_app):
+    with asgi_app.app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        Rating.create_rating(user, "a", "artist", 100.0)
+
+    async def interact(client, post):
+        return await asyncio.gather(
+            *[post(rating_command("list", [{"name": "type", "value": "artist"}], i)) for i in range(20)]
+        )
+
+    responses = run(asgi_app, interact)
+    assert all(r.json()["data"]["content"].endswith("a: 100.0") for r in responses)
+
+
+def test_rejects_unsigned_and_passes_other_routes_to_flask(asgi_app):
+    async def interact(client, post):
+        unsigned = await client.post("/interactions/", content=b'{"type": 1}')
+        ping = await client.get("/ping")
+        return unsigned, ping
+
+    unsigned, ping = run(asgi_app, interact)
+    assert unsigned.status_code == 401
+    assert ping.text == "pong"
+
+
+def test_top_in_guild(asgi_app):
+    def in_guild(interaction: dict) -> dict:
+        return {**interaction, "guild_id": "81384788765712384"}
+
+    async def interact(client, post):
+        await post(in_guild(rating_command("add", [{"name": "type", "value": "artist"}, {"name": "name", "value": "b"}])))
+        response = await post(
+            in_guild(rating_command("add", [{"name": "type", "value": "artist"}, {"name": "name", "value": "a"}]))
+        )
+        await post(click(response.json(), 1))
+        return (await post(in_guild(rating_command("top", [{"name": "type", "value": "artist"}])))).json()
+
+    top = run(asgi_app, interact)
+    assert top["data"]["content"].splitlines()[2:] == [
+        "1. b: 100.0 on average from 1 rating",
+        "2. a: 0.0 on average from 1 rating",
+    ]
@@ -0,0 +1,66 @@
+import json
+import time
+
+import pytest
+from nacl.signing import SigningKey
+
+SIGNING_KEY = SigningKey(b"\x01" * 32)
+
+
+@pytest.fixture
+def signed_post(app, client):
+    app.config.update(PUBLIC_KEY=SIGNING_KEY.verify_key.encode().hex())
+
+    def post(body: bytes, timestamp=None, signature=None):
+        timestamp = str(int(time.time()) if timestamp is None else timestamp)
+        if signature is None:
+            signature = SIGNING_KEY.sign(timestamp.encode() + body).signature.hex()
+        return client.post(
+            "/interactions/",
+            data=body,
+            content_type="application/json",
+            headers={"X-Signature-Ed25519": signature, "X-Signature-Timestamp": timestamp},
+        )
+
+    return post
+
+
+PING = json.dumps({"type": 1}).encode()
+
+
+def test_valid_signature_is_accepted(signed_post):
+    response = signed_post(PING)
+    assert response.status_code == 200
+    assert response.get_json() == {"type": 1}
+
+
+def test_invalid_signature_is_rejected(signed_post):
+    assert signed_post(PING, signature="00" * 64).status_code == 401
+    assert signed_post(PING, signature="not hex").status_code == 401
+
+
+def test_stale_timestamp_is_rejected(signed_post):
+    assert signed_post(PING, timestamp=int(time.time()) - 3600).status_code == 401
+
+
+def test_replayed_request_is_rejected(signed_post):
+    timestamp = int(time.time())
+    assert signed_post(PING, timestamp=timestamp).status_code == 200
+    assert signed_post(PING, timestamp=timestamp).status_code == 401
+
+
+def test_replay_with_changed_signature_case_is_rejected(signed_post):
+    timestamp = int(time.time())
+    signature = SIGNING_KEY.sign(str(timestamp).encode() + PING).signature.hex()
+    assert signed_post(PING, timestamp=timestamp, signature=signature).status_code == 200
+    assert signed_post(PING, timestamp=timestamp, signature=signature.upper()).status_code == 401
+
+
+def test_replay_to_another_worker_is_rejected_with_a_shared_cache(app, signed_post):
+    app.config["INTERACTION_CACHE_BACKEND"] = "postgres"
+    timestamp = int(time.time())
+    assert signed_post(PING, timestamp=timestamp).status_code == 200
+    # A fresh worker has none of the first one's per-process state
+    app.extensions.pop("discord_replay_cache")
+    app.extensions.pop("interaction_cache")
+    assert signed_post(PING, timestamp=timestamp).status_code == 401
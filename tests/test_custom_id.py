@@ -0,0 +1,115 @@
+import pytest
+from flaskr.models.rating import Rating
+from flaskr.ratings.custom_id import (
+    CUSTOM_ID_MAX_LENGTH,
+    ComparisonState,
+    InvalidCustomIdException,
+    ListPageCursor,
+    MultiComparisonState,
+    decode_comparison_state,
+    decode_list_page,
+    decode_multi_comparison_state,
+    encode_comparison_state,
+    encode_list_page,
+    encode_multi_comparison_state,
+    get_list_version,
+    _sign,
+)
+
+
+def construct_state(**overrides) -> ComparisonState:
+    fields = dict(
+        rating_id=2147483647,
+        compared_id=2147483646,
+        index=9999,
+        lowest_possible_idx=5000,
+        highest_possible_idx=19999,
+        list_version=4294967295,
+        is_preferred=True,
+    )
+    fields.update(overrides)
+    return ComparisonState(**fields)
+
+
+def test_round_trip():
+    custom_id = encode_comparison_state(construct_state(), "secret")
+    assert len(custom_id) <= CUSTOM_ID_MAX_LENGTH
+
+    state = decode_comparison_state(custom_id, "secret")
+    assert state is not None
+    assert state.rating_id == 2147483647
+    assert state.compared_id == 2147483646
+    assert state.index == 9999
+    assert state.lowest_possible_idx == 5000
+    assert state.highest_possible_idx == 19999
+    assert state.list_version == 4294967295
+    assert state.is_preferred
+
+
+def test_rejects_tampered_custom_id():
+    custom_id = encode_comparison_state(construct_state(is_preferred=False), "secret")
+    with pytest.raises(InvalidCustomIdException):
+        decode_comparison_state(custom_id.replace(".n.", ".y."), "secret")
+    with pytest.raises(InvalidCustomIdException):
+        decode_comparison_state(custom_id, "another secret")
+
+
+def test_round_trips_pivot_strategy():
+    custom_id = encode_comparison_state(construct_state(strategy="galloping", step=12), "secret")
+    state = decode_comparison_state(custom_id, "secret")
+    assert state.strategy == "galloping"
+    assert state.step == 12
+
+
+def test_decodes_custom_id_without_pivot_strategy():
+    # Sent before the strategy and step were added
+    body = "s1.1.2.3.0.9.abc.y"
+    state = decode_comparison_state(f"{body}.{_sign(body, 'secret')}", "secret")
+    assert (state.rating_id, state.index, state.highest_possible_idx) == (1, 3, 9)
+    assert state.strategy == "midpoint"
+    assert state.is_preferred
+
+
+def test_multi_comparison_round_trip():
+    state = MultiComparisonState(
+        rating_id=2147483647,
+        lowest_possible_idx=5000,
+        highest_possible_idx=19999,
+        list_version=4294967295,
+        width=24,
+        gap=13,
+    )
+    custom_id = encode_multi_comparison_state(state, "secret")
+    assert decode_comparison_state(custom_id, "secret") is None
+
+    decoded = decode_multi_comparison_state(custom_id, "secret")
+    assert (decoded.lowest_possible_idx, decoded.highest_possible_idx, decoded.width, decoded.gap) == (
+        5000,
+        19999,
+        24,
+        13,
+    )
+    with pytest.raises(InvalidCustomIdException):
+        decode_multi_comparison_state(custom_id.replace(".d.", ".c."), "secret")
+
+
+def test_ignores_legacy_custom_id():
+    assert decode_comparison_state("r_1_c_2_cidx_0_pc_yes", "secret") is None
+
+
+def test_list_version_changes_with_order():
+    a = Rating(id=1, type="artist", name="a", value=0.0, user_id=1)
+    b = Rating(id=2, type="artist", name="b", value=100.0, user_id=1)
+    assert get_list_version([a, b]) == get_list_version([a, b])
+    assert get_list_version([a, b]) != get_list_version([b, a])
+
+
+def test_list_page_round_trip():
+    for sort_key in [None, 33.33333206176758, -4294967296, 0]:
+        custom_id = encode_list_page(ListPageCursor(True, "sci-fi: books", sort_key, 42))
+        cursor = decode_list_page(custom_id)
+        assert (cursor.is_next, cursor.rating_type, cursor.sort_key, cursor.rating_id) == (
+            True, "sci-fi: books", sort_key, 42
+        )
+    assert decode_list_page("s1.abc") is None
+    assert encode_list_page(ListPageCursor(False, "x" * 100, 1.0, 1)) is None
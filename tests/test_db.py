@@ -1,18 +1,17 @@
-import sqlite3
-
-import pytest
-from flaskr.db import get_db
+from flaskr.db import get_db, get_pool, migrate_db
+from flaskr.migrations import get_migration_files
 
 
 def test_get_close_db(app):
     with app.app_context():
         db = get_db()
         assert db is get_db()
+        assert get_pool().stats()["in_use"] == 1
 
-    with pytest.raises(sqlite3.ProgrammingError) as e:
-        db.execute("SELECT 1")
-
-    assert "closed" in str(e.value)
+    with app.app_context():
+        # The connection went back to the pool instead of being leaked
+        assert get_pool().stats()["in_use"] == 0
+        assert get_db() is db
 
 
 def test_init_db_command(runner, monkeypatch):
@@ -26,3 +25,19 @@ def test_init_db_command(runner, monkeypatch):
     result = runner.invoke(args=["init-db"])
     assert "Initialized" in result.output
     assert Recorder.called
+
+
+def test_migrate_is_idempotent(app):
+    with app.app_context():
+        # init_db already applied everything
+        assert migrate_db() == []
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT version FROM schema_migration ORDER BY version")
+            versions = [row["version"] for row in cursor.fetchall()]
+        assert versions == [f[: -len(".sql")] for f in get_migration_files()]
+
+
+def test_migrate_db_command(runner, monkeypatch):
+    monkeypatch.setattr("flaskr.db.migrate_db", lambda: ["0001_initial"])
+    result = runner.invoke(args=["migrate-db"])
+    assert "0001_initial" in result.output
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+from flaskr.db_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_reuses_released_connections():
+    pool = ConnectionPool(connect=FakeConnection, min_size=1, max_size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert pool.stats()["in_use"] == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_acquire_times_out_when_exhausted():
+    pool = ConnectionPool(connect=FakeConnection, min_size=0, max_size=1, acquire_timeout=0.05)
+    pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_waiter_gets_released_connection():
+    pool = ConnectionPool(connect=FakeConnection, min_size=0, max_size=1, acquire_timeout=2)
+    conn = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    pool.release(conn)
+    waiter.join()
+    assert acquired == [conn]
+
+
+def test_recycles_after_max_uses():
+    pool = ConnectionPool(connect=FakeConnection, min_size=0, max_size=1, max_uses=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    pool.release(conn)
+    assert conn.closed
+    assert pool.acquire() is not conn
+    assert pool.stats()["recycled"] == 1
+
+
+def test_replaces_connections_failing_health_check():
+    pool = ConnectionPool(
+        connect=FakeConnection,
+        min_size=0,
+        max_size=1,
+        health_check_interval=0,
+        check=lambda c: not c.closed,
+    )
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.closed = True
+    assert pool.acquire() is not conn
+    assert pool.stats()["failed_health_checks"] == 1
@@ -0,0 +1,49 @@
+from flaskr.discord import InteractionCallbackType
+from flaskr.discord_interactions import deferred
+from flaskr.discord_interactions.handler import DiscordInteractionHandler
+from flaskr.models.rating import Rating
+from flaskr.models.user import User
+
+DISCORD_USER = {"username": "trogdor", "id": "80351110224678912"}
+
+
+def rating_command(sub_command: dict) -> dict:
+    return {
+        "application_id": "1234",
+        "token": "interaction-token",
+        "member": {"user": DISCORD_USER},
+        "data": {"name": "rating", "options": [sub_command]},
+    }
+
+
+def test_list_is_deferred_and_edits_original(app, monkeypatch):
+    requests = []
+    monkeypatch.setattr(deferred, "discord_request", lambda endpoint, options: requests.append((endpoint, options)))
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        Rating.create_rating(user, "a", "artist", 100.0)
+
+        response = DiscordInteractionHandler.handle_application_command(
+            rating_command({"name": "list", "options": [{"name": "type", "value": "artist"}]})
+        )
+        assert response.get_json() == {"type": InteractionCallbackType.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE}
+        deferred.get_executor().shutdown(wait=True)
+
+    [(endpoint, options)] = requests
+    assert endpoint == "webhooks/1234/interaction-token/messages/@original"
+    assert options["method"] == "PATCH"
+    assert "a" in options["data"]["content"]
+
+
+def test_commands_are_deferred_once_over_latency_budget(app, monkeypatch):
+    monkeypatch.setattr(deferred, "discord_request", lambda endpoint, options: None)
+    app.config.update(DEFERRED_COMMANDS=[], INTERACTION_LATENCY_BUDGET_MS=50)
+    with app.app_context():
+        command = rating_command({"name": "show_types"})
+        response = DiscordInteractionHandler.handle_application_command(command)
+        assert response.get_json()["type"] == InteractionCallbackType.CHANNEL_MESSAGE_WITH_SOURCE
+
+        deferred.InteractionLatencies.get().record("rating.show_types", 5000)
+        response = DiscordInteractionHandler.handle_application_command(command)
+        assert response.get_json()["type"] == InteractionCallbackType.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE
+        deferred.get_executor().shutdown(wait=True)
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flaskr.discord.rate_limit import get_rate_limiter
+from flaskr.discord.request import (
+    _redact,
+    close_clients,
+    discord_request,
+    discord_request_async,
+    get_async_client,
+)
+
+
+class _FakeDiscordHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_PATCH(self):
+        self._respond()
+
+    def do_PUT(self):
+        self._respond()
+
+    def _respond(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append(
+            {
+                "method": self.command,
+                "path": self.path,
+                "authorization": self.headers["Authorization"],
+                "body": json.loads(body),
+                "client_port": self.client_address[1],
+            }
+        )
+        if "missing" in self.path:
+            status, payload = 404, {"message": "Unknown Webhook"}
+        elif "limited" in self.path and len(self.server.requests) == 1:
+            status, payload = 429, {"message": "You are being rate limited.", "retry_after": 0.05, "global": False}
+        else:
+            status, payload = 200, {"ok": True}
+        payload = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_discord(app):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeDiscordHandler)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    app.config.update(
+        DISCORD_TOKEN="bot-token",
+        DISCORD_RETRY_JITTER_SECONDS=0,
+        DISCORD_API_BASE_URL=f"http://127.0.0.1:{server.server_port}/api/v10/",
+    )
+    yield server
+    with app.app_context():
+        close_clients()
+    server.shutdown()
+    server.server_close()
+
+
+def test_requests_reuse_a_connection(app, fake_discord):
+    with app.app_context():
+        for content in ["one", "two", "three"]:
+            discord_request("webhooks/1/token/messages/@original", {"method": "PATCH", "data": {"content": content}})
+
+    requests = fake_discord.requests
+    assert [r["body"]["content"] for r in requests] == ["one", "two", "three"]
+    assert requests[0]["path"] == "/api/v10/webhooks/1/token/messages/@original"
+    assert requests[0]["authorization"] == "Bot bot-token"
+    assert len({r["client_port"] for r in requests}) == 1
+
+
+def test_tokens_are_redacted_for_logging():
+    assert _redact("webhooks/1/secret-token/messages/@original") == "webhooks/1/:token/messages/@original"
+    assert _redact("interactions/123/secret-token/callback") == "interactions/123/:token/callback"
+    assert _redact("channels/123456/messages") == "channels/123456/messages"
+
+
+def test_error_responses_raise(app, fake_discord):
+    with app.app_context():
+        with pytest.raises(RuntimeError, match="Unknown Webhook"):
+            discord_request("webhooks/1/missing/messages/@original", {"method": "PATCH", "data": {}})
+
+
+def test_rate_limited_requests_are_retried(app, fake_discord):
+    with app.app_context():
+        response = discord_request("channels/123456/limited", {"method": "PUT", "data": {}})
+        assert response.status_code == 200
+        stats = get_rate_limiter().stats()
+
+    assert len(fake_discord.requests) == 2
+    assert stats["rate_limited"] == 1
+    assert stats["retries"] == 1
+    assert stats["total_wait_ms"] > 0
+
+
+def test_async_requests(app, fake_discord):
+    async def send_all():
+        await asyncio.gather(
+            *[
+                discord_request_async("applications/1/commands", {"method": "PUT", "data": [{"name": str(i)}]})
+                for i in range(3)
+            ]
+        )
+
+    with app.app_context():
+        asyncio.run(send_all())
+
+    assert sorted(r["body"][0]["name"] for r in fake_discord.requests) == ["0", "1", "2"]
+
+
+def test_close_clients_closes_async_clients(app, fake_discord):
+    loop = asyncio.new_event_loop()
+    try:
+        with app.app_context():
+            loop.run_until_complete(
+                discord_request_async("applications/1/commands", {"method": "PUT", "data": []})
+            )
+            client = loop.run_until_complete(_get_async_client())
+            close_clients()
+        assert client.is_closed
+    finally:
+        loop.close()
+
+
+async def _get_async_client():
+    return get_async_client()
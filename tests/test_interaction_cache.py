@@ -0,0 +1,167 @@
+import socketserver
+import threading
+
+import pytest
+from flaskr.db import get_db, get_pool
+from flaskr.interaction_cache import InteractionCache
+from flaskr.interaction_cache.resp import RespClient
+from flaskr.interaction_cache.stores import (
+    InMemorySessionStore,
+    PostgresSessionStore,
+    RedisSessionStore,
+)
+from flaskr.models.rating import Rating
+from flaskr.models.user import User
+from flaskr.ratings.rating_calculator import RatingCalculator, CompletedComparison
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough RESP to stand in for Redis in tests."""
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            command = args[0].upper()
+            if command == b"GET":
+                value = data.get(args[1])
+                if value is None:
+                    self.wfile.write(b"$-1\r\n")
+                else:
+                    self.wfile.write(b"$%d\r\n%s\r\n" % (len(value), value))
+            elif command == b"SET":
+                if b"NX" in args[3:] and args[1] in data:
+                    self.wfile.write(b"$-1\r\n")
+                    continue
+                data[args[1]] = args[2]
+                self.wfile.write(b"+OK\r\n")
+            elif command == b"DEL":
+                self.wfile.write(b":%d\r\n" % (1 if data.pop(args[1], None) else 0))
+            else:
+                self.wfile.write(b"-ERR unknown command\r\n")
+
+
+@pytest.fixture
+def fake_redis():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _FakeRedisHandler)
+    server.daemon_threads = True
+    server.data = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _exercise_store(store):
+    assert store.get("k") is None
+    store.set("k", "first")
+    assert store.get("k") == "first"
+    store.set("k", "second")
+    assert store.get("k") == "second"
+    store.delete("k")
+    assert store.get("k") is None
+    assert store.stats()["hits"] == 2
+    assert store.stats()["misses"] == 2
+
+    assert store.add("once", "first", 60)
+    assert not store.add("once", "second", 60)
+    assert store.get("once") == "first"
+
+
+def test_in_memory_store():
+    _exercise_store(InMemorySessionStore())
+
+
+def test_in_memory_store_expires_sessions():
+    store = InMemorySessionStore(ttl=0)
+    store.set("k", "payload")
+    assert store.get("k") is None
+    assert store.stats()["expirations"] == 1
+    assert store.stats()["entries"] == 0
+
+
+def test_in_memory_store_adds_over_expired_sessions():
+    store = InMemorySessionStore()
+    assert store.add("k", "first", 0)
+    assert store.add("k", "second", 60)
+    assert store.get("k") == "second"
+
+
+def test_in_memory_store_evicts_least_recently_used():
+    store = InMemorySessionStore(max_entries=2)
+    store.set("a", "1")
+    store.set("b", "2")
+    store.get("a")
+    store.set("c", "3")
+    assert store.get("b") is None
+    assert store.get("a") == "1"
+    assert store.get("c") == "3"
+    assert store.stats()["evictions"] == 1
+
+
+def test_in_memory_store_evicts_by_bytes():
+    store = InMemorySessionStore(max_bytes=25)
+    store.set("a", "x" * 10)
+    store.set("b", "y" * 10)
+    store.set("c", "z" * 10)
+    assert store.get("a") is None
+    assert store.stats()["bytes"] == 22
+
+
+def test_redis_store(fake_redis):
+    host, port = fake_redis.server_address
+    client = RespClient(host=host, port=port)
+    _exercise_store(RedisSessionStore(client))
+    client.close()
+
+
+def test_postgres_store(app):
+    with app.app_context():
+        _exercise_store(PostgresSessionStore())
+
+
+def test_postgres_store_leaves_the_request_transaction_alone(app):
+    with app.app_context():
+        with get_db().cursor() as cursor:
+            cursor.execute("INSERT INTO hearrd_user (username) VALUES ('pending')")
+        store = PostgresSessionStore()
+        store.set("k", "payload")
+        store.delete("k")
+        get_db().rollback()
+
+        assert User.get_by_username("pending") is None
+        assert get_pool().stats()["in_use"] == 1
+
+
+def test_rating_calculator_round_trip(app):
+    with app.app_context():
+        calculator = RatingCalculator(
+            item_being_rated=Rating(id=1, type="artist", name="a", value=None, user_id=1),
+            other_items=[
+                Rating(id=2, type="artist", name="b", value=0.0, user_id=1),
+                Rating(id=3, type="artist", name="c", value=100.0, user_id=1),
+            ],
+        )
+        key = RatingCalculator.get_cache_key(calculator.item_being_rated)
+        InteractionCache.store_rating_calculator(key, calculator)
+
+        restored = RatingCalculator.continue_rating(
+            calculator.item_being_rated, CompletedComparison(id=2, index=0, is_preferred=False)
+        )
+        assert restored is not None
+        assert restored.other_items == calculator.other_items
+        assert [c.index for c in RatingCalculator.find_for_item(calculator.item_being_rated).comparisons] == [0]
+
+        # Restarting the same item replaces the stale session
+        RatingCalculator.begin_rating(calculator.item_being_rated, calculator.other_items)
+        assert RatingCalculator.find_for_item(calculator.item_being_rated).comparisons == []
+
+        restored.complete()
+        assert RatingCalculator.find_for_item(calculator.item_being_rated) is None
@@ -0,0 +1,21 @@
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+from flaskr import create_app
+from flaskr.discord import InteractionCallbackType
+
+orjson = pytest.importorskip("orjson")
+from flaskr.json_provider import OrjsonProvider
+
+
+def test_orjson_is_used_when_installed(app):
+    assert isinstance(app.json, OrjsonProvider)
+    with app.test_request_context():
+        response = app.json.response({"type": InteractionCallbackType.PONG})
+    assert response.mimetype == "application/json"
+    assert response.get_json() == {"type": 1}
+
+
+def test_default_provider_can_be_configured():
+    app = create_app({"TESTING": True, "JSON_PROVIDER": "default"})
+    assert type(app.json) is DefaultJSONProvider
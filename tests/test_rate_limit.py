@@ -0,0 +1,78 @@
+from flaskr.discord.rate_limit import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_routes_keep_only_major_parameters():
+    assert RateLimiter.get_route("GET", "channels/123456/messages/987654321") == "GET channels/123456/messages/:id"
+    assert RateLimiter.get_route("PATCH", "webhooks/1234567/tok/messages/@original") == (
+        "PATCH webhooks/1234567/tok/messages/@original"
+    )
+    assert RateLimiter.get_route("PUT", "applications/1234567/commands") == "PUT applications/:id/commands"
+
+
+def test_waits_for_exhausted_bucket_to_reset():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+    endpoint = "channels/123456/messages"
+    headers = {
+        "X-RateLimit-Bucket": "abc",
+        "X-RateLimit-Limit": "2",
+        "X-RateLimit-Remaining": "1",
+        "X-RateLimit-Reset-After": "5",
+    }
+
+    assert limiter.reserve("POST", endpoint) == 0
+    limiter.update("POST", endpoint, 200, headers)
+    assert limiter.reserve("POST", endpoint) == 0
+    assert limiter.reserve("POST", endpoint) == 5.0
+    # Other channels are limited separately
+    assert limiter.reserve("POST", "channels/654321/messages") == 0
+
+    clock.now += 5
+    assert limiter.reserve("POST", endpoint) == 0
+    assert limiter.stats()["requests"] == 4
+
+
+def test_global_rate_limit_holds_every_route():
+    clock = FakeClock()
+    limiter = RateLimiter(jitter=0, clock=clock)
+    limiter.update("POST", "channels/123456/messages", 429, {}, {"retry_after": 2.5, "global": True})
+
+    assert limiter.reserve("PUT", "applications/1234567/commands") == 2.5
+    clock.now += 2.5
+    assert limiter.reserve("PUT", "applications/1234567/commands") == 0
+    assert limiter.stats()["rate_limited"] == 1
+
+
+def test_retries_are_bounded():
+    limiter = RateLimiter(max_retries=2)
+    assert limiter.should_retry(429, 0)
+    assert limiter.should_retry(502, 1)
+    assert not limiter.should_retry(429, 2)
+    assert not limiter.should_retry(404, 0)
+
+
+def test_buckets_of_many_webhook_tokens_do_not_accumulate():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+    headers = {
+        "X-RateLimit-Bucket": "abc",
+        "X-RateLimit-Limit": "5",
+        "X-RateLimit-Remaining": "4",
+        "X-RateLimit-Reset-After": "1",
+    }
+    for idx in range(1000):
+        endpoint = f"webhooks/1234567/token{idx}/messages/@original"
+        limiter.reserve("PATCH", endpoint)
+        limiter.update("PATCH", endpoint, 200, headers)
+        clock.now += 0.5
+
+    assert limiter.stats()["buckets"] <= 130
+    assert len(limiter._route_buckets) <= 130
@@ -0,0 +1,379 @@
+from flaskr.discord import InteractionCallbackType
+from flaskr.discord_interactions.handler import DiscordInteractionHandler
+from flaskr.interaction_cache import InteractionCache
+from flaskr.models.user import User
+from flaskr.models.rating import Rating
+from flaskr.ratings.rating_handler import RatingHandler
+
+DISCORD_USER = {"username": "trogdor", "id": "80351110224678912"}
+
+
+def add_rating_options(rating_type: str, rating_name: str) -> dict:
+    return {
+        "name": "add",
+        "options": [
+            {"name": "type", "value": rating_type},
+            {"name": "name", "value": rating_name},
+        ],
+    }
+
+
+def click(response, button_idx: int):
+    button = response.get_json()["data"]["components"][0]["components"][button_idx]
+    return RatingHandler.handle_responded_to_comparison(
+        discord_user=DISCORD_USER, interaction_data={"custom_id": button["custom_id"]}
+    )
+
+
+def test_signed_custom_ids_continue_without_cache(app):
+    app.config.update(CUSTOM_ID_SECRET="secret", INTERACTION_CACHE_FALLBACK=False)
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        for idx, name in enumerate(["b", "c", "d"]):
+            Rating.create_rating(user, name, "artist", idx * 50.0)
+
+        response = RatingHandler.handle_add_rating(
+            discord_user=DISCORD_USER, interaction_data=add_rating_options("artist", "a")
+        )
+        assert response.get_json()["data"]["components"][0]["components"][1]["label"] == "c"
+
+        # The item being rated is preferred over "c", then over "d"
+        response = click(response, 0)
+        assert response.get_json()["data"]["components"][0]["components"][1]["label"] == "d"
+        response = click(response, 0)
+
+        ratings = user.get_ratings(rating_type="artist")
+        assert [r.name for r in ratings] == ["b", "c", "d", "a"]
+        assert ratings[-1].value == 100.0
+
+        cache_stats = InteractionCache.get_store().stats()
+        assert cache_stats["hits"] + cache_stats["misses"] == 0
+
+
+
+def test_rank_key_mode_rating_flow(app):
+    app.config.update(CUSTOM_ID_SECRET="secret", RATING_STORAGE_MODE="rank_key")
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        RatingHandler.handle_add_rating(
+            discord_user=DISCORD_USER, interaction_data=add_rating_options("artist", "b")
+        )
+        response = RatingHandler.handle_add_rating(
+            discord_user=DISCORD_USER, interaction_data=add_rating_options("artist", "c")
+        )
+        # "c" is preferred over "b"
+        click(response, 0)
+        response = RatingHandler.handle_add_rating(
+            discord_user=DISCORD_USER, interaction_data=add_rating_options("artist", "a")
+        )
+        # "b" is preferred over "a"
+        click(response, 1)
+
+        ratings = user.get_ratings(rating_type="artist")
+        assert [r.name for r in ratings] == ["a", "b", "c"]
+        assert [r.value for r in ratings] == [0.0, 50.0, 100.0]
+
+
+def list_options(rating_type: str) -> dict:
+    return {"name": "list", "options": [{"name": "type", "value": rating_type}]}
+
+
+def page_buttons(response) -> dict:
+    data = response.get_json()["data"]
+    return {b["label"]: b for b in data["components"][0]["components"]}
+
+
+def click_page(response, label: str):
+    return RatingHandler.handle_list_page(
+        discord_user=DISCORD_USER, interaction_data={"custom_id": page_buttons(response)[label]["custom_id"]}
+    )
+
+
+def listed_names(response) -> list:
+    content = response.get_json()["data"]["content"]
+    return [line.split(":")[0] for line in content.split("\n\n", 1)[1].split("\n")]
+
+
+def test_list_is_paged(app):
+    app.config.update(RATING_LIST_PAGE_SIZE=20)
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        for idx in range(45):
+            # Ties on value are ordered by id
+            Rating.create_rating(user, f"item {idx}", "artist", float(idx // 2))
+        expected = [r.name for r in reversed(user.get_ratings(rating_type="artist"))]
+
+        response = RatingHandler.handle_list_ratings(discord_user=DISCORD_USER, interaction_data=list_options("artist"))
+        assert listed_names(response) == expected[:20]
+        assert page_buttons(response)["Prev"]["disabled"]
+
+        response = click_page(response, "Next")
+        assert response.get_json()["type"] == InteractionCallbackType.UPDATE_MESSAGE
+        assert listed_names(response) == expected[20:40]
+
+        response = click_page(response, "Next")
+        assert listed_names(response) == expected[40:]
+        assert page_buttons(response)["Next"]["disabled"]
+
+        response = click_page(response, "Prev")
+        assert listed_names(response) == expected[20:40]
+        response = click_page(response, "Prev")
+        assert listed_names(response) == expected[:20]
+        assert page_buttons(response)["Prev"]["disabled"]
+
+
+def test_pages_with_non_integral_values(app):
+    app.config.update(RATING_LIST_PAGE_SIZE=3)
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        for idx in range(12):
+            # REAL values that don't round trip through float8, with a tie
+            Rating.create_rating(user, f"item {idx}", "artist", round(min(idx, 10) * 100 / 11, 2))
+        expected = [r.name for r in reversed(user.get_ratings(rating_type="artist"))]
+
+        response = RatingHandler.handle_list_ratings(discord_user=DISCORD_USER, interaction_data=list_options("artist"))
+        pages = [listed_names(response)]
+        while not page_buttons(response)["Next"]["disabled"]:
+            response = click_page(response, "Next")
+            pages.append(listed_names(response))
+        assert [name for page in pages for name in page] == expected
+
+        for page in reversed(pages[:-1]):
+            response = click_page(response, "Prev")
+            assert listed_names(response) == page
+        assert page_buttons(response)["Prev"]["disabled"]
+
+
+def test_rank_key_mode_pages_match_full_list(app):
+    app.config.update(RATING_LIST_PAGE_SIZE=3, RATING_STORAGE_MODE="rank_key")
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        ratings = [Rating.create_rating(user, f"item {idx}", "artist") for idx in range(7)]
+        for lower, rating in zip([None] + ratings, ratings):
+            Rating.place_between(user, rating, lower, None)
+        expected = [f"{r.name}: {r.value}" for r in reversed(user.get_ratings(rating_type="artist"))]
+
+        lines = []
+        response = RatingHandler.handle_list_ratings(discord_user=DISCORD_USER, interaction_data=list_options("artist"))
+        while True:
+            lines.extend(response.get_json()["data"]["content"].split("\n\n", 1)[1].split("\n"))
+            if page_buttons(response)["Next"]["disabled"]:
+                break
+            response = click_page(response, "Next")
+        assert lines == expected
+
+
+def test_list_fits_message_limit(app):
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        for idx in range(20):
+            Rating.create_rating(user, f"{idx:02d} " + "x" * 200, "artist", float(idx))
+
+        response = RatingHandler.handle_list_ratings(discord_user=DISCORD_USER, interaction_data=list_options("artist"))
+        assert len(response.get_json()["data"]["content"]) <= 2000
+        shown = listed_names(response)
+        assert len(shown) < 20
+
+        response = click_page(response, "Next")
+        assert listed_names(response)[0].startswith(f"{19 - len(shown):02d} ")
+
+
+def test_pivot_strategy_is_carried_in_custom_ids(app):
+    app.config.update(CUSTOM_ID_SECRET="secret", INTERACTION_CACHE_FALLBACK=False, RATING_PIVOT_STRATEGY="galloping")
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        for idx, name in enumerate(["b", "c", "d", "e", "f"]):
+            Rating.create_rating(user, name, "artist", idx * 25.0)
+        Rating.create_rating(user, "a", "artist", 90.0)
+
+        # Re-rating "a" starts from where it was rather than the middle
+        response = RatingHandler.handle_add_rating(
+            discord_user=DISCORD_USER, interaction_data=add_rating_options("artist", "a")
+        )
+        assert response.get_json()["data"]["components"][0]["components"][1]["label"] == "f"
+        # "f" is preferred, so the next probe gallops down
+        response = click(response, 1)
+        assert response.get_json()["data"]["components"][0]["components"][1]["label"] == "e"
+        response = click(response, 0)
+
+        assert [r.name for r in user.get_ratings(rating_type="artist")] == ["b", "c", "d", "e", "a", "f"]
+
+
+def button_labels(response) -> list:
+    rows = response.get_json()["data"]["components"]
+    return [button["label"] for row in rows for button in row["components"]]
+
+
+def click_label(response, label: str):
+    rows = response.get_json()["data"]["components"]
+    button = next(b for row in rows for b in row["components"] if b["label"] == label)
+    return RatingHandler.handle_responded_to_comparison(
+        discord_user=DISCORD_USER, interaction_data={"custom_id": button["custom_id"]}
+    )
+
+
+def test_multi_comparisons_insert_in_fewer_clicks(app):
+    app.config.update(CUSTOM_ID_SECRET="secret", INTERACTION_CACHE_FALLBACK=False, RATING_COMPARISON_WIDTH=3)
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        names = [f"item {idx:02}" for idx in range(15)]
+        for idx, name in enumerate(names):
+            Rating.create_rating(user, name, "artist", float(idx))
+
+        response = RatingHandler.handle_add_rating(
+            discord_user=DISCORD_USER, interaction_data=add_rating_options("artist", "new")
+        )
+        assert button_labels(response) == [
+            "Better than item 11",
+            "Better than item 07",
+            "Better than item 03",
+            "Worse than item 03",
+        ]
+        response = click_label(response, "Better than item 07")
+        assert button_labels(response) == [
+            "Better than item 10",
+            "Better than item 09",
+            "Better than item 08",
+            "Worse than item 08",
+        ]
+        response = click_label(response, "Better than item 09")
+
+        ratings = [r.name for r in user.get_ratings(rating_type="artist")]
+        assert ratings == names[:10] + ["new"] + names[10:]
+
+
+def test_multi_comparison_buttons_fit_in_rows(app):
+    app.config.update(CUSTOM_ID_SECRET="secret", RATING_COMPARISON_WIDTH=100)
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        for idx in range(50):
+            Rating.create_rating(user, f"item {idx}", "artist", float(idx))
+
+        response = RatingHandler.handle_add_rating(
+            discord_user=DISCORD_USER, interaction_data=add_rating_options("artist", "new")
+        )
+        rows = response.get_json()["data"]["components"]
+        assert len(rows) == 5
+        assert all(len(row["components"]) == 5 for row in rows)
+
+
+def add_many_options(rating_type: str, rating_names: str) -> dict:
+    return {
+        "name": "add_many",
+        "options": [
+            {"name": "type", "value": rating_type},
+            {"name": "names", "value": rating_names},
+        ],
+    }
+
+
+def answer_sort(response, rank: dict):
+    """Clicks whichever of the two buttons ranks higher in ``rank``."""
+    buttons = response.get_json()["data"]["components"][0]["components"]
+    button = max(buttons, key=lambda b: rank[b["label"]])
+    return RatingHandler.handle_sort_answer(
+        discord_user=DISCORD_USER, interaction_data={"custom_id": button["custom_id"]}
+    )
+
+
+def test_add_many_ranks_new_items_together(app):
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        for idx, name in enumerate(["b", "d", "f"]):
+            Rating.create_rating(user, name, "artist", idx * 50.0)
+        rank = {name: idx for (idx, name) in enumerate("abcdefg")}
+
+        response = RatingHandler.handle_add_many_ratings(
+            discord_user=DISCORD_USER, interaction_data=add_many_options("artist", "g, c,\na, e, C")
+        )
+        clicks = 0
+        while "components" in response.get_json()["data"]:
+            response = answer_sort(response, rank)
+            clicks += 1
+
+        assert [r.name for r in user.get_ratings(rating_type="artist")] == list("abcdefg")
+        # Sorting 4 takes 5 comparisons and inserting them into 3 takes at most 8
+        assert clicks <= 13
+        assert "Your ratings for **artists**" in response.get_json()["data"]["content"]
+
+
+def test_sort_answer_rejects_repeated_clicks(app):
+    with app.app_context():
+        response = RatingHandler.handle_add_many_ratings(
+            discord_user=DISCORD_USER, interaction_data=add_many_options("artist", "a, b, c")
+        )
+        button = response.get_json()["data"]["components"][0]["components"][0]
+        for _ in range(2):
+            response = RatingHandler.handle_sort_answer(
+                discord_user=DISCORD_USER, interaction_data={"custom_id": button["custom_id"]}
+            )
+        assert "already answered" in response.get_json()["data"]["content"]
+
+
+def test_add_many_limits_items(app):
+    app.config.update(RATING_BATCH_MAX_ITEMS=2)
+    with app.app_context():
+        response = RatingHandler.handle_add_many_ratings(
+            discord_user=DISCORD_USER, interaction_data=add_many_options("artist", "a, b, c")
+        )
+        assert "between 1 and 2" in response.get_json()["data"]["content"]
+
+
+def test_rerank_resorts_a_window(app):
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        for idx, name in enumerate("abcdef"):
+            Rating.create_rating(user, name, "artist", idx * 20.0)
+        # "e" and "c" are now liked the other way around
+        rank = {name: idx for (idx, name) in enumerate("abedcf")}
+
+        response = RatingHandler.handle_rerank_ratings(
+            discord_user=DISCORD_USER,
+            interaction_data={
+                "name": "rerank",
+                "options": [
+                    {"name": "type", "value": "artist"},
+                    {"name": "from", "value": 2},
+                    {"name": "to", "value": 4},
+                ],
+            },
+        )
+        clicks = 0
+        while "components" in response.get_json()["data"]:
+            response = answer_sort(response, rank)
+            clicks += 1
+
+        ratings = user.get_ratings(rating_type="artist")
+        assert [r.name for r in ratings] == list("abedcf")
+        assert [r.value for r in ratings] == [0.0, 20.0, 40.0, 60.0, 80.0, 100.0]
+        # Only "c", "d" and "e" are compared
+        assert clicks <= 3
+
+
+def top_interaction(guild_id=None) -> dict:
+    interaction = {
+        "member": {"user": DISCORD_USER},
+        "data": {
+            "name": "rating",
+            "options": [{"name": "top", "options": [{"name": "type", "value": "movie"}]}],
+        },
+    }
+    if guild_id is not None:
+        interaction["guild_id"] = guild_id
+    return interaction
+
+
+def test_top_counts_members_of_the_server(app):
+    with app.app_context():
+        user = User.get_or_create_for_discord_user(DISCORD_USER)
+        Rating.import_ordered(user, "movie", ["Alien", "Heat"])
+
+        response = DiscordInteractionHandler.handle_application_command(top_interaction())
+        assert "only available in a server" in response.get_json()["data"]["content"]
+
+        # Using the bot in a server joins its rankings
+        response = DiscordInteractionHandler.handle_application_command(top_interaction("81384788765712384"))
+        assert response.get_json()["data"]["content"].splitlines()[2:] == [
+            "1. Alien: 100.0 on average from 1 rating",
+            "2. Heat: 0.0 on average from 1 rating",
+        ]
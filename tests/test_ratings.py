@@ -1,5 +1,22 @@
-from flaskr.ratings.rating_calculator import RatingCalculator, CompletedComparison
+import itertools
+import math
+import random
+
+import pytest
+from flaskr.ratings.rating_calculator import (
+    RatingCalculator,
+    CompletedComparison,
+    CompletedMultiComparison,
+    StaleComparisonException,
+)
 from flaskr.models.rating import Rating
+from flaskr.ratings.sort_session import (
+    SortSession,
+    galloping_merge,
+    insert_sorted,
+    merge_insertion_sort,
+    natural_merge_sort,
+)
 
 
 def test_get_next_comparison_empty(app):
@@ -150,3 +167,262 @@ def construct_rating(
     id: int, name: str, value: float, rating_type="artist", user_id=1
 ) -> Rating:
     return Rating(id=id, type=rating_type, name=name, value=value, user_id=user_id)
+
+
+def test_resume_rating_matches_cached_rating(app):
+    with app.app_context():
+        other_items = [
+            construct_rating(2, "b", 0.0),
+            construct_rating(3, "c", 25.0),
+            construct_rating(4, "d", 50.0),
+            construct_rating(5, "e", 75.0),
+            construct_rating(6, "f", 100.0),
+        ]
+        ratings_calculator = RatingCalculator(
+            item_being_rated=construct_rating(1, "a", None), other_items=other_items
+        )
+        nc = ratings_calculator.get_next_comparison()
+        ratings_calculator.add_comparison(CompletedComparison(nc.id, nc.index, False))
+        nc = ratings_calculator.get_next_comparison()
+        assert nc is not None
+        assert nc.name == "e"
+
+        # Resume from just the bounds the second comparison was sent with
+        resumed_calculator = RatingCalculator.resume_rating(
+            item_being_rated=construct_rating(1, "a", None),
+            other_items=other_items,
+            lowest_possible_idx=nc.lowest_possible_idx,
+            highest_possible_idx=nc.highest_possible_idx,
+            comparison=CompletedComparison(nc.id, nc.index, True),
+        )
+        ratings_calculator.add_comparison(CompletedComparison(nc.id, nc.index, True))
+
+        assert ratings_calculator.get_next_comparison() is None
+        assert resumed_calculator.get_next_comparison() is None
+        assert [r.id for r in resumed_calculator.get_overall_ratings()] == [2, 3, 4, 1, 5, 6]
+
+
+def test_rejects_stale_comparison(app):
+    with app.app_context():
+        ratings_calculator = RatingCalculator(
+            item_being_rated=construct_rating(1, "a", None),
+            other_items=[
+                construct_rating(2, "b", 0.0),
+                construct_rating(3, "c", 50.0),
+                construct_rating(4, "d", 100.0),
+            ],
+        )
+        nc = ratings_calculator.get_next_comparison()
+        ratings_calculator.add_comparison(CompletedComparison(nc.id, nc.index, True))
+
+        # Clicking the same button twice must not narrow the search again
+        with pytest.raises(StaleComparisonException):
+            ratings_calculator.add_comparison(CompletedComparison(nc.id, nc.index, True))
+        assert ratings_calculator.get_next_comparison().name == "b"
+
+
+@pytest.mark.parametrize("strategy", ["midpoint", "interpolation", "recency", "galloping"])
+def test_pivot_strategies_place_every_position(app, strategy):
+    with app.app_context():
+        other_items = [construct_rating(idx + 2, str(idx), idx * 100 / 9) for idx in range(10)]
+        for target_idx in range(11):
+            for item_value in (None, target_idx * 10.0):
+                ratings_calculator = RatingCalculator(
+                    item_being_rated=construct_rating(1, "a", item_value),
+                    other_items=other_items,
+                    strategy=strategy,
+                )
+                while (nc := ratings_calculator.get_next_comparison()) is not None:
+                    ratings_calculator.add_comparison(CompletedComparison(nc.id, nc.index, nc.index >= target_idx))
+                assert ratings_calculator.lowest_possible_idx == target_idx
+
+
+@pytest.mark.parametrize("target_idx,first_probes", [(47, [40, 41, 43, 47]), (35, [40, 39, 37, 33])])
+def test_galloping_probes_out_from_the_previous_position(app, target_idx, first_probes):
+    with app.app_context():
+        other_items = [construct_rating(idx + 2, str(idx), float(idx)) for idx in range(100)]
+        ratings_calculator = RatingCalculator(
+            item_being_rated=construct_rating(1, "a", 40.0), other_items=other_items, strategy="galloping"
+        )
+        probed = []
+        while (nc := ratings_calculator.get_next_comparison()) is not None:
+            probed.append(nc.index)
+            ratings_calculator.add_comparison(CompletedComparison(nc.id, nc.index, nc.index >= target_idx))
+        assert ratings_calculator.lowest_possible_idx == target_idx
+        assert probed[:4] == first_probes
+        # Bisecting all 100 takes 7
+        assert len(probed) < 7
+
+
+def test_galloping_bisects_new_items(app):
+    with app.app_context():
+        other_items = [construct_rating(idx + 2, str(idx), float(idx)) for idx in range(100)]
+        ratings_calculator = RatingCalculator(
+            item_being_rated=construct_rating(1, "a", None), other_items=other_items, strategy="galloping"
+        )
+        assert ratings_calculator.get_next_comparison().index == 49
+
+
+def test_resume_rating_continues_strategy(app):
+    with app.app_context():
+        other_items = [construct_rating(idx + 2, str(idx), float(idx)) for idx in range(20)]
+        ratings_calculator = RatingCalculator(
+            item_being_rated=construct_rating(1, "a", None), other_items=other_items, strategy="galloping"
+        )
+        nc = ratings_calculator.get_next_comparison()
+        ratings_calculator.add_comparison(CompletedComparison(nc.id, nc.index, True))
+        nc = ratings_calculator.get_next_comparison()
+
+        resumed_calculator = RatingCalculator.resume_rating(
+            item_being_rated=construct_rating(1, "a", None),
+            other_items=other_items,
+            lowest_possible_idx=nc.lowest_possible_idx,
+            highest_possible_idx=nc.highest_possible_idx,
+            comparison=CompletedComparison(nc.id, nc.index, True),
+            strategy=nc.strategy,
+            step=nc.step,
+        )
+        ratings_calculator.add_comparison(CompletedComparison(nc.id, nc.index, True))
+        assert resumed_calculator.get_next_comparison().index == ratings_calculator.get_next_comparison().index
+
+
+def test_simulate_pivots_command(app, runner):
+    # The flask command pushes the app context
+    with app.app_context():
+        result = runner.invoke(
+            args=["simulate-pivots", "--distribution", "top", "--size", "50", "--trials", "200", "--seed", "1"]
+        )
+    lines = result.output.splitlines()
+    assert lines[0] == "200 inserts, top distribution"
+    assert [line.split()[0] for line in lines[1:]] == ["midpoint", "interpolation", "galloping"]
+
+
+def test_retired_pivot_strategies_cannot_be_selected(app):
+    app.config["RATING_PIVOT_STRATEGY"] = "recency"
+    with app.app_context():
+        with pytest.raises(ValueError):
+            RatingCalculator.begin_rating(
+                item_being_rated=construct_rating(1, "a", None), other_items=[], use_cache=False
+            )
+
+
+@pytest.mark.parametrize("width", [2, 4, 24])
+def test_multi_comparisons_place_every_position(app, width):
+    with app.app_context():
+        other_items = [construct_rating(idx + 2, str(idx), float(idx)) for idx in range(100)]
+        for target_idx in range(101):
+            ratings_calculator = RatingCalculator(
+                item_being_rated=construct_rating(1, "a", None), other_items=other_items, width=width
+            )
+            answers = 0
+            while (nc := ratings_calculator.get_next_comparison()) is not None:
+                assert len(nc.pivots) <= width
+                gap = sum(1 for p in nc.pivots if p.index < target_idx)
+                ratings_calculator.add_comparison(
+                    CompletedMultiComparison(gap, nc.lowest_possible_idx, nc.highest_possible_idx)
+                )
+                answers += 1
+            assert ratings_calculator.lowest_possible_idx == target_idx
+            assert answers <= math.ceil(math.log(101, width + 1))
+
+
+def test_multi_comparison_survives_cache_round_trip(app):
+    with app.app_context():
+        other_items = [construct_rating(idx + 2, str(idx), float(idx)) for idx in range(30)]
+        ratings_calculator = RatingCalculator(
+            item_being_rated=construct_rating(1, "a", None), other_items=other_items, width=3
+        )
+        nc = ratings_calculator.get_next_comparison()
+        assert [p["index"] for p in nc.to_json()["pivots"]] == [p.index for p in nc.pivots]
+        ratings_calculator.add_comparison(CompletedMultiComparison(2, nc.lowest_possible_idx, nc.highest_possible_idx))
+
+        restored = RatingCalculator.create_from_json(ratings_calculator.to_json())
+        assert [p.index for p in restored.get_next_comparison().pivots] == [
+            p.index for p in ratings_calculator.get_next_comparison().pivots
+        ]
+        # Answering the first comparison again is stale
+        with pytest.raises(StaleComparisonException):
+            restored.add_comparison(CompletedMultiComparison(2, nc.lowest_possible_idx, nc.highest_possible_idx))
+
+
+def counting_less(asked: set):
+    """Compares ids by value, recording each distinct pair compared the way a
+    sort session only asks about each pair once."""
+
+    def less(first: int, second: int) -> bool:
+        asked.add((min(first, second), max(first, second)))
+        return first < second
+
+    return less
+
+
+# The most comparisons merge insertion needs for each size, which is the
+# information theoretic minimum up to 11 items
+@pytest.mark.parametrize("size,worst_case", [(1, 0), (2, 1), (3, 3), (5, 7), (8, 16), (11, 26), (12, 30)])
+def test_merge_insertion_sort_comparisons(size, worst_case):
+    rng = random.Random(size)
+    for _ in range(200):
+        items = rng.sample(range(100), size)
+        asked: set = set()
+        assert merge_insertion_sort(items, counting_less(asked)) == sorted(items)
+        assert len(asked) <= worst_case
+
+
+def test_insert_sorted_merges_into_existing():
+    existing = list(range(0, 100, 2))
+    new_items = [-1, 1, 51, 99, 101]
+    asked: set = set()
+    assert insert_sorted(existing, new_items, counting_less(asked)) == sorted(existing + new_items)
+    # Never more than a binary search for each item
+    assert len(asked) <= len(new_items) * math.ceil(math.log2(len(existing) + 1))
+
+
+def test_sort_session_replays_answers(app):
+    with app.app_context():
+        sort_session = SortSession("abc", 1, "artist", {}, [10, 30], [40, 20])
+        while (comparison := sort_session.get_next_comparison()) is not None:
+            with pytest.raises(StaleComparisonException):
+                sort_session.add_answer(*reversed(comparison), comparison[0])
+            sort_session.add_answer(*comparison, max(comparison))
+            sort_session = SortSession.create_from_json(sort_session.to_json())
+        assert sort_session.get_final_order() == [10, 20, 30, 40]
+
+
+def test_natural_merge_sort_sorts_every_order():
+    for items in itertools.permutations(range(6)):
+        assert natural_merge_sort(list(items), counting_less(set())) == sorted(items)
+
+
+@pytest.mark.parametrize(
+    "moves,max_comparisons",
+    [
+        # Only checking each neighbour
+        ([], 199),
+        ([(150, 20)], 220),
+        ([(10, 180), (120, 40), (60, 61)], 260),
+    ],
+)
+def test_natural_merge_sort_uses_existing_order(moves, max_comparisons):
+    items = list(range(200))
+    for (from_idx, to_idx) in moves:
+        items.insert(to_idx, items.pop(from_idx))
+    asked: set = set()
+    assert natural_merge_sort(items, counting_less(asked)) == sorted(items)
+    assert len(asked) <= max_comparisons
+
+
+def test_natural_merge_sort_of_shuffled_items_costs_about_a_merge_sort():
+    for seed in range(10):
+        items = list(range(200))
+        random.Random(seed).shuffle(items)
+        asked: set = set()
+        assert natural_merge_sort(items, counting_less(asked)) == sorted(items)
+        # A plain merge sort takes about 1280
+        assert len(asked) <= 1400
+
+
+def test_galloping_merge_of_alternating_lists_costs_no_more_than_a_plain_merge():
+    asked: set = set()
+    merged = galloping_merge(list(range(0, 200, 2)), list(range(1, 200, 2)), counting_less(asked))
+    assert merged == list(range(200))
+    assert len(asked) <= 199
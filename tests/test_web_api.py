@@ -0,0 +1,280 @@
+import json
+
+from flaskr.models.aggregate import RatingAggregate
+from flaskr.models.rating import Rating
+from flaskr.models.user import User
+
+
+def create_ratings(app, count: int) -> list:
+    with app.app_context():
+        user = User.create_user("api-user")
+        for idx in range(count):
+            Rating.create_rating(user, f"item {idx}", "artist", float(idx // 2))
+        return [r.name for r in reversed(user.get_ratings(rating_type="artist"))]
+
+
+def test_get_all_ratings(app, client):
+    expected = create_ratings(app, 5)
+    response = client.get("/api/ratings?username=api-user&rating_type=artist")
+    assert [r["name"] for r in response.get_json()["ratings"]] == expected
+
+
+def test_rank_key_is_only_returned_when_asked_for(app, client):
+    create_ratings(app, 2)
+    response = client.get("/api/ratings?username=api-user&rating_type=artist")
+    assert set(response.get_json()["ratings"][0]) == {"id", "name", "type", "value", "user_id"}
+
+    response = client.get("/api/ratings?username=api-user&rating_type=artist&fields=name,rank_key")
+    assert response.get_json()["ratings"][0] == {"name": "item 1", "rank_key": None}
+
+
+def test_get_ratings_by_page(app, client):
+    expected = create_ratings(app, 25)
+    names = []
+    cursor = ""
+    while True:
+        response = client.get(f"/api/ratings?username=api-user&rating_type=artist&limit=10&fields=name&cursor={cursor}")
+        body = response.get_json()
+        assert all(list(r) == ["name"] for r in body["ratings"])
+        names.extend(r["name"] for r in body["ratings"])
+        if body["next_cursor"] is None:
+            break
+        cursor = body["next_cursor"]
+    assert names == expected
+
+
+def test_get_ratings_by_page_with_non_integral_values(app, client):
+    with app.app_context():
+        user = User.create_user("api-user")
+        for idx in range(10):
+            Rating.create_rating(user, f"item {idx}", "artist", round(idx * 100 / 9, 2))
+        expected = [r.name for r in reversed(user.get_ratings(rating_type="artist"))]
+
+    names = []
+    cursor = ""
+    while True:
+        response = client.get(f"/api/ratings?username=api-user&rating_type=artist&limit=3&fields=name&cursor={cursor}")
+        body = response.get_json()
+        names.extend(r["name"] for r in body["ratings"])
+        if body["next_cursor"] is None:
+            break
+        cursor = body["next_cursor"]
+    assert names == expected
+
+
+def test_stream_ratings(app, client):
+    app.config.update(API_STREAM_ITERSIZE=4)
+    expected = create_ratings(app, 25)
+    response = client.get("/api/ratings?username=api-user&rating_type=artist&format=ndjson&fields=id,name")
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [r["name"] for r in lines] == expected
+
+
+def test_invalid_queries(app, client):
+    create_ratings(app, 1)
+    for query in ["fields=name,password", "limit=0", "limit=abc", "cursor=not-a-cursor"]:
+        response = client.get(f"/api/ratings?username=api-user&rating_type=artist&{query}")
+        assert response.status_code == 400, query
+
+
+def test_stream_ratings_rank_key_mode(app, client):
+    app.config.update(RATING_STORAGE_MODE="rank_key")
+    with app.app_context():
+        user = User.create_user("api-user")
+        ratings = [Rating.create_rating(user, f"item {idx}", "artist") for idx in range(5)]
+        for lower, rating in zip([None] + ratings, ratings):
+            Rating.place_between(user, rating, lower, None)
+        expected = [[r.name, r.value] for r in reversed(user.get_ratings(rating_type="artist"))]
+
+    response = client.get("/api/ratings?username=api-user&rating_type=artist&format=ndjson&fields=name,value")
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [[r["name"], r["value"]] for r in lines] == expected
+
+
+def test_import_ratings(app, client):
+    with app.app_context():
+        User.create_user("api-user")
+    response = client.post(
+        "/api/ratings/import",
+        json={"username": "api-user", "rating_type": "artist", "ratings": ["a", {"name": "b"}, "c"]},
+    )
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 3
+
+    response = client.post(
+        "/api/ratings/import?username=api-user&rating_type=artist&replace=true",
+        data="id,name\n7,x\n8,c\n",
+        content_type="text/csv",
+    )
+    assert response.get_json()["imported"] == 2
+    response = client.get("/api/ratings?username=api-user&rating_type=artist&fields=name,value")
+    assert response.get_json()["ratings"] == [{"name": "x", "value": 100.0}, {"name": "c", "value": 0.0}]
+
+
+def test_import_ratings_rejects_duplicates(app, client):
+    with app.app_context():
+        User.create_user("api-user")
+    response = client.post(
+        "/api/ratings/import",
+        json={"username": "api-user", "rating_type": "artist", "ratings": ["a", "A"]},
+    )
+    assert response.status_code == 400
+
+
+def test_import_ratings_requires_an_object(app, client):
+    with app.app_context():
+        User.create_user("api-user")
+    response = client.post("/api/ratings/import", json=["a", "b"])
+    assert response.status_code == 400
+
+
+def test_import_ratings_command(app, runner, tmp_path):
+    with app.app_context():
+        User.create_user("api-user")
+    path = tmp_path / "ratings.json"
+    path.write_text(json.dumps(["a", "b"]))
+    # The flask command pushes the app context
+    with app.app_context():
+        result = runner.invoke(args=["import-ratings", str(path), "--username", "api-user", "--type", "artist"])
+    assert "Imported 2 ratings" in result.output
+    with app.app_context():
+        user = User.get_by_username("api-user")
+        assert [r.name for r in user.get_ratings(rating_type="artist")] == ["b", "a"]
+
+
+def test_export_ratings(app, client):
+    app.config.update(API_STREAM_ITERSIZE=3)
+    expected = create_ratings(app, 10)
+    with app.app_context():
+        other = User.create_user("other-user")
+        Rating.create_rating(other, "other item", "artist", 1.0)
+
+    response = client.get("/api/export?format=ndjson")
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [r["name"] for r in rows] == expected + ["other item"]
+    assert rows[-1]["username"] == "other-user"
+
+    response = client.get("/api/export?username=api-user&rating_type=artist&format=csv")
+    assert response.mimetype == "text/csv"
+    # A user's export of a type imports back into the same order
+    response = client.post(
+        "/api/ratings/import?username=other-user&rating_type=artist&replace=1",
+        data=response.get_data(),
+        content_type="text/csv",
+    )
+    assert response.get_json()["imported"] == 10
+    response = client.get("/api/ratings?username=other-user&rating_type=artist&fields=name")
+    assert [r["name"] for r in response.get_json()["ratings"]] == expected
+
+
+def test_export_ratings_command(app, runner):
+    expected = create_ratings(app, 4)
+    with app.app_context():
+        result = runner.invoke(args=["export-ratings", "--username", "api-user", "--format", "ndjson"])
+    assert [json.loads(line)["name"] for line in result.output.splitlines()] == expected
+
+    with app.app_context():
+        result = runner.invoke(args=["export-ratings", "--type", "song"])
+    assert result.output.splitlines() == ["username,type,name,value,rank_key,id,user_id"]
+
+
+def test_create_ratings_batch(app, client):
+    with app.app_context():
+        user = User.create_user("api-user")
+        for idx, name in enumerate(["b", "d"]):
+            Rating.create_rating(user, name, "artist", idx * 100.0)
+    rank = {name: idx for (idx, name) in enumerate("abcde")}
+
+    response = client.post(
+        "/api/ratings/batch", json={"username": "api-user", "rating_type": "artist", "rating_names": ["e", "a", "c"]}
+    )
+    content = response.get_json()
+    stale = None
+    while "next_comparison" in content:
+        comparison = content["next_comparison"]
+        (preferred_id, _) = sorted(
+            zip(comparison["ids"], comparison["names"]), key=lambda pair: rank[pair[1]], reverse=True
+        )[0]
+        stale = {
+            "username": "api-user",
+            "session_id": content["session_id"],
+            "comparison": comparison,
+            "preferred_id": preferred_id,
+        }
+        content = client.put("/api/ratings/batch/compare", json=stale).get_json()
+
+    assert [r["name"] for r in content["new_ratings"]] == list("abcde")
+    assert [r["value"] for r in content["new_ratings"]] == [0.0, 25.0, 50.0, 75.0, 100.0]
+    # The session is gone once its order is saved
+    assert client.put("/api/ratings/batch/compare", json=stale).status_code == 404
+
+
+def test_create_ratings_batch_rejects_duplicates(app, client):
+    with app.app_context():
+        User.create_user("api-user")
+    response = client.post(
+        "/api/ratings/batch", json={"username": "api-user", "rating_type": "artist", "rating_names": ["a", "A"]}
+    )
+    assert response.status_code == 400
+
+
+def test_rerank_ratings(app, client):
+    names = create_ratings(app, 6)
+    response = client.post("/api/ratings/rerank", json={"username": "api-user", "rating_type": "artist"})
+    content = response.get_json()
+    # The highest rated is now liked least
+    rank = {name: idx for (idx, name) in enumerate([names[0]] + list(reversed(names[1:])))}
+    clicks = 0
+    while "next_comparison" in content:
+        comparison = content["next_comparison"]
+        (preferred_id, _) = max(zip(comparison["ids"], comparison["names"]), key=lambda pair: rank[pair[1]])
+        content = client.put(
+            "/api/ratings/rerank/compare",
+            json={
+                "username": "api-user",
+                "session_id": content["session_id"],
+                "comparison": comparison,
+                "preferred_id": preferred_id,
+            },
+        ).get_json()
+        clicks += 1
+
+    assert [r["name"] for r in content["new_ratings"]] == [names[0]] + list(reversed(names[1:]))
+    # Checking each neighbour, then galloping to find where the moved one goes
+    assert clicks <= 8
+
+
+def test_rerank_rejects_bad_window(app, client):
+    create_ratings(app, 2)
+    response = client.post(
+        "/api/ratings/rerank", json={"username": "api-user", "rating_type": "artist", "from": 2, "to": 1}
+    )
+    assert response.status_code == 400
+
+
+def test_get_aggregate(app, client, runner):
+    with app.app_context():
+        for (username, names) in (("alice", ["Alien", "Heat", "Jaws"]), ("bob", ["Heat", "Alien"])):
+            user = User.create_user(username)
+            RatingAggregate.join_guild(42, user)
+            Rating.import_ordered(user, "movie", names)
+
+    response = client.get("/api/aggregate?guild_id=42&rating_type=movie&limit=2")
+    # Ties are broken by name
+    assert [(a["name"], a["rating_count"], a["borda_score"]) for a in response.get_json()["aggregates"]] == [
+        ("Alien", 2, 2),
+        ("Heat", 2, 2),
+    ]
+    response = client.get("/api/aggregate?guild_id=42&rating_type=movie&sort=mean")
+    assert [(a["name"], a["mean_percentile"]) for a in response.get_json()["aggregates"]] == [
+        ("Heat", 75.0),
+        ("Alien", 50.0),
+        ("Jaws", 0.0),
+    ]
+    assert client.get("/api/aggregate?rating_type=movie").status_code == 400
+
+    with app.app_context():
+        result = runner.invoke(args=["rebuild-aggregates"])
+    assert "Rebuilt 3 aggregate rankings." in result.output
+    assert client.get("/api/aggregate?guild_id=42&rating_type=movie&sort=mean").get_json() == response.get_json()